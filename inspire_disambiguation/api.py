@@ -25,22 +25,28 @@
 from __future__ import absolute_import, division, print_function
 
 import json
+import os
 from collections import defaultdict
 
+import numpy as np
 import six
 from flask import current_app
 
-from .core.db.readers import (
-    get_all_curated_signatures,
-    get_all_publications,
-)
+from .core.ml.assignments import AssignmentWriter, diff_assignments, iter_author_assignments
+from .core.ml.blocking import build_block_index
+from .core.ml.checkpoints import BlockCheckpoints
 from .core.ml.models import (
+    CASCADE_FEATURES,
     Clusterer,
     DistanceEstimator,
     EthnicityEstimator,
+    load_signatures,
 )
-from .core.ml.sampling import sample_signature_pairs
-from .utils import open_file_in_folder
+from .core.ml.publications import build_publications_index, save_publications_index
+from .core.ml.sampling import sample_signature_pairs, sample_signature_pairs_parallel, save_sampled_pairs_index
+from .core.ml.tuning import sweep_thresholds
+from .instrumentation import run_report
+from .utils import hash_file, open_file_in_folder
 
 
 def save_curated_signatures_and_input_clusters():
@@ -51,30 +57,59 @@ def save_curated_signatures_and_input_clusters():
     initially present in INSPIRE, while the latter contains one line per each
     curated signature that will be used as ground truth by ``BEARD``.
     """
+    # The DB readers pull in SQLAlchemy and the Invenio models, which only
+    # the export stages need.
+    from .core.db.readers import get_all_curated_signatures
+
     signatures_with_author = defaultdict(list)
     signatures_without_author = []
 
-    with open_file_in_folder(current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'], 'w') as fd:
-        for signature in get_all_curated_signatures():
-            if signature.get('author_id'):
-                signatures_with_author[signature['author_id']].append(signature['signature_uuid'])
-                fd.write(json.dumps(signature) + '\n')
-            else:
-                signatures_without_author.append(signature['signature_uuid'])
-
-    with open_file_in_folder(current_app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH'], 'w') as fd:
-        for cluster_id, (author_id, signature_uuids) in enumerate(six.iteritems(signatures_with_author)):
-            fd.write(json.dumps({
-                'author_id': author_id,
-                'cluster_id': cluster_id,
-                'signature_uuids': signature_uuids,
-            }) + '\n')
-        for cluster_id, signature_uuid in enumerate(signatures_without_author, cluster_id + 1):
-            fd.write(json.dumps({
-                'author_id': None,
-                'cluster_id': cluster_id,
-                'signature_uuids': [signature_uuid],
-            }) + '\n')
+    with _run_report('save_curated_signatures_and_input_clusters') as report:
+        with report.stage('export_curated_signatures') as stage, \
+                open_file_in_folder(current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'], 'w') as fd:
+            for signature, line in get_all_curated_signatures(serialize=True, **_export_options()):
+                stage.count(what='signatures')
+                if signature.get('author_id'):
+                    signatures_with_author[signature['author_id']].append(signature['signature_uuid'])
+                    fd.write(line)
+                else:
+                    signatures_without_author.append(signature['signature_uuid'])
+
+        with report.stage('save_input_clusters') as stage, \
+                open_file_in_folder(current_app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH'], 'w') as fd:
+            for cluster_id, (author_id, signature_uuids) in enumerate(six.iteritems(signatures_with_author)):
+                fd.write(json.dumps({
+                    'author_id': author_id,
+                    'cluster_id': cluster_id,
+                    'signature_uuids': signature_uuids,
+                }) + '\n')
+                stage.count(what='clusters')
+            for cluster_id, signature_uuid in enumerate(signatures_without_author, cluster_id + 1):
+                fd.write(json.dumps({
+                    'author_id': None,
+                    'cluster_id': cluster_id,
+                    'signature_uuids': [signature_uuid],
+                }) + '\n')
+                stage.count(what='clusters')
+
+
+def save_uncurated_signatures():
+    """Save uncurated signatures to disk.
+
+    Saves a file to disk called (by default) ``uncurated_signatures.jsonl``,
+    which contains one line per each signature not curated in INSPIRE. With
+    ``DISAMBIGUATION_CLUSTERING_UNCURATED``, they are clustered with the
+    curated signatures, so that they can be assigned to an author, see
+    :func:`write_back_clustering_assignments`.
+    """
+    from .core.db.readers import get_all_uncurated_signatures
+
+    with _run_report('save_uncurated_signatures') as report, \
+            report.stage('export_uncurated_signatures') as stage, \
+            open_file_in_folder(current_app.config['DISAMBIGUATION_UNCURATED_SIGNATURES_PATH'], 'w') as fd:
+        for _, line in get_all_uncurated_signatures(serialize=True, **_export_options()):
+            fd.write(line)
+            stage.count(what='signatures')
 
 
 def save_sampled_pairs():
@@ -82,14 +117,29 @@ def save_sampled_pairs():
 
     Save a file to disk called (by default) ``sampled_pairs.jsonl``, which
     contains one line per each pair of signatures sampled from INSPIRE that
-    will be used by ``BEARD`` during training.
+    will be used by ``BEARD`` during training. With
+    ``DISAMBIGUATION_SAMPLED_PAIRS_BINARY``, the pairs are saved to
+    ``sampled_pairs.npz`` instead, see
+    :func:`~inspire_disambiguation.core.ml.sampling.save_sampled_pairs_index`.
+    With ``DISAMBIGUATION_SAMPLED_PAIRS_SEED``, pairs are sampled
+    reproducibly on several processes, see
+    :func:`~inspire_disambiguation.core.ml.sampling.sample_signature_pairs_parallel`.
     """
-    with open_file_in_folder(current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_PATH'], 'w') as fd:
-        signatures_path = current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH']
-        clusters_path = current_app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH']
-        pairs_size = current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_SIZE']
-        for pair in sample_signature_pairs(signatures_path, clusters_path, pairs_size):
-            fd.write(json.dumps(pair) + '\n')
+    signatures_path = current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH']
+    clusters_path = current_app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH']
+    pairs_size = current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_SIZE']
+
+    with _run_report('save_sampled_pairs') as report, \
+            report.stage('sample_signature_pairs') as stage:
+        if current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_BINARY']:
+            pairs = _sample_signature_pairs(signatures_path, clusters_path, pairs_size, signature_rows=True)
+            stage.count(save_sampled_pairs_index(_sampled_pairs_path(), signatures_path, pairs), what='pairs')
+            return
+
+        with open_file_in_folder(_sampled_pairs_path(), 'w') as fd:
+            for pair in _sample_signature_pairs(signatures_path, clusters_path, pairs_size):
+                fd.write(json.dumps(pair) + '\n')
+                stage.count(what='pairs')
 
 
 def save_publications():
@@ -97,51 +147,811 @@ def save_publications():
 
     Saves a file to disk called (by default) ``publications.jsonl``, which
     contains one line per record in INSPIRE with information that will be
-    useful for ``BEARD`` during training and prediction.
+    useful for ``BEARD`` during training and prediction, and its offset
+    index ``publications_index.npz``, see
+    :func:`~inspire_disambiguation.core.ml.publications.save_publications_index`.
+    """
+    from .core.db.readers import get_all_publications
+
+    publications_path = current_app.config['DISAMBIGUATION_PUBLICATIONS_PATH']
+    publication_ids, lengths = [], []
+    with _run_report('save_publications') as report:
+        with report.stage('export_publications') as stage, open_file_in_folder(publications_path, 'w') as fd:
+            for publication, line in get_all_publications(serialize=True, **_export_options()):
+                fd.write(line)
+                publication_ids.append(publication['publication_id'])
+                lengths.append(len(line.encode('utf-8')))
+                stage.count(what='publications')
+        with report.stage('save_publications_index'):
+            save_publications_index(
+                current_app.config['DISAMBIGUATION_PUBLICATIONS_INDEX_PATH'], publications_path,
+                publication_ids, lengths)
+
+
+def index_publications():
+    """Build the offset index of an existing ``publications.jsonl``.
+
+    Returns:
+        int: the number of indexed publications.
+
     """
-    with open_file_in_folder(current_app.config['DISAMBIGUATION_PUBLICATIONS_PATH'], 'w') as fd:
-        for publication in get_all_publications():
-            fd.write(json.dumps(publication) + '\n')
+    with _run_report('index_publications') as report, \
+            report.stage('build_publications_index') as stage:
+        count = build_publications_index(
+            current_app.config['DISAMBIGUATION_PUBLICATIONS_INDEX_PATH'],
+            current_app.config['DISAMBIGUATION_PUBLICATIONS_PATH'],
+        )
+        stage.count(count, what='publications')
+    return count
+
+
+def index_signature_blocks():
+    """Block the exported signatures and save their block index.
+
+    The uncurated signatures are blocked with the curated ones if
+    ``DISAMBIGUATION_CLUSTERING_UNCURATED`` is set, see
+    :func:`~inspire_disambiguation.core.ml.blocking.save_block_index`.
+
+    Returns:
+        int: the number of blocks.
+
+    """
+    with _run_report('index_signature_blocks') as report, \
+            report.stage('build_block_index') as stage:
+        count = build_block_index(
+            current_app.config['DISAMBIGUATION_SIGNATURE_BLOCKS_PATH'],
+            current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'],
+            _uncurated_signatures_path(),
+        )
+        stage.count(count, what='blocks')
+    return count
 
 
 def train_and_save_ethnicity_model():
-    """Train the ethnicity estimator model and save it to disk."""
-    estimator = EthnicityEstimator()
-    estimator.load_data(current_app.config['DISAMBIGUATION_ETHNICITY_DATA_PATH'])
-    estimator.fit()
-    estimator.save_model(current_app.config['DISAMBIGUATION_ETHNICITY_MODEL_PATH'])
+    """Train the ethnicity estimator model and save it to disk.
+
+    With ``DISAMBIGUATION_ETHNICITY_STREAMING`` the data is not loaded in
+    memory but streamed, see
+    :meth:`~inspire_disambiguation.core.ml.models.EthnicityEstimator.fit_streaming`.
+    """
+    with _run_report('train_and_save_ethnicity_model') as report:
+        estimator = EthnicityEstimator()
+        if current_app.config['DISAMBIGUATION_ETHNICITY_STREAMING']:
+            with report.stage('fit_streaming'):
+                estimator.fit_streaming(
+                    current_app.config['DISAMBIGUATION_ETHNICITY_DATA_PATH'],
+                    chunk_size=current_app.config['DISAMBIGUATION_ETHNICITY_CHUNK_SIZE'],
+                    n_epochs=current_app.config['DISAMBIGUATION_ETHNICITY_EPOCHS'],
+                )
+        else:
+            with report.stage('load_data') as stage:
+                estimator.load_data(current_app.config['DISAMBIGUATION_ETHNICITY_DATA_PATH'])
+                stage.count(len(estimator.X), what='names')
+            with report.stage('fit') as stage:
+                estimator.fit()
+                stage.count(len(estimator.X), what='names')
+        with report.stage('save_model'):
+            estimator.save_model(current_app.config['DISAMBIGUATION_ETHNICITY_MODEL_PATH'])
+
+
+def compare_ethnicity_training():
+    """Compare the accuracy of the two ways of training the ethnicity model.
+
+    Both models are trained on the same rows of ``ethnicity.csv`` and scored
+    on the rows held out by ``DISAMBIGUATION_ETHNICITY_HOLDOUT_EVERY``. The
+    streaming model is trained first, so that the peak memory of its stage
+    in the run report is not hidden by the one of the in-memory training.
+
+    Returns:
+        dict: for ``streaming`` and ``in_memory``, the ``accuracy`` on the
+        held out rows, the training time in ``seconds`` and the peak memory
+        of the process at the end of the training in ``peak_rss_bytes``.
+
+    """
+    input_filename = current_app.config['DISAMBIGUATION_ETHNICITY_DATA_PATH']
+    chunk_size = current_app.config['DISAMBIGUATION_ETHNICITY_CHUNK_SIZE']
+    holdout_every = current_app.config['DISAMBIGUATION_ETHNICITY_HOLDOUT_EVERY']
+
+    comparison = {}
+    with _run_report('compare_ethnicity_training') as report:
+        estimator = EthnicityEstimator()
+        with report.stage('fit_streaming') as stage:
+            estimator.fit_streaming(
+                input_filename,
+                chunk_size=chunk_size,
+                n_epochs=current_app.config['DISAMBIGUATION_ETHNICITY_EPOCHS'],
+                holdout_every=holdout_every,
+            )
+        comparison['streaming'] = {
+            'accuracy': estimator.score_streaming(input_filename, chunk_size, holdout_every),
+            'seconds': stage.seconds,
+            'peak_rss_bytes': stage.peak_rss,
+        }
+
+        estimator = EthnicityEstimator()
+        with report.stage('fit_in_memory') as stage:
+            estimator.load_data(input_filename, holdout_every=holdout_every)
+            estimator.fit()
+            stage.count(len(estimator.X), what='names')
+        del estimator.X, estimator.y
+        comparison['in_memory'] = {
+            'accuracy': estimator.score_streaming(input_filename, chunk_size, holdout_every),
+            'seconds': stage.seconds,
+            'peak_rss_bytes': stage.peak_rss,
+        }
+
+    return comparison
 
 
 def train_and_save_distance_model():
-    """Train the distance estimator model and save it to disk."""
+    """Train the distance estimator model and save it to disk.
+
+    With ``DISAMBIGUATION_DISTANCE_WARM_START`` and an existing model, the
+    model is not trained from scratch but its forest is grown on the sampled
+    pairs, see
+    :meth:`~inspire_disambiguation.core.ml.models.DistanceEstimator.fit_warm_start`.
+
+    With ``DISAMBIGUATION_DISTANCE_CASCADE``, the cheap model of the cascade
+    is then trained from scratch on the same pairs.
+
+    The pairs of the authors held out by ``DISAMBIGUATION_DISTANCE_HOLDOUT_EVERY``
+    are never trained on, see :func:`compare_distance_retraining`.
+    """
+    model_path = current_app.config['DISAMBIGUATION_DISTANCE_MODEL_PATH']
+    warm_start = current_app.config['DISAMBIGUATION_DISTANCE_WARM_START'] and os.path.exists(model_path)
+
+    with _run_report('train_and_save_distance_model') as report:
+        features = current_app.config['DISAMBIGUATION_DISTANCE_FEATURES']
+        ethnicity_estimator = EthnicityEstimator()
+        if not warm_start and (features is None or 'author_ethnicity' in features):
+            with report.stage('load_ethnicity_model'):
+                ethnicity_estimator.load_model(current_app.config['DISAMBIGUATION_ETHNICITY_MODEL_PATH'])
+
+        distance_estimator = DistanceEstimator(ethnicity_estimator, features=features)
+        if warm_start:
+            with report.stage('load_model'):
+                distance_estimator.load_model(model_path)
+        with report.stage('load_data') as stage:
+            _load_distance_data(distance_estimator)
+            held_out = distance_estimator.held_out(current_app.config['DISAMBIGUATION_DISTANCE_HOLDOUT_EVERY'])
+            distance_estimator.X, distance_estimator.y = distance_estimator.X[~held_out], distance_estimator.y[~held_out]
+            stage.count(len(distance_estimator.X), what='pairs')
+        with report.stage('fit_warm_start' if warm_start else 'fit') as stage:
+            if warm_start:
+                distance_estimator.fit_warm_start(**_warm_start_options())
+            else:
+                distance_estimator.fit(**_distance_fit_options())
+            stage.count(len(distance_estimator.X), what='pairs')
+        with report.stage('save_model'):
+            distance_estimator.save_model(model_path)
+
+        if current_app.config['DISAMBIGUATION_DISTANCE_CASCADE']:
+            cascade = DistanceEstimator(ethnicity_estimator, features=CASCADE_FEATURES)
+            cascade.X, cascade.y = distance_estimator.X, distance_estimator.y
+            with report.stage('fit_cascade') as stage:
+                cascade.fit(
+                    n_estimators=current_app.config['DISAMBIGUATION_DISTANCE_CASCADE_TREES'],
+                    **_distance_fit_options()
+                )
+                stage.count(len(cascade.X), what='pairs')
+            with report.stage('save_cascade_model'):
+                cascade.save_model(current_app.config['DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH'])
+
+
+def compare_distance_retraining():
+    """Compare retraining the distance model from scratch and by warm start.
+
+    Both are trained on the sampled pairs except the ones of the authors
+    held out by ``DISAMBIGUATION_DISTANCE_HOLDOUT_EVERY``, the warm start
+    growing a copy of the current model, and scored on the held out pairs
+    together with the current model. As the held out authors are kept out of
+    every training, none of the models saw these pairs, see
+    :meth:`~inspire_disambiguation.core.ml.models.DistanceEstimator.held_out`.
+
+    Raises:
+        ValueError: if ``DISAMBIGUATION_DISTANCE_HOLDOUT_EVERY`` is not set.
+
+    Returns:
+        dict: for ``current``, ``full`` and ``warm_start``, the ``accuracy``
+        and ``roc_auc`` on the held out pairs, and for the last two the
+        training time in ``seconds``.
+
+    """
+    holdout_every = current_app.config['DISAMBIGUATION_DISTANCE_HOLDOUT_EVERY']
+    if not holdout_every:
+        raise ValueError('DISAMBIGUATION_DISTANCE_HOLDOUT_EVERY is not set, no pair is held out')
+
+    model_path = current_app.config['DISAMBIGUATION_DISTANCE_MODEL_PATH']
+    comparison = {}
+    with _run_report('compare_distance_retraining') as report:
+        ethnicity_estimator = EthnicityEstimator()
+        ethnicity_estimator.load_model(current_app.config['DISAMBIGUATION_ETHNICITY_MODEL_PATH'])
+
+        current = DistanceEstimator(ethnicity_estimator)
+        current.load_model(model_path)
+        with report.stage('load_data') as stage:
+            _load_distance_data(current)
+            stage.count(len(current.X), what='pairs')
+        held_out = current.held_out(holdout_every)
+        X_test, y_test = current.X[held_out], current.y[held_out]
+        comparison['current'] = current.score(X_test, y_test)
+
+        # fitting grows the forest in place, so warm start a copy
+        warm = DistanceEstimator(ethnicity_estimator)
+        warm.load_model(model_path)
+        warm.X, warm.y = current.X[~held_out], current.y[~held_out]
+        with report.stage('fit_warm_start') as stage:
+            warm.fit_warm_start(**_warm_start_options())
+            stage.count(len(warm.X), what='pairs')
+        comparison['warm_start'] = dict(warm.score(X_test, y_test), seconds=stage.seconds)
+
+        full = DistanceEstimator(ethnicity_estimator, features=current_app.config['DISAMBIGUATION_DISTANCE_FEATURES'])
+        full.X, full.y = warm.X, warm.y
+        with report.stage('fit') as stage:
+            full.fit(**_distance_fit_options())
+            stage.count(len(full.X), what='pairs')
+        comparison['full'] = dict(full.score(X_test, y_test), seconds=stage.seconds)
+
+    return comparison
+
+
+def profile_distance_model(max_pairs=None):
+    """Profile the cost and the usefulness of each feature of the distance model.
+
+    Args:
+        max_pairs(int): time the features on at most this many sampled pairs.
+
+    Returns:
+        list: see :meth:`~inspire_disambiguation.core.ml.models.DistanceEstimator.profile`.
+
+    """
     ethnicity_estimator = EthnicityEstimator()
     ethnicity_estimator.load_model(current_app.config['DISAMBIGUATION_ETHNICITY_MODEL_PATH'])
 
     distance_estimator = DistanceEstimator(ethnicity_estimator)
-    distance_estimator.load_data(
-        current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'],
-        current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_PATH'],
-        current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_SIZE'],
-        current_app.config['DISAMBIGUATION_PUBLICATIONS_PATH'],
-    )
-    distance_estimator.fit()
-    distance_estimator.save_model(current_app.config['DISAMBIGUATION_DISTANCE_MODEL_PATH'])
+    distance_estimator.load_model(current_app.config['DISAMBIGUATION_DISTANCE_MODEL_PATH'])
+    _load_distance_data(distance_estimator)
+    return distance_estimator.profile(distance_estimator.X[:max_pairs])
 
 
 def train_and_save_clustering_model():
-    """Train the clustering model and save it to disk."""
+    """Train the clustering model and save it to disk.
+
+    With ``DISAMBIGUATION_CLUSTERING_CHECKPOINTS``, every block is
+    checkpointed as soon as it is fitted in the folder configured by
+    ``DISAMBIGUATION_CLUSTERING_CHECKPOINTS_PATH``, so that running this
+    again after a crash only fits the remaining blocks. The checkpoints are
+    kept between runs, so that a later run with the same distance model only
+    fits the blocks whose signatures changed.
+
+    The cluster of every signature is written to
+    ``DISAMBIGUATION_CLUSTERING_ASSIGNMENTS_PATH`` as soon as its block is
+    fitted, see :class:`~inspire_disambiguation.core.ml.assignments.AssignmentWriter`.
+
+    The result is then compared with the curated clusters, and the B3 scores
+    with the worst blocks are saved to
+    ``DISAMBIGUATION_CLUSTERING_EVALUATION_PATH``.
+    """
+    with _run_report('train_and_save_clustering_model') as report:
+        clusterer = _load_clusterer(report)
+        checkpoints = _get_clustering_checkpoints(clusterer)
+        with report.stage('fit') as stage, _assignment_writer() as assignments:
+            clusterer.fit(
+                n_jobs=current_app.config['DISAMBIGUATION_CLUSTERING_N_JOBS'],
+                checkpoints=checkpoints,
+                assignments=assignments,
+            )
+            _count_clustering(stage, clusterer, checkpoints)
+        _save_clusterer(report, clusterer, checkpoints)
+        _evaluate_clusterer(report, clusterer)
+
+
+def train_and_save_clustering_model_distributed():
+    """Train the clustering model on Celery workers and save it to disk.
+
+    Same as :func:`train_and_save_clustering_model`, except that every block
+    is clustered by a :func:`~inspire_disambiguation.tasks.cluster_block`
+    task. Workers must share the ``DISAMBIGUATION_*_PATH`` files with this
+    process. With ``CELERY_TASK_ALWAYS_EAGER`` the blocks are clustered
+    locally, which needs no broker.
+    """
+    from .tasks import cluster_block
+
+    with _run_report('train_and_save_clustering_model_distributed') as report:
+        clusterer = _load_clusterer(report)
+        checkpoints = _get_clustering_checkpoints(clusterer)
+        with report.stage('fit') as stage, _assignment_writer() as assignments:
+            clusterer.fit_distributed(
+                cluster_block,
+                max_retries=current_app.config['DISAMBIGUATION_CLUSTERING_TASK_MAX_RETRIES'],
+                poll_interval=current_app.config['DISAMBIGUATION_CLUSTERING_TASK_POLL_INTERVAL'],
+                checkpoints=checkpoints,
+                assignments=assignments,
+            )
+            _count_clustering(stage, clusterer, checkpoints)
+        _save_clusterer(report, clusterer, checkpoints)
+        _evaluate_clusterer(report, clusterer)
+
+
+def plan_clustering(n_jobs=None, calibration_path=None, top=20):
+    """Predict the cost of clustering the curated signatures, without fitting.
+
+    The signatures are blocked as by :func:`train_and_save_clustering_model`,
+    and the time and memory of every block are predicted from its number of
+    pairs, see :func:`~inspire_disambiguation.core.ml.planning.plan_clustering`.
+
+    Args:
+        n_jobs(int): the number of processes fitting blocks, by default
+            ``DISAMBIGUATION_CLUSTERING_N_JOBS``.
+        calibration_path(str): results saved by the ``benchmark`` command on
+            the machine running the clustering, to calibrate the time per
+            pair with.
+        top(int): how many of the largest blocks to report.
+
+    Returns:
+        dict: the cost report.
+
+    """
+    from .core.ml.planning import DEFAULT_SECONDS_PER_PAIR, calibrate, load_block_sizes
+    from .core.ml.planning import plan_clustering as plan
+
+    if n_jobs is None:
+        n_jobs = current_app.config['DISAMBIGUATION_CLUSTERING_N_JOBS']
+
+    seconds_per_pair = DEFAULT_SECONDS_PER_PAIR
+    if calibration_path:
+        from .benchmarks.suite import load_results
+
+        seconds_per_pair = calibrate(load_results(calibration_path))
+
+    with _run_report('plan_clustering') as report:
+        with report.stage('block_signatures') as stage:
+            block_sizes = load_block_sizes(
+                current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'], block_index_path=_block_index_path(),
+                uncurated_signatures_path=_uncurated_signatures_path())
+            stage.count(len(block_sizes), what='blocks')
+        with report.stage('plan'):
+            return plan(block_sizes, n_jobs, seconds_per_pair=seconds_per_pair, top=top)
+
+
+def evaluate_clustering_prefilter(prefilter_rules=None):
+    """Measure the effect of the pair pre-filter on the curated signatures.
+
+    Clusters all curated signatures twice, without and with the pre-filter,
+    ignoring checkpoints.
+
+    Args:
+        prefilter_rules(list): the rules to evaluate, by default the ones in
+            ``DISAMBIGUATION_CLUSTERING_PREFILTER_RULES``.
+
+    Returns:
+        dict: for ``baseline`` and ``prefilter``, the B3 ``precision``,
+        ``recall`` and ``f_score`` and the fitting time in ``seconds``, plus
+        the total number of ``pairs`` and the number of ``pruned_pairs`` in
+        each block.
+
+    """
+    if prefilter_rules is None:
+        prefilter_rules = current_app.config['DISAMBIGUATION_CLUSTERING_PREFILTER_RULES']
+
+    with _run_report('evaluate_clustering_prefilter') as report:
+        clusterer = _load_clusterer(report)
+        evaluation = _fit_variants(report, clusterer, [
+            ('baseline', {'prefilter_rules': [], 'pruned_pairs': {}}),
+            ('prefilter', {'prefilter_rules': list(prefilter_rules), 'pruned_pairs': {}}),
+        ])
+
+    block_sizes = np.bincount(np.unique(clusterer.clusterer.blocks_, return_inverse=True)[1])
+    evaluation['pairs'] = int(np.sum(block_sizes * (block_sizes - 1) // 2))
+    evaluation['pruned_pairs'] = {
+        str(block): int(pruned) for block, pruned in six.iteritems(clusterer.pruned_pairs)}
+    return evaluation
+
+
+def evaluate_sparse_clustering(min_size=None):
+    """Compare clustering large blocks on all pairs and on LSH candidate pairs.
+
+    Clusters all curated signatures twice, scoring all pairs of every block
+    and then only the candidate pairs of the blocks of at least ``min_size``
+    signatures, ignoring checkpoints.
+
+    Args:
+        min_size(int): the smallest block clustered on candidate pairs, by
+            default ``DISAMBIGUATION_CLUSTERING_SPARSE_MIN_SIZE``.
+
+    Returns:
+        dict: for ``dense`` and ``sparse``, the B3 ``precision``, ``recall``
+        and ``f_score`` and the fitting time in ``seconds``, plus the number
+        of ``sparse_blocks``, of their ``pairs`` and of the
+        ``candidate_pairs`` scored in them.
+
+    """
+    if min_size is None:
+        min_size = current_app.config['DISAMBIGUATION_CLUSTERING_SPARSE_MIN_SIZE']
+    if min_size is None:
+        raise ValueError('No block size given and DISAMBIGUATION_CLUSTERING_SPARSE_MIN_SIZE is not set')
+
+    with _run_report('evaluate_sparse_clustering') as report:
+        clusterer = _load_clusterer(report)
+        evaluation = _fit_variants(report, clusterer, [
+            ('dense', {'sparse_min_size': None}),
+            ('sparse', {'sparse_min_size': min_size}),
+        ])
+
+    sparse_blocks = [block_clusterer for block_clusterer in six.itervalues(clusterer.clusterer.clusterers_)
+                     if hasattr(block_clusterer, 'n_candidate_pairs_')]
+    evaluation['sparse_blocks'] = len(sparse_blocks)
+    evaluation['pairs'] = sum(c.n_samples_ * (c.n_samples_ - 1) // 2 for c in sparse_blocks)
+    evaluation['candidate_pairs'] = sum(c.n_candidate_pairs_ for c in sparse_blocks)
+    return evaluation
+
+
+def evaluate_distance_cascade():
+    """Compare clustering with the full distance model and with the cascade.
+
+    Clusters all curated signatures twice, scoring pairs with the full
+    distance model alone and then through the cascade of
+    ``DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH``, ignoring checkpoints.
+
+    Returns:
+        dict: for ``full`` and ``cascade``, the B3 ``precision``, ``recall``
+        and ``f_score`` and the fitting time in ``seconds``, plus the
+        ``speedup`` and the ``f_score_delta`` of the cascade, the number of
+        ``scored_pairs`` and of the ``escalated_pairs`` scored again by the
+        full model.
+
+    """
+    with _run_report('evaluate_distance_cascade') as report:
+        clusterer = _load_clusterer(report, cascade=True)
+        cascade = clusterer.cascade
+        evaluation = _fit_variants(report, clusterer, [
+            ('full', {'cascade': None}),
+            ('cascade', {'cascade': cascade}),
+        ])
+
+    block_clusterers = list(six.itervalues(clusterer.clusterer.clusterers_))
+    evaluation['speedup'] = evaluation['full']['seconds'] / max(evaluation['cascade']['seconds'], 1e-9)
+    evaluation['f_score_delta'] = evaluation['cascade']['f_score'] - evaluation['full']['f_score']
+    evaluation['scored_pairs'] = sum(getattr(c, 'n_scored_pairs_', 0) for c in block_clusterers)
+    evaluation['escalated_pairs'] = sum(getattr(c, 'n_escalated_pairs_', 0) for c in block_clusterers)
+    return evaluation
+
+
+def sweep_clustering_thresholds(thresholds, worst=0):
+    """Score the last clustering run when cut at other thresholds.
+
+    Uses the linkage matrices saved by :func:`train_and_save_clustering_model`,
+    so no distance is computed again.
+
+    Args:
+        thresholds(list): the distance thresholds to try. ``None`` cuts every
+            block at the threshold it was cut at by the run, which scores
+            the clusters of the run.
+        worst(int): how many of the worst blocks to report per threshold.
+
+    Returns:
+        list: one dict per threshold with its B3 precision, recall and F-score.
+
+    """
+    return sweep_thresholds(
+        current_app.config['DISAMBIGUATION_CLUSTERING_LINKAGES_PATH'],
+        current_app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH'],
+        thresholds,
+        n_jobs=current_app.config['DISAMBIGUATION_CLUSTERING_N_JOBS'],
+        worst=worst,
+    )
+
+
+def load_clustering_evaluation():
+    """Load the evaluation report of the last clustering run.
+
+    Returns:
+        dict: the global B3 scores of the run and its worst blocks, see
+        :func:`~inspire_disambiguation.core.ml.evaluation.evaluate_blocks`.
+
+    """
+    with open(current_app.config['DISAMBIGUATION_CLUSTERING_EVALUATION_PATH'], 'r') as fd:
+        return json.load(fd)
+
+
+def diff_clustering_assignments():
+    """Compare the clusters of the last clustering run with the input clusters.
+
+    The splits, merges and moved signatures are written to
+    ``DISAMBIGUATION_CLUSTERING_DIFF_PATH``, see
+    :func:`~inspire_disambiguation.core.ml.assignments.diff_assignments`.
+
+    Returns:
+        dict: the number of compared signatures and of every kind of change.
+
+    """
+    with _run_report('diff_clustering_assignments') as report, \
+            report.stage('diff_assignments') as stage:
+        summary = diff_assignments(
+            current_app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH'],
+            current_app.config['DISAMBIGUATION_CLUSTERING_ASSIGNMENTS_PATH'],
+            current_app.config['DISAMBIGUATION_CLUSTERING_DIFF_PATH'],
+            chunk_size=current_app.config['DISAMBIGUATION_CLUSTERING_DIFF_CHUNK_SIZE'],
+        )
+        stage.count(summary['signatures'], what='signatures')
+    return summary
+
+
+def write_back_clustering_assignments():
+    """Set the author of the signatures clustered by the last clustering run.
+
+    Every uncurated signature of a cluster gets the author of most of the
+    curated signatures of the cluster, so the uncurated signatures must have
+    been clustered, with ``DISAMBIGUATION_CLUSTERING_UNCURATED``, see
+    :func:`~inspire_disambiguation.core.ml.assignments.iter_author_assignments`.
+    The records are updated in batches of ``DISAMBIGUATION_WRITE_BACK_BATCH_SIZE``,
+    see :func:`~inspire_disambiguation.core.db.writers.write_author_assignments`,
+    storing their new revision when ``DB_VERSIONING`` is enabled, and the
+    updated records are queued for reindexing.
+
+    Returns:
+        dict: the number of updated records and signatures, and the time
+        taken.
+
+    """
+    from invenio_indexer.api import RecordIndexer
+
+    from .core.db.writers import write_author_assignments
+
+    with _run_report('write_back_clustering_assignments') as report, \
+            report.stage('write_author_assignments') as stage:
+        assignments = iter_author_assignments(
+            current_app.config['DISAMBIGUATION_CLUSTERING_ASSIGNMENTS_PATH'],
+            current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'],
+            chunk_size=current_app.config['DISAMBIGUATION_CLUSTERING_DIFF_CHUNK_SIZE'],
+        )
+        counts = write_author_assignments(
+            assignments,
+            batch_size=current_app.config['DISAMBIGUATION_WRITE_BACK_BATCH_SIZE'],
+            versioning=current_app.config.get('DB_VERSIONING', True),
+            reindex=RecordIndexer().bulk_index,
+        )
+        stage.count(counts['records'], what='records')
+        stage.count(counts['signatures'], what='signatures')
+    return counts
+
+
+def create_clusterer(cascade=None):
+    """Load the models and build the clusterer of the ``DISAMBIGUATION_*`` settings.
+
+    Shared with the Celery workers, see :mod:`inspire_disambiguation.tasks`,
+    so that the blocks they fit are clustered as the ones fitted here.
+
+    Args:
+        cascade(bool): whether to score pairs through the cascade model, by
+            default ``DISAMBIGUATION_DISTANCE_CASCADE``.
+    """
     ethnicity_estimator = EthnicityEstimator()
     ethnicity_estimator.load_model(current_app.config['DISAMBIGUATION_ETHNICITY_MODEL_PATH'])
 
     distance_estimator = DistanceEstimator(ethnicity_estimator)
     distance_estimator.load_model(current_app.config['DISAMBIGUATION_DISTANCE_MODEL_PATH'])
 
-    clusterer = Clusterer(distance_estimator)
-    clusterer.load_data(
+    if cascade is None:
+        cascade = current_app.config['DISAMBIGUATION_DISTANCE_CASCADE']
+    cascade_estimator = None
+    if cascade:
+        cascade_estimator = DistanceEstimator(ethnicity_estimator, features=CASCADE_FEATURES)
+        cascade_estimator.load_model(current_app.config['DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH'])
+
+    return Clusterer(distance_estimator, **dict(_clusterer_options(), cascade=cascade_estimator))
+
+
+def load_clustering_signatures():
+    """Load the signatures clustered by :func:`create_clusterer`.
+
+    Returns:
+        dict: see :func:`~inspire_disambiguation.core.ml.models.load_signatures`.
+
+    """
+    return load_signatures(
         current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'],
         current_app.config['DISAMBIGUATION_PUBLICATIONS_PATH'],
-        current_app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH'],
+        **_signatures_options()
+    )
+
+
+def _load_clusterer(report, cascade=None):
+    with report.stage('load_models'):
+        clusterer = create_clusterer(cascade=cascade)
+    with report.stage('load_data') as stage:
+        clusterer.load_data(
+            current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'],
+            current_app.config['DISAMBIGUATION_PUBLICATIONS_PATH'],
+            current_app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH'],
+            block_index_path=_block_index_path(),
+            **_signatures_options()
+        )
+        stage.count(len(clusterer.X), what='signatures')
+
+    return clusterer
+
+
+def _fit_variants(report, clusterer, variants):
+    """Fit and score the clusterer once per variant of its settings.
+
+    Checkpoints are ignored, so that every variant fits all the blocks.
+
+    Args:
+        variants(list): pairs of the name of a variant and a dict of the
+            attributes of the clusterer to set before fitting it.
+
+    Returns:
+        dict: for every variant, the B3 ``precision``, ``recall`` and
+        ``f_score`` and the fitting time in ``seconds``.
+
+    """
+    results = {}
+    for name, attributes in variants:
+        for attribute, value in six.iteritems(attributes):
+            setattr(clusterer, attribute, value)
+        with report.stage('fit_' + name) as stage:
+            clusterer.fit(n_jobs=current_app.config['DISAMBIGUATION_CLUSTERING_N_JOBS'])
+            stage.count(len(clusterer.X), what='signatures')
+        precision, recall, f_score = clusterer.score()
+        results[name] = {
+            'precision': precision,
+            'recall': recall,
+            'f_score': f_score,
+            'seconds': stage.seconds,
+        }
+    return results
+
+
+def _count_clustering(stage, clusterer, checkpoints):
+    blocks = clusterer.clusterer.blocks_
+    stage.count(len(blocks), what='signatures')
+    stage.count(len(clusterer.clusterer.clusterers_), what='blocks')
+    if checkpoints is not None:
+        stage.count(checkpoints.hits, what='reused_blocks')
+    stage.count(sum(six.itervalues(clusterer.pruned_pairs)), what='pruned_pairs')
+
+
+def _save_clusterer(report, clusterer, checkpoints):
+    with report.stage('save_model'):
+        clusterer.save_model(current_app.config['DISAMBIGUATION_CLUSTERING_MODEL_PATH'])
+        clusterer.save_linkages(current_app.config['DISAMBIGUATION_CLUSTERING_LINKAGES_PATH'])
+        if checkpoints is not None:
+            checkpoints.prune()
+
+
+def _evaluate_clusterer(report, clusterer):
+    with report.stage('evaluate') as stage:
+        evaluation = clusterer.evaluate(
+            n_jobs=current_app.config['DISAMBIGUATION_CLUSTERING_N_JOBS'],
+            worst=current_app.config['DISAMBIGUATION_CLUSTERING_EVALUATION_WORST_BLOCKS'],
+        )
+        stage.count(evaluation['signatures'], what='curated_signatures')
+        with open_file_in_folder(current_app.config['DISAMBIGUATION_CLUSTERING_EVALUATION_PATH'], 'w') as fd:
+            json.dump(evaluation, fd, indent=2)
+
+
+def _clusterer_options():
+    return {
+        'prefilter_rules': current_app.config['DISAMBIGUATION_CLUSTERING_PREFILTER_RULES'],
+        'sparse_min_size': current_app.config['DISAMBIGUATION_CLUSTERING_SPARSE_MIN_SIZE'],
+        'lsh_bands': current_app.config['DISAMBIGUATION_CLUSTERING_LSH_BANDS'],
+        'lsh_rows': current_app.config['DISAMBIGUATION_CLUSTERING_LSH_ROWS'],
+        'lsh_max_bucket_size': current_app.config['DISAMBIGUATION_CLUSTERING_LSH_MAX_BUCKET_SIZE'],
+        'cascade_band': current_app.config['DISAMBIGUATION_DISTANCE_CASCADE_BAND'],
+        'scoring_threads': current_app.config['DISAMBIGUATION_CLUSTERING_SCORING_THREADS'],
+        'threaded_min_size': current_app.config['DISAMBIGUATION_CLUSTERING_THREADED_MIN_SIZE'],
+    }
+
+
+def _signatures_options():
+    return {
+        'publications_index_path': _publications_index_path(),
+        'publications_cache_size': current_app.config['DISAMBIGUATION_PUBLICATIONS_CACHE_SIZE'],
+        'uncurated_signatures_path': _uncurated_signatures_path(),
+    }
+
+
+def _assignment_writer():
+    return AssignmentWriter(current_app.config['DISAMBIGUATION_CLUSTERING_ASSIGNMENTS_PATH'])
+
+
+def _load_distance_data(distance_estimator):
+    distance_estimator.load_data(
+        current_app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'],
+        _sampled_pairs_path(),
+        current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_SIZE'],
+        current_app.config['DISAMBIGUATION_PUBLICATIONS_PATH'],
     )
-    clusterer.fit(n_jobs=current_app.config['DISAMBIGUATION_CLUSTERING_N_JOBS'])
-    clusterer.save_model(current_app.config['DISAMBIGUATION_CLUSTERING_MODEL_PATH'])
 
+
+def _distance_fit_options():
+    return {
+        'n_jobs': current_app.config['DISAMBIGUATION_DISTANCE_N_JOBS'],
+        'forest_n_jobs': current_app.config['DISAMBIGUATION_DISTANCE_FOREST_N_JOBS'],
+        'chunk_size': current_app.config['DISAMBIGUATION_DISTANCE_CHUNK_SIZE'],
+    }
+
+
+def _warm_start_options():
+    return dict(
+        _distance_fit_options(),
+        n_trees=current_app.config['DISAMBIGUATION_DISTANCE_WARM_START_TREES'],
+        max_trees=current_app.config['DISAMBIGUATION_DISTANCE_MAX_TREES'],
+    )
+
+
+def _sample_signature_pairs(signatures_path, clusters_path, pairs_size, signature_rows=False):
+    seed = current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_SEED']
+    if seed is None:
+        return sample_signature_pairs(
+            signatures_path, clusters_path, pairs_size, signature_rows=signature_rows,
+            block_index_path=_block_index_path(), uncurated_signatures_path=_uncurated_signatures_path())
+    return sample_signature_pairs_parallel(
+        signatures_path,
+        clusters_path,
+        pairs_size,
+        seed=seed,
+        n_jobs=current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_N_JOBS'],
+        signature_rows=signature_rows,
+        block_index_path=_block_index_path(),
+        uncurated_signatures_path=_uncurated_signatures_path(),
+    )
+
+
+def _sampled_pairs_path():
+    if current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_BINARY']:
+        return current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_INDEX_PATH']
+    return current_app.config['DISAMBIGUATION_SAMPLED_PAIRS_PATH']
+
+
+def _publications_index_path():
+    if current_app.config['DISAMBIGUATION_PUBLICATIONS_LAZY']:
+        return current_app.config['DISAMBIGUATION_PUBLICATIONS_INDEX_PATH']
+
+
+def _block_index_path():
+    if current_app.config['DISAMBIGUATION_PRECOMPUTED_BLOCKS']:
+        return current_app.config['DISAMBIGUATION_SIGNATURE_BLOCKS_PATH']
+
+
+def _uncurated_signatures_path():
+    if current_app.config['DISAMBIGUATION_CLUSTERING_UNCURATED']:
+        return current_app.config['DISAMBIGUATION_UNCURATED_SIGNATURES_PATH']
+
+
+def _export_options():
+    return {
+        'n_jobs': current_app.config['DISAMBIGUATION_EXPORT_N_JOBS'],
+        'batch_size': current_app.config['DISAMBIGUATION_EXPORT_BATCH_SIZE'],
+    }
+
+
+def _run_report(name):
+    return run_report(
+        name,
+        current_app.config['DISAMBIGUATION_RUN_REPORTS_PATH'],
+        current_app.config['DISAMBIGUATION_PROMETHEUS_TEXTFILE_PATH'],
+    )
+
+
+def _get_clustering_checkpoints(clusterer):
+    if not current_app.config['DISAMBIGUATION_CLUSTERING_CHECKPOINTS']:
+        return None
+
+    cascade = None
+    if clusterer.cascade is not None:
+        cascade = '{}:{}-{}'.format(
+            hash_file(current_app.config['DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH']), *clusterer.cascade_band)
+    version = '{}:{}:{}:{}:{}:{}:{}:{}:{}'.format(
+        hash_file(current_app.config['DISAMBIGUATION_DISTANCE_MODEL_PATH']),
+        clusterer.clustering_threshold,
+        clusterer.clustering_method,
+        ','.join(sorted(clusterer.prefilter_rules)),
+        clusterer.sparse_min_size,
+        clusterer.lsh_bands,
+        clusterer.lsh_rows,
+        clusterer.lsh_max_bucket_size,
+        cascade,
+    )
+    return BlockCheckpoints(current_app.config['DISAMBIGUATION_CLUSTERING_CHECKPOINTS_PATH'], version)
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation benchmarks suite."""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from ..core.ml.blocking import compute_signature_blocks, load_signature_blocks, save_block_index
+from ..core.ml.models import (
+    Clusterer,
+    DistanceEstimator,
+    EthnicityEstimator,
+    _affinity,
+    _set_scoring_threads,
+    group_blocks,
+    load_signatures,
+)
+from ..core.ml.publications import build_publications_index
+from ..core.ml.sampling import sample_signature_pairs, sample_signature_pairs_parallel
+from ..utils import open_file_in_folder
+from .synthetic import generate_synthetic_data
+
+IMPORT_BENCHMARK_MODULES = [
+    'inspire_disambiguation.cli',
+    'inspire_disambiguation.pipeline',
+    'inspire_disambiguation.api',
+    'inspire_disambiguation.tasks',
+    'inspire_disambiguation.core.ml.models',
+]
+"""Modules whose import time is measured by :func:`run_import_benchmarks`."""
+
+HEAVY_MODULES = [
+    'beard',
+    'inspire_dojson',
+    'inspire_schemas',
+    'invenio_records',
+    'scipy',
+    'sklearn',
+    'sqlalchemy',
+]
+"""Top-level packages that should only be imported by the stages using them."""
+
+_IMPORT_BENCHMARK_CODE = '''
+import json, sys, time
+start = time.time()
+import {module}
+seconds = time.time() - start
+print(json.dumps([seconds, sorted(set(name.split('.')[0] for name in sys.modules) & set({heavy!r}))]))
+'''
+
+
+def _timed(results, scale, stage, func, items=None):
+    """Run ``func`` and append its timing to ``results``.
+
+    Args:
+        items: the number of processed items, or a callable computing it
+            from the return value of ``func``.
+
+    """
+    start = time.time()
+    value = func()
+    seconds = time.time() - start
+    if callable(items):
+        items = items(value)
+    results.append({
+        'scale': scale,
+        'stage': stage,
+        'seconds': seconds,
+        'items': items,
+        'items_per_second': items / seconds if items and seconds else None,
+    })
+    return value
+
+
+def run_benchmarks(work_dir, scales, pairs_per_publication=1.2, n_jobs=1, seed=0, scoring_threads=4):
+    """Time the main stages of disambiguation on synthetic data.
+
+    For every scale, a synthetic dataset is generated in its own folder of
+    ``work_dir`` (and reused if it already exists), then the following
+    stages are timed: ``load_signatures``, ``load_signatures_lazy`` (through
+    the offset index of the publications), ``compute_signature_blocks`` and
+    ``load_signature_blocks`` (from the saved block index),
+    ``sample_signature_pairs``,
+    ``sample_signature_pairs_parallel``, ``EthnicityEstimator.fit``, ``DistanceEstimator.fit``, ``_affinity`` on
+    the largest block, on one thread and on ``scoring_threads`` threads
+    (``_affinity_threaded``), and ``Clusterer.fit``.
+
+    Args:
+        work_dir(str): where to put the datasets and the trained models.
+        scales(list): the numbers of publications of the datasets.
+        pairs_per_publication(float): sets the number of sampled pairs used
+            to train the distance model, which is rounded to a multiple of 12.
+        n_jobs(int): the number of processes used by ``DistanceEstimator.fit``,
+            ``Clusterer.fit`` and the parallel sampling.
+        seed(int): the seed of the synthetic data and of the parallel
+            sampling.
+        scoring_threads(int): the number of threads of ``_affinity_threaded``.
+
+    Returns:
+        list: one dict per scale and stage, with the elapsed ``seconds``, the
+        number of processed ``items`` and the ``items_per_second``.
+
+    """
+    results = []
+    for scale in scales:
+        data_dir = os.path.join(work_dir, str(scale))
+        signatures_path = os.path.join(data_dir, 'curated_signatures.jsonl')
+        publications_path = os.path.join(data_dir, 'publications.jsonl')
+        clusters_path = os.path.join(data_dir, 'input_clusters.jsonl')
+        pairs_path = os.path.join(data_dir, 'sampled_pairs.jsonl')
+        pairs_size = 12 * max(1, int(scale * pairs_per_publication) // 12)
+
+        if not os.path.exists(signatures_path):
+            generate_synthetic_data(data_dir, n_publications=scale, seed=seed)
+
+        signatures_by_uuid = _timed(
+            results, scale, 'load_signatures',
+            lambda: load_signatures(signatures_path, publications_path), items=len)
+        del signatures_by_uuid
+
+        publications_index_path = os.path.join(data_dir, 'publications_index.npz')
+        if not os.path.exists(publications_index_path):
+            build_publications_index(publications_index_path, publications_path)
+        signatures_by_uuid = _timed(
+            results, scale, 'load_signatures_lazy',
+            lambda: load_signatures(signatures_path, publications_path, publications_index_path), items=len)
+        del signatures_by_uuid
+
+        block_index_path = os.path.join(data_dir, 'signature_blocks.npz')
+        blocks = _timed(
+            results, scale, 'compute_signature_blocks',
+            lambda: compute_signature_blocks(signatures_path), items=len)
+        save_block_index(block_index_path, signatures_path, blocks)
+        _timed(
+            results, scale, 'load_signature_blocks',
+            lambda: load_signature_blocks(block_index_path, signatures_path), items=len)
+
+        pairs = _timed(
+            results, scale, 'sample_signature_pairs',
+            lambda: list(sample_signature_pairs(signatures_path, clusters_path, pairs_size)), items=len)
+        _timed(
+            results, scale, 'sample_signature_pairs_parallel',
+            lambda: list(sample_signature_pairs_parallel(
+                signatures_path, clusters_path, pairs_size, seed=seed, n_jobs=n_jobs)), items=len)
+        with open_file_in_folder(pairs_path, 'w') as fd:
+            for pair in pairs:
+                fd.write(json.dumps(pair) + '\n')
+
+        ethnicity_estimator = EthnicityEstimator()
+        ethnicity_estimator.load_data(os.path.join(data_dir, 'ethnicity.csv'))
+        _timed(results, scale, 'EthnicityEstimator.fit', ethnicity_estimator.fit, items=len(ethnicity_estimator.X))
+
+        distance_estimator = DistanceEstimator(ethnicity_estimator)
+        distance_estimator.load_data(signatures_path, pairs_path, pairs_size, publications_path)
+        _timed(results, scale, 'DistanceEstimator.fit', lambda: distance_estimator.fit(n_jobs=n_jobs), items=pairs_size)
+
+        clusterer = Clusterer(distance_estimator)
+        clusterer.load_data(signatures_path, publications_path, clusters_path)
+        _, largest_block = max(group_blocks(clusterer.block_function(clusterer.X)), key=lambda item: len(item[1]))
+        X = clusterer.X[largest_block]
+        _timed(results, scale, '_affinity', lambda: _affinity(X), items=len(X) * (len(X) - 1) // 2)
+        _set_scoring_threads(scoring_threads, 0)
+        try:
+            _timed(results, scale, '_affinity_threaded', lambda: _affinity(X), items=len(X) * (len(X) - 1) // 2)
+        finally:
+            _set_scoring_threads(1, None)
+
+        _timed(results, scale, 'Clusterer.fit', lambda: clusterer.fit(n_jobs=n_jobs), items=len(clusterer.X))
+
+    return results
+
+
+def run_import_benchmarks(modules=IMPORT_BENCHMARK_MODULES, repeat=3):
+    """Time the import of the entry points of the package.
+
+    Every import is done in a fresh interpreter, ``repeat`` times, keeping
+    the fastest one so that a cold disk cache does not count.
+
+    Args:
+        modules(list): the modules to import.
+        repeat(int): the number of imports of each module.
+
+    Returns:
+        list: one dict per module, in the format of :func:`run_benchmarks`
+        with ``import`` as scale, plus the ``heavy_modules`` that importing
+        it pulled in, among :data:`HEAVY_MODULES`.
+
+    """
+    results = []
+    for module in modules:
+        code = _IMPORT_BENCHMARK_CODE.format(module=module, heavy=HEAVY_MODULES)
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.check_output([sys.executable, '-c', code])
+            timings.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+        seconds, heavy_modules = min(timings)
+        results.append({
+            'scale': 'import',
+            'stage': module,
+            'seconds': seconds,
+            'items': None,
+            'items_per_second': None,
+            'heavy_modules': heavy_modules,
+        })
+    return results
+
+
+def save_results(output_filename, results):
+    """Save benchmark results together with a description of the machine."""
+    with open_file_in_folder(output_filename, 'w') as fd:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': {
+                'platform': platform.platform(),
+                'processor': platform.processor(),
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+            },
+            'results': results,
+        }, fd, indent=2)
+
+
+def load_results(input_filename):
+    with open(input_filename, 'r') as fd:
+        return json.load(fd)['results']
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """Find the stages that got slower than in a baseline run.
+
+    Args:
+        results(list): as returned by :func:`run_benchmarks`.
+        baseline(list): the results of an earlier run.
+        tolerance(float): the relative slowdown considered as noise.
+
+    Returns:
+        list: one dict per stage and scale present in both runs and slower
+        than ``baseline`` by more than ``tolerance``, with both timings and
+        their ``ratio``.
+
+    """
+    baseline_seconds = {(result['scale'], result['stage']): result['seconds'] for result in baseline}
+    regressions = []
+    for result in results:
+        key = (result['scale'], result['stage'])
+        if key not in baseline_seconds or not baseline_seconds[key]:
+            continue
+        ratio = result['seconds'] / baseline_seconds[key]
+        if ratio > 1 + tolerance:
+            regressions.append({
+                'scale': result['scale'],
+                'stage': result['stage'],
+                'seconds': result['seconds'],
+                'baseline_seconds': baseline_seconds[key],
+                'ratio': ratio,
+            })
+    return regressions
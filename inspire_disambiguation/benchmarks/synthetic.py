@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation benchmarks synthetic data."""
+
+from __future__ import absolute_import, division, print_function
+
+import csv
+import itertools
+import json
+import os
+import random
+import uuid
+from collections import defaultdict
+
+from ..core.ml.blocking import compute_signature_blocks
+from ..utils import open_file_in_folder
+
+
+CONSONANTS = 'bcdfghjklmnprstvwz'
+VOWELS = 'aeiou'
+
+ETHNICITIES = {
+    # RACE code: (consonants, vowels, typical name length) of the synthetic
+    # names of that group, different enough for the estimator to learn.
+    1: ('bdfglmnrst', 'aeio', 3),
+    2: ('hjkmnrsty', 'aiou', 2),
+    3: ('cdglmnprtz', 'aeio', 3),
+    4: ('bhkmnpstw', 'aeiu', 2),
+    5: ('dfjklmnrvz', 'aeiou', 4),
+}
+
+WORDS = [
+    'quark', 'gluon', 'lepton', 'boson', 'higgs', 'neutrino', 'muon', 'hadron',
+    'lattice', 'string', 'brane', 'gauge', 'symmetry', 'anomaly', 'cosmology',
+    'inflation', 'dark', 'matter', 'energy', 'collider', 'detector', 'decay',
+    'scattering', 'amplitude', 'loop', 'correction', 'supersymmetry', 'axion',
+    'plasma', 'jet', 'calorimeter', 'trigger', 'luminosity', 'cross', 'section',
+    'black', 'hole', 'gravity', 'holography', 'entropy', 'duality', 'vacuum',
+    'field', 'theory', 'quantum', 'chromodynamics', 'electroweak', 'flavour',
+    'oscillation', 'mass', 'spectrum', 'resonance', 'baryon', 'meson', 'pion',
+]
+
+TOPICS = [
+    'Phenomenology-HEP', 'Theory-HEP', 'Experiment-HEP', 'Astrophysics',
+    'Lattice', 'Gravitation and Cosmology', 'Instrumentation', 'Nuclear Physics',
+]
+
+
+def _syllables(rng, consonants, vowels, count):
+    return ''.join(rng.choice(consonants) + rng.choice(vowels) for _ in range(count))
+
+
+def _name(rng, ethnicity):
+    consonants, vowels, length = ETHNICITIES[ethnicity]
+    return _syllables(rng, consonants, vowels, rng.randint(1, length)).capitalize()
+
+
+def _heavy_tailed(rng, alpha, maximum):
+    """Draw an integer in ``[1, maximum]`` from a Pareto distribution."""
+    return min(maximum, int(rng.paretovariate(alpha)))
+
+
+def _text(rng, words, length):
+    return ' '.join(rng.choice(words) for _ in range(length))
+
+
+def _set_signature_blocks(signatures_path):
+    """Set the ``signature_block`` of the signatures to their clustering block.
+
+    The blocking depends on all the signatures, so the file is written
+    first, then rewritten with the blocks.
+    """
+    blocks = compute_signature_blocks(signatures_path)
+    with open(signatures_path, 'r') as fd, open(signatures_path + '.tmp', 'w') as output:
+        for line, block in zip(fd, blocks):
+            signature = json.loads(line)
+            signature['signature_block'] = str(block)
+            output.write(json.dumps(signature) + '\n')
+    os.rename(signatures_path + '.tmp', signatures_path)
+
+
+def generate_synthetic_data(output_dir, n_publications=10000, n_authors=None, n_ethnicity_names=None,
+                            collaboration_fraction=0.005, curated_fraction=0.8, seed=0):
+    """Write a synthetic INSPIRE-like dataset.
+
+    Writes ``curated_signatures.jsonl``, ``publications.jsonl``,
+    ``input_clusters.jsonl`` and ``ethnicity.csv`` to ``output_dir``, with
+    the same formats as the files exported from INSPIRE.
+
+    The data mimics the properties of INSPIRE that matter for performance:
+    surnames are drawn from a Zipf-like distribution, so that phonetic blocks
+    have a heavy-tailed size distribution, the number of authors per paper is
+    heavy-tailed as well, and a fraction of the papers are written by large
+    collaborations with hundreds to thousands of authors. The
+    ``signature_block`` of the signatures is the block given by the blocking
+    of the clustering, so that pairs are sampled from the same blocks as on
+    real data.
+
+    Args:
+        output_dir(str): where to write the files.
+        n_publications(int): the number of publications, which sets the scale.
+        n_authors(int): the number of distinct authors, by default half the
+            number of publications.
+        n_ethnicity_names(int): the number of rows of ``ethnicity.csv``, by
+            default the number of authors.
+        collaboration_fraction(float): the fraction of collaboration papers.
+        curated_fraction(float): the fraction of signatures that are curated.
+        seed(int): the seed of the random number generator, for reproducible
+            datasets.
+
+    Returns:
+        dict: the number of ``publications``, ``signatures``,
+        ``curated_signatures`` and ``authors`` written.
+
+    """
+    rng = random.Random(seed)
+    n_authors = n_authors or max(2, n_publications // 2)
+    n_ethnicity_names = n_ethnicity_names or n_authors
+
+    # Few surnames are very common and most are rare (Zipf's law), which
+    # gives blocks of very different sizes once they are phonetically encoded.
+    surnames = {ethnicity: [_name(rng, ethnicity) for _ in range(max(10, n_authors // 10))]
+                for ethnicity in ETHNICITIES}
+    surname_weights = {ethnicity: list(itertools.accumulate(1 / (rank + 2) for rank in range(len(names))))
+                       for ethnicity, names in surnames.items()}
+    affiliations = ['{} University'.format(_name(rng, 1)) for _ in range(max(5, n_authors // 50))]
+
+    authors = []
+    for recid in range(1, n_authors + 1):
+        ethnicity = rng.choice(list(ETHNICITIES))
+        surname = rng.choices(surnames[ethnicity], cum_weights=surname_weights[ethnicity])[0]
+        first_name = _name(rng, ethnicity)
+        middle_initial = rng.choice(CONSONANTS).upper() if rng.random() < 0.3 else ''
+        authors.append({
+            'recid': recid,
+            'surname': surname,
+            'first_name': first_name,
+            'middle_initial': middle_initial,
+            'affiliation': rng.choice(affiliations),
+            'topic': rng.choice(TOPICS),
+        })
+
+    collaborations = []
+    for i in range(max(1, int(n_publications * collaboration_fraction) // 10)):
+        size = min(len(authors), 100 * _heavy_tailed(rng, 1.2, 30))
+        collaborations.append(('{}-Collaboration-{}'.format(_name(rng, 3).upper(), i), rng.sample(authors, size)))
+
+    counts = defaultdict(int)
+    clusters = defaultdict(list)
+    with open_file_in_folder(os.path.join(output_dir, 'publications.jsonl'), 'w') as publications_fd, \
+            open(os.path.join(output_dir, 'curated_signatures.jsonl'), 'w') as signatures_fd:
+        for publication_id in range(1, n_publications + 1):
+            if rng.random() < collaboration_fraction:
+                collaboration, members = rng.choice(collaborations)
+                paper_authors = members
+                collaboration_names = [collaboration]
+            else:
+                paper_authors = rng.sample(authors, min(len(authors), _heavy_tailed(rng, 1.5, 50)))
+                collaboration_names = []
+
+            topic = paper_authors[0]['topic']
+            full_names = []
+            for author in paper_authors:
+                # Authors do not always sign with the same form of their name.
+                given_names = author['first_name'] if rng.random() < 0.6 else author['first_name'][0] + '.'
+                if author['middle_initial']:
+                    given_names += ' ' + author['middle_initial'] + '.'
+                full_names.append('{}, {}'.format(author['surname'], given_names))
+
+            publications_fd.write(json.dumps({
+                'abstract': _text(rng, WORDS, rng.randint(30, 120)),
+                'authors': full_names,
+                'collaborations': collaboration_names,
+                'keywords': [rng.choice(WORDS) for _ in range(rng.randint(0, 6))],
+                'publication_id': publication_id,
+                'title': _text(rng, WORDS, rng.randint(4, 12)).capitalize(),
+                'topics': [topic],
+            }) + '\n')
+            counts['publications'] += 1
+
+            for author, full_name in zip(paper_authors, full_names):
+                counts['signatures'] += 1
+                if rng.random() >= curated_fraction:
+                    continue
+                signature_uuid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+                signatures_fd.write(json.dumps({
+                    'author_affiliation': author['affiliation'] if rng.random() < 0.8 else '',
+                    'author_id': author['recid'],
+                    'author_name': full_name,
+                    'publication_id': publication_id,
+                    'signature_block': None,  # set by _set_signature_blocks
+                    'signature_uuid': signature_uuid,
+                }) + '\n')
+                clusters[author['recid']].append(signature_uuid)
+                counts['curated_signatures'] += 1
+
+    _set_signature_blocks(os.path.join(output_dir, 'curated_signatures.jsonl'))
+
+    with open(os.path.join(output_dir, 'input_clusters.jsonl'), 'w') as fd:
+        for cluster_id, (author_id, signature_uuids) in enumerate(sorted(clusters.items())):
+            fd.write(json.dumps({
+                'author_id': author_id,
+                'cluster_id': cluster_id,
+                'signature_uuids': signature_uuids,
+            }) + '\n')
+    counts['authors'] = len(clusters)
+
+    with open(os.path.join(output_dir, 'ethnicity.csv'), 'w') as fd:
+        writer = csv.DictWriter(fd, fieldnames=['RACE', 'NAMELAST', 'NAMEFRST'])
+        writer.writeheader()
+        for _ in range(n_ethnicity_names):
+            ethnicity = rng.choice(list(ETHNICITIES))
+            writer.writerow({
+                'RACE': ethnicity,
+                'NAMELAST': _name(rng, ethnicity).upper(),
+                'NAMEFRST': _name(rng, ethnicity).upper(),
+            })
+
+    return dict(counts)
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation CLI."""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('run-pipeline')
+@click.option('--force', multiple=True, help='Run this stage even if it is up to date, can be repeated.')
+@click.option('--jobs', type=int, default=2, show_default=True, help='Maximum number of stages running at once.')
+@click.option('--dry-run', is_flag=True, help='Only show which stages would run.')
+@with_appcontext
+def run_pipeline_stages(force, jobs, dry_run):
+    """Run the out of date stages of the disambiguation pipeline.
+
+    Stages: export_curated_signatures, export_uncurated_signatures,
+    index_signature_blocks, export_publications, sample_pairs,
+    train_ethnicity_model, train_distance_model, train_clustering_model.
+    """
+    from .pipeline import PipelineError, run_pipeline
+
+    try:
+        report = run_pipeline(force=force, n_jobs=jobs, dry_run=dry_run)
+    except PipelineError as e:
+        for name, status in e.report:
+            click.echo('{:<28} {}'.format(name, status))
+        raise click.ClickException(str(e))
+
+    for name, status in report:
+        click.echo('{:<28} {}'.format(name, status))
+
+
+@click.command('sweep-thresholds')
+@click.option('--start', type=float, default=0.5, show_default=True, help='Smallest threshold to try.')
+@click.option('--stop', type=float, default=0.9, show_default=True, help='Largest threshold to try.')
+@click.option('--step', type=float, default=0.01, show_default=True, help='Distance between two thresholds.')
+@click.option('--output', type=click.File('w'), help='Also write the scores as JSON lines to this file.')
+@click.option('--worst', type=int, default=0, help='Also write this many of the worst blocks to the output file.')
+@with_appcontext
+def sweep_thresholds(start, stop, step, output, worst):
+    """Score the last clustering run at other thresholds.
+
+    The first row scores the clusters of the run itself, where every block is
+    cut at its own threshold.
+    """
+    import numpy as np
+
+    from .api import sweep_clustering_thresholds
+
+    thresholds = [None] + [float(t) for t in np.arange(start, stop + step / 2, step)]
+    click.echo('threshold  precision  recall  f_score')
+    for score in sweep_clustering_thresholds(thresholds, worst=worst if output else 0):
+        threshold = 'clustered' if score['threshold'] is None else '{:9.3f}'.format(score['threshold'])
+        click.echo('{:>9}  {precision:9.4f}  {recall:6.4f}  {f_score:7.4f}'.format(threshold, **score))
+        if output:
+            output.write(json.dumps(score) + '\n')
+
+
+@click.command('evaluate-clustering')
+@click.option('--threshold', type=float, help='Evaluate the last run cut at this threshold instead.')
+@click.option('--top', type=int, default=20, show_default=True, help='How many of the worst blocks to show.')
+@with_appcontext
+def evaluate_clustering(threshold, top):
+    """Show the B3 scores and the worst blocks of the last clustering run."""
+    from .api import load_clustering_evaluation, sweep_clustering_thresholds
+
+    if threshold is None:
+        evaluation = load_clustering_evaluation()
+    else:
+        evaluation, = sweep_clustering_thresholds([threshold], worst=top)
+
+    click.echo('precision={precision:.4f}  recall={recall:.4f}  f_score={f_score:.4f}'.format(**evaluation))
+    click.echo('{:>10} {:>9} {:>6} {:>7} {:>8}  block'.format('signatures', 'precision', 'recall', 'f_score', 'lost'))
+    for block in evaluation['worst_blocks'][:top]:
+        click.echo('{signatures:>10} {precision:>9.4f} {recall:>6.4f} {f_score:>7.4f} {lost:>8.1f}  {block}'.format(
+            **block))
+
+
+@click.command('diff-clustering')
+@with_appcontext
+def diff_clustering():
+    """Compare the clusters of the last clustering run with the input clusters."""
+    from .api import diff_clustering_assignments
+
+    summary = diff_clustering_assignments()
+    for name in ('signatures', 'split', 'merge', 'moved', 'missing', 'new'):
+        click.echo('{:>10}: {}'.format(name, summary[name]))
+    click.echo('Changes written to {}'.format(current_app.config['DISAMBIGUATION_CLUSTERING_DIFF_PATH']))
+
+
+@click.command('index-publications')
+@with_appcontext
+def index_publications():
+    """Build the offset index of the exported publications."""
+    from .api import index_publications
+
+    click.echo('Indexed {} publications'.format(index_publications()))
+
+
+@click.command('index-blocks')
+@with_appcontext
+def index_blocks():
+    """Block the exported signatures and save their block index."""
+    from .api import index_signature_blocks
+
+    click.echo('Indexed {} blocks'.format(index_signature_blocks()))
+
+
+@click.command('write-back')
+@click.confirmation_option(prompt='This updates the authors of the Literature records, continue?')
+@with_appcontext
+def write_back():
+    """Set the authors found by the last clustering run in the DB."""
+    from .api import write_back_clustering_assignments
+
+    counts = write_back_clustering_assignments()
+    click.echo('Updated {records} records with {signatures} signatures in {seconds:.0f}s'.format(**counts))
+
+
+@click.command('plan-clustering')
+@click.option('--jobs', type=int, help='Processes fitting blocks, by default DISAMBIGUATION_CLUSTERING_N_JOBS.')
+@click.option('--calibration', type=click.Path(exists=True, dir_okay=False),
+              help='Benchmark results of this machine, saved by the benchmark command.')
+@click.option('--top', type=int, default=20, show_default=True, help='How many of the largest blocks to show.')
+@click.option('--output', type=click.File('w'), help='Also write the full report as JSON to this file.')
+@with_appcontext
+def plan_clustering(jobs, calibration, top, output):
+    """Predict the time and memory of clustering, without fitting anything."""
+    from .api import plan_clustering
+
+    plan = plan_clustering(n_jobs=jobs, calibration_path=calibration, top=top)
+    click.echo('{signatures} signatures in {blocks} blocks, {pairs} pairs'.format(**plan))
+    click.echo('{:>10} {:>10} {:>8} {:>12} {:>14}'.format('min_size', 'max_size', 'blocks', 'signatures', 'pairs'))
+    for row in plan['histogram']:
+        click.echo('{min_size:>10} {max_size:>10} {blocks:>8} {signatures:>12} {pairs:>14}'.format(**row))
+
+    click.echo('{:>10} {:>14} {:>10} {:>10}  block'.format('signatures', 'pairs', 'seconds', 'memory_mb'))
+    for block in plan['largest_blocks']:
+        click.echo('{:>10} {:>14} {:>10.0f} {:>10.0f}  {}'.format(
+            block['signatures'], block['pairs'], block['seconds'], block['memory_bytes'] / 2 ** 20, block['block']))
+
+    click.echo('cpu={:.0f}s  makespan={:.0f}s with {} jobs  peak_memory={:.0f}MB'.format(
+        plan['cpu_seconds'], plan['makespan_seconds'], plan['n_jobs'], plan['peak_memory_bytes'] / 2 ** 20))
+    if output:
+        json.dump(plan, output, indent=2)
+
+
+@click.command('evaluate-prefilter')
+@click.option('--rule', 'rules', multiple=True, help='Pre-filter rule to evaluate, by default the configured ones.')
+@click.option('--top', type=int, default=20, show_default=True, help='How many of the most pruned blocks to show.')
+@click.option('--output', type=click.File('w'), help='Also write the full report as JSON to this file.')
+@with_appcontext
+def evaluate_prefilter(rules, top, output):
+    """Compare clustering with and without the pair pre-filter."""
+    from .api import evaluate_clustering_prefilter
+
+    report = evaluate_clustering_prefilter(list(rules) or None)
+    for name in ('baseline', 'prefilter'):
+        click.echo('{name:9}  precision={precision:.4f}  recall={recall:.4f}  '
+                   'f_score={f_score:.4f}  seconds={seconds:.0f}'.format(name=name, **report[name]))
+
+    total_pruned = sum(report['pruned_pairs'].values())
+    click.echo('pruned {} of {} pairs ({:.1%})'.format(
+        total_pruned, report['pairs'], total_pruned / max(report['pairs'], 1)))
+    for block, pruned in sorted(report['pruned_pairs'].items(), key=lambda item: -item[1])[:top]:
+        click.echo('{:>12}  {}'.format(pruned, block))
+
+    if output:
+        json.dump(report, output, indent=2)
+
+
+@click.command('evaluate-sparse-clustering')
+@click.option('--min-size', type=int,
+              help='Smallest block clustered on candidate pairs, by default DISAMBIGUATION_CLUSTERING_SPARSE_MIN_SIZE.')
+@with_appcontext
+def evaluate_sparse_clustering(min_size):
+    """Compare clustering large blocks on all pairs and on LSH candidate pairs."""
+    from .api import evaluate_sparse_clustering
+
+    report = evaluate_sparse_clustering(min_size)
+    for name in ('dense', 'sparse'):
+        click.echo('{name:6}  precision={precision:.4f}  recall={recall:.4f}  '
+                   'f_score={f_score:.4f}  seconds={seconds:.0f}'.format(name=name, **report[name]))
+    click.echo('scored {} of {} pairs ({:.1%}) in {} large blocks'.format(
+        report['candidate_pairs'], report['pairs'], report['candidate_pairs'] / max(report['pairs'], 1),
+        report['sparse_blocks']))
+
+
+@click.command('evaluate-cascade')
+@with_appcontext
+def evaluate_cascade():
+    """Compare clustering with the full distance model and with the cascade."""
+    from .api import evaluate_distance_cascade
+
+    report = evaluate_distance_cascade()
+    for name in ('full', 'cascade'):
+        click.echo('{name:7}  precision={precision:.4f}  recall={recall:.4f}  '
+                   'f_score={f_score:.4f}  seconds={seconds:.0f}'.format(name=name, **report[name]))
+    click.echo('speed-up {:.2f}x, f_score delta {:+.4f}, full model scored {} of {} pairs ({:.1%})'.format(
+        report['speedup'], report['f_score_delta'], report['escalated_pairs'], report['scored_pairs'],
+        report['escalated_pairs'] / max(report['scored_pairs'], 1)))
+
+
+@click.command('compare-ethnicity-training')
+@with_appcontext
+def compare_ethnicity_training():
+    """Compare the accuracy of streaming and in-memory ethnicity training."""
+    from .api import compare_ethnicity_training
+
+    comparison = compare_ethnicity_training()
+    for name in ('in_memory', 'streaming'):
+        click.echo('{name:9}  accuracy={accuracy:.4f}  seconds={seconds:.0f}'.format(name=name, **comparison[name]))
+
+
+@click.command('compare-distance-retraining')
+@with_appcontext
+def compare_distance_retraining():
+    """Compare retraining the distance model from scratch and by warm start."""
+    from .api import compare_distance_retraining
+
+    comparison = compare_distance_retraining()
+    click.echo('{:<10}  accuracy={accuracy:.4f}  roc_auc={roc_auc:.4f}'.format('current', **comparison['current']))
+    for name in ('full', 'warm_start'):
+        click.echo('{:<10}  accuracy={accuracy:.4f}  roc_auc={roc_auc:.4f}  seconds={seconds:.0f}'.format(
+            name, **comparison[name]))
+
+
+@click.command('profile-distance-model')
+@click.option('--max-pairs', type=int, help='Time the features on at most this many sampled pairs.')
+@with_appcontext
+def profile_distance_model(max_pairs):
+    """Show the cost and the importance of each distance model feature."""
+    from .api import profile_distance_model
+
+    profile = profile_distance_model(max_pairs)
+    total_seconds = sum(feature['seconds'] for feature in profile)
+    click.echo('{:<36} {:>10} {:>7} {:>10}'.format('feature', 'seconds', 'time', 'importance'))
+    for feature in sorted(profile, key=lambda feature: -feature['seconds']):
+        click.echo('{:<36} {:>10.2f} {:>7.1%} {:>10.4f}'.format(
+            feature['feature'], feature['seconds'], feature['seconds'] / total_seconds, feature['importance']))
+
+
+@click.command('generate-synthetic-data')
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.option('--publications', type=int, default=10000, show_default=True, help='Number of publications.')
+@click.option('--authors', type=int, help='Number of distinct authors, by default half the publications.')
+@click.option('--seed', type=int, default=0, show_default=True)
+def generate_synthetic_data(output_dir, publications, authors, seed):
+    """Write a synthetic INSPIRE-like dataset to OUTPUT_DIR."""
+    from .benchmarks.synthetic import generate_synthetic_data
+
+    counts = generate_synthetic_data(output_dir, n_publications=publications, n_authors=authors, seed=seed)
+    for name, count in sorted(counts.items()):
+        click.echo('{:>20}: {}'.format(name, count))
+
+
+@click.command('benchmark')
+@click.argument('work_dir', type=click.Path(file_okay=False))
+@click.option('--scale', 'scales', type=int, multiple=True, help='Number of publications, can be repeated.')
+@click.option('--jobs', type=int, default=1, show_default=True, help='Processes used to fit the models.')
+@click.option('--threads', type=int, default=4, show_default=True, help='Threads scoring the largest block.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Save the results to this JSON file.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Compare with these saved results.')
+@click.option('--tolerance', type=float, default=0.2, show_default=True, help='Relative slowdown ignored as noise.')
+@click.option('--imports/--no-imports', default=True, show_default=True,
+              help='Also time the import of the entry points of the package.')
+def benchmark(work_dir, scales, jobs, threads, output, baseline, tolerance, imports):
+    """Time every stage on synthetic datasets kept in WORK_DIR."""
+    from .benchmarks.suite import compare_results, load_results, run_benchmarks, run_import_benchmarks, save_results
+
+    results = []
+    if imports:
+        results.extend(run_import_benchmarks())
+        for result in results:
+            click.echo('{scale:>9}  {stage:<40} {seconds:10.2f}s  {heavy}'.format(
+                heavy=', '.join(result['heavy_modules']), **result))
+
+    results.extend(run_benchmarks(work_dir, scales or (1000, 10000), n_jobs=jobs, scoring_threads=threads))
+    for result in results:
+        if result['scale'] != 'import':
+            click.echo('{scale:>9}  {stage:<24} {seconds:10.2f}s  {items:>10} items'.format(**result))
+    if output:
+        save_results(output, results)
+
+    if baseline:
+        regressions = compare_results(results, load_results(baseline), tolerance)
+        for regression in regressions:
+            click.echo('REGRESSION {scale:>9}  {stage:<24} {baseline_seconds:.2f}s -> {seconds:.2f}s '
+                       '(x{ratio:.2f})'.format(**regression), err=True)
+        if regressions:
+            raise SystemExit(1)
+
+
+commands = [
+    benchmark,
+    compare_distance_retraining,
+    compare_ethnicity_training,
+    diff_clustering,
+    evaluate_cascade,
+    evaluate_clustering,
+    evaluate_prefilter,
+    evaluate_sparse_clustering,
+    generate_synthetic_data,
+    index_blocks,
+    index_publications,
+    plan_clustering,
+    profile_distance_model,
+    run_pipeline_stages,
+    sweep_thresholds,
+    write_back,
+]
@@ -38,3 +38,309 @@ Note:
     :mod:`inspirehep.modules.disambiguation.core.ml.sampling`.
 
 """
+
+DISAMBIGUATION_CLUSTERING_TASK_MAX_RETRIES = 3
+"""How many times a block that failed on a Celery worker is resubmitted."""
+
+DISAMBIGUATION_CLUSTERING_TASK_POLL_INTERVAL = 1
+"""Seconds between two polls of the pending Celery clustering tasks."""
+
+DISAMBIGUATION_CLUSTERING_CHECKPOINTS = False
+"""Whether to checkpoint every clustered block.
+
+When enabled, every block is saved to
+``DISAMBIGUATION_CLUSTERING_CHECKPOINTS_PATH`` as soon as it is fitted, so
+that running the clustering again after a crash only fits the remaining
+blocks, and a later run with the same distance model and clustering
+parameters only fits the blocks whose signatures changed. Finding the
+changed blocks hashes every signature with its publication, which is worth
+it when only a few blocks change between runs.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_PREFILTER_RULES = []
+"""Rules ruling out signature pairs before calling the distance estimator.
+
+Pairs for which any of these rules gives two different known values, for
+example two different spelled out first names, get the maximum distance
+without going through the distance estimator. See
+:data:`inspire_disambiguation.core.ml.models.PREFILTER_RULES` for the
+available rules, and :func:`inspire_disambiguation.api.evaluate_clustering_prefilter`
+to measure their effect before enabling them.
+
+"""
+
+DISAMBIGUATION_PROMETHEUS_TEXTFILE_PATH = None
+"""Folder where to also write the run reports in the Prometheus text format.
+
+Meant to be the folder read by the textfile collector of the node exporter.
+The JSON run reports are always written to ``DISAMBIGUATION_RUN_REPORTS_PATH``.
+
+"""
+
+DISAMBIGUATION_DISTANCE_FEATURES = None
+"""Names of the features used by the distance model, or ``None`` for all.
+
+Allows to train a model without the features that are expensive to compute
+and bring little accuracy, as reported by the ``profile-distance-model``
+command. The selection is saved with the model, so it only matters when
+training.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_EVALUATION_WORST_BLOCKS = 50
+"""Number of blocks listed in the evaluation report of a clustering run.
+
+Blocks are ordered by how many wrongly clustered signatures they account
+for. The report is written to ``DISAMBIGUATION_CLUSTERING_EVALUATION_PATH``
+after every clustering run.
+
+"""
+
+DISAMBIGUATION_ETHNICITY_STREAMING = False
+"""Whether to train the ethnicity model with bounded memory.
+
+When enabled, ``ethnicity.csv`` is read in chunks of
+``DISAMBIGUATION_ETHNICITY_CHUNK_SIZE`` rows, names are hashed into
+character n-grams and the classifier is trained by stochastic gradient
+descent, ``DISAMBIGUATION_ETHNICITY_EPOCHS`` times over the file. Use the
+``compare-ethnicity-training`` command to check its accuracy first.
+
+"""
+
+DISAMBIGUATION_ETHNICITY_CHUNK_SIZE = 100000
+"""Number of rows of ``ethnicity.csv`` in memory when training in chunks."""
+
+DISAMBIGUATION_ETHNICITY_EPOCHS = 5
+"""Number of passes over ``ethnicity.csv`` when training in chunks."""
+
+DISAMBIGUATION_ETHNICITY_HOLDOUT_EVERY = 10
+"""One row out of this many is held out when comparing training modes."""
+
+DISAMBIGUATION_DISTANCE_N_JOBS = 8
+"""Number of processes computing the features when training the distance model.
+
+Every feature is fitted in its own task, then applied to chunks of
+``DISAMBIGUATION_DISTANCE_CHUNK_SIZE`` sampled pairs.
+
+"""
+
+DISAMBIGUATION_DISTANCE_CHUNK_SIZE = 50000
+"""Number of sampled pairs whose features are computed by a single task."""
+
+DISAMBIGUATION_DISTANCE_FOREST_N_JOBS = 8
+"""Number of threads fitting the random forest of the distance model."""
+
+DISAMBIGUATION_EXPORT_N_JOBS = 4
+"""Number of processes building publications and signatures when exporting.
+
+Records are read from the DB by a separate thread and sent to these
+processes in batches of ``DISAMBIGUATION_EXPORT_BATCH_SIZE``, so that reading
+and building overlap. With ``1`` everything happens in the calling thread.
+
+"""
+
+DISAMBIGUATION_EXPORT_BATCH_SIZE = 1000
+"""Number of records fetched from the DB and built by a process at once."""
+
+DISAMBIGUATION_SAMPLED_PAIRS_BINARY = False
+"""Whether to save the sampled pairs as signature positions in a NumPy file.
+
+When enabled, the pairs are saved to ``DISAMBIGUATION_SAMPLED_PAIRS_INDEX_PATH``
+instead of ``DISAMBIGUATION_SAMPLED_PAIRS_PATH``, as positions in the curated
+signatures file they were sampled from, which the distance model loads at
+once instead of parsing a line per pair.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_DIFF_CHUNK_SIZE = 1000000
+"""Number of signatures sorted in memory at once when diffing clusterings.
+
+The ``diff-clustering`` and ``write-back`` commands sort the input clusters
+or the cluster assignments of the last run on disk, in runs of this many
+signatures.
+
+"""
+
+DISAMBIGUATION_WRITE_BACK_BATCH_SIZE = 1000
+"""Number of Literature records updated by a single statement on write-back.
+
+Every batch is copied into a staging table and applied in its own
+transaction, so a failed write-back keeps the batches already committed.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_SPARSE_MIN_SIZE = None
+"""Size from which blocks only score the pairs of signatures likely to match.
+
+In blocks with at least this many signatures, candidate pairs are found by
+MinHash LSH over the name components, coauthors, title and affiliation of
+the signatures, and only these are scored by the distance model. The other
+pairs get the maximum distance, and the blocks are clustered with an
+average linkage whose memory grows with the candidate pairs instead of the
+square of the block size. ``None`` scores all pairs of all blocks. Use the
+``evaluate-sparse-clustering`` command to measure the effect first.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_LSH_BANDS = 32
+"""Number of LSH bands used to find candidate pairs in large blocks.
+
+Two signatures whose token sets have a Jaccard similarity ``s`` are
+candidates with probability ``1 - (1 - s ** ROWS) ** BANDS``, with
+``DISAMBIGUATION_CLUSTERING_LSH_ROWS`` values per band.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_LSH_ROWS = 2
+"""Number of MinHash values per LSH band."""
+
+DISAMBIGUATION_CLUSTERING_LSH_MAX_BUCKET_SIZE = 100
+"""Largest LSH bucket whose pairs of signatures are all candidates.
+
+Members of larger buckets, e.g. signatures sharing a common first name and
+little else, are only paired with this many others, so that the number of
+candidate pairs stays linear.
+
+"""
+
+DISAMBIGUATION_PUBLICATIONS_LAZY = False
+"""Whether clustering reads publications when used instead of loading them.
+
+When enabled, only the ids of the publications are kept in memory, and
+their fields are read from ``publications.jsonl`` through its offset index
+``DISAMBIGUATION_PUBLICATIONS_INDEX_PATH`` when a block needs them, keeping
+the most recently used ones decoded. Memory then depends on the blocks being
+clustered rather than on the number of publications. The index is written
+when exporting the publications, or by the ``index-publications`` command.
+Training the distance model always loads the publications, as it reads them
+over and over.
+
+"""
+
+DISAMBIGUATION_PUBLICATIONS_CACHE_SIZE = 10000
+"""Number of publications kept decoded with ``DISAMBIGUATION_PUBLICATIONS_LAZY``.
+
+The publications of a block are decoded once when it is fitted, so this
+only has to hold the publications shared by the blocks fitted in a row.
+
+"""
+
+DISAMBIGUATION_SAMPLED_PAIRS_SEED = None
+"""Seed making the sampling of signature pairs reproducible.
+
+When set, blocks are split into ``DISAMBIGUATION_SAMPLED_PAIRS_N_JOBS``
+partitions sampled in parallel, each with its own random generator derived
+from this seed, so that sampling again the same signatures with the same
+seed and number of processes gives the same pairs. ``None`` samples all
+blocks in a single process, differently every time.
+
+"""
+
+DISAMBIGUATION_SAMPLED_PAIRS_N_JOBS = 4
+"""Number of processes sampling signature pairs when a seed is set.
+
+Changing it changes the sampled pairs.
+
+"""
+
+DISAMBIGUATION_DISTANCE_WARM_START = False
+"""Whether to refresh the distance model instead of training it from scratch.
+
+When enabled and a distance model exists, its features are kept as they
+are and ``DISAMBIGUATION_DISTANCE_WARM_START_TREES`` trees fitted on the
+sampled pairs are added to its forest, dropping the oldest trees beyond
+``DISAMBIGUATION_DISTANCE_MAX_TREES``. ``DISAMBIGUATION_DISTANCE_FEATURES``
+is then ignored. Use the ``compare-distance-retraining`` command to compare
+the result with a full training first.
+
+"""
+
+DISAMBIGUATION_DISTANCE_WARM_START_TREES = 100
+"""Number of trees added to the distance model by a warm start."""
+
+DISAMBIGUATION_DISTANCE_MAX_TREES = 500
+"""Number of trees kept in the distance model after a warm start, or ``None``."""
+
+DISAMBIGUATION_DISTANCE_HOLDOUT_EVERY = 0
+"""One author out of this many is held out of the training of the distance model.
+
+The sampled pairs with a signature of these authors are never trained on, so
+that the ``compare-distance-retraining`` command scores the current and the
+retrained models on pairs none of them has seen. This trains the production
+model on fewer pairs, e.g. about a fifth less with ``10``, so only set it,
+and train the current model with it, before comparing retrainings. ``0``
+trains on all the pairs and disables that command.
+
+"""
+
+DISAMBIGUATION_DISTANCE_CASCADE = False
+"""Whether pairs are scored by a cheap distance model before the full one.
+
+When enabled, training the distance model also trains a small model on the
+name and coauthor features only, see
+:data:`inspire_disambiguation.core.ml.models.CASCADE_FEATURES`, saved to
+``DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH``. Clustering then scores all
+pairs with it, and only the pairs it is unsure about, whose distance is
+within ``DISAMBIGUATION_DISTANCE_CASCADE_BAND``, with the full model. Use
+the ``evaluate-cascade`` command to measure the effect first.
+
+"""
+
+DISAMBIGUATION_DISTANCE_CASCADE_TREES = 50
+"""Number of trees of the cheap distance model of the cascade."""
+
+DISAMBIGUATION_DISTANCE_CASCADE_BAND = [0.1, 0.9]
+"""Distances of the cheap model for which pairs are scored by the full one.
+
+The wider the band, the closer the clustering to the one of the full model
+alone, and the slower.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_THREADED_MIN_SIZE = 2000
+"""Size from which blocks score their pairs on several threads.
+
+Blocks are fitted in parallel, but a block is scored by a single process,
+so that the largest blocks, fitted last, leave the other cores idle. Blocks
+with at least this many signatures score their chunks of pairs on
+``DISAMBIGUATION_CLUSTERING_SCORING_THREADS`` threads instead. The distances
+are the same. ``None`` scores every block on a single thread.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_SCORING_THREADS = 8
+"""Maximum number of threads scoring the pairs of a large block.
+
+When clustering on ``DISAMBIGUATION_CLUSTERING_N_JOBS`` processes, the larger
+of the two is shared between the blocks being fitted, so that a block only
+gets more than one thread once other processes have no block left.
+
+"""
+
+DISAMBIGUATION_PRECOMPUTED_BLOCKS = False
+"""Whether to read the blocks of the signatures instead of computing them.
+
+The ``index-blocks`` command, also a stage of the pipeline, blocks the
+exported signatures as for clustering and saves the block of every
+signature, with the signatures of every block, to
+``DISAMBIGUATION_SIGNATURE_BLOCKS_PATH``. When enabled, clustering and
+planning read the blocks from there instead of encoding all the names again,
+and sampling pairs uses these blocks instead of the ``signature_block`` of
+the signatures, so that training pairs come from the blocks actually
+clustered, which changes the sampled pairs.
+
+"""
+
+DISAMBIGUATION_CLUSTERING_UNCURATED = False
+"""Whether to cluster the uncurated signatures with the curated ones.
+
+When enabled, the uncurated signatures exported to
+``DISAMBIGUATION_UNCURATED_SIGNATURES_PATH`` are clustered with no known
+cluster, so that the ``write-back`` command can give them the author of the
+curated signatures of their cluster. They are not used by the evaluation of
+the clusters, but make the blocks larger and change them, so the blocks,
+the sampled pairs and the clustering have to be computed again. Without it,
+``write-back`` has nothing to write.
+
+"""
@@ -24,8 +24,16 @@
 
 from __future__ import absolute_import, division, print_function
 
+import json
+import multiprocessing
+import threading
+from collections import deque
+from functools import partial
+
+from flask import current_app
+from six.moves import queue
 # from elasticsearch_dsl import Q
-from sqlalchemy import type_coerce
+from sqlalchemy import Text, cast, type_coerce
 from sqlalchemy.dialects.postgresql import JSONB
 
 from inspire_schemas.readers import LiteratureReader
@@ -47,44 +55,75 @@ SIGNATURE_FIELDS = [
 ]
 
 
-def get_all_signatures():
+def get_all_signatures(n_jobs=1, batch_size=1000, serialize=False):
     """Get all signatures from the DB.
 
     Walks through all Literature records and collects all signatures
     in order to build the running set for ``BEARD``.
 
+    Args:
+        n_jobs(int): the number of processes building the signatures, see
+            :func:`_map_batches`.
+        batch_size(int): the number of records sent to a process at once.
+        serialize(bool): yield ``(signature, line)`` pairs instead, see
+            :func:`_serialize`.
+
     Yields:
         dict: a signature.
 
     """
-    query = RecordMetadata.query.with_entities(RecordMetadata.json).filter(
-        type_coerce(RecordMetadata.json, JSONB)['_collections'].contains(['Literature']))
+    build = partial(_serialize, _build_signatures) if serialize else _build_signatures
+    for signatures in _map_batches(build, _get_literature_batches(batch_size), n_jobs):
+        for signature in signatures:
+            yield signature
 
-    for record in query.yield_per(1000):
-        publication_id = record.json['control_number']
-        for author in record.json.get('authors', []):
-            yield _build_signature(author, publication_id)
 
-
-def get_all_curated_signatures():
+def get_all_curated_signatures(n_jobs=1, batch_size=1000, serialize=False):
     """Get all curated signatures from the DB.
 
     Walks through all Literature records and collects all signatures
     that were marked as curated in order to build the training set
     for ``BEARD``.
 
+    Args:
+        n_jobs(int): the number of processes building the signatures, see
+            :func:`_map_batches`.
+        batch_size(int): the number of records sent to a process at once.
+        serialize(bool): yield ``(signature, line)`` pairs instead, see
+            :func:`_serialize`.
+
     Yields:
         dict: a curated signature.
 
     """
-    query = RecordMetadata.query.with_entities(RecordMetadata.json).filter(
-        type_coerce(RecordMetadata.json, JSONB)['_collections'].contains(['Literature']))
+    build = partial(_serialize, _build_curated_signatures) if serialize else _build_curated_signatures
+    for signatures in _map_batches(build, _get_literature_batches(batch_size), n_jobs):
+        for signature in signatures:
+            yield signature
 
-    for record in query.yield_per(1000):
-        publication_id = record.json['control_number']
-        for author in record.json.get('authors', []):
-            if author.get('curated_relation'):
-                yield _build_signature(author, publication_id)
+
+def get_all_uncurated_signatures(n_jobs=1, batch_size=1000, serialize=False):
+    """Get all uncurated signatures from the DB.
+
+    Walks through all Literature records and collects all signatures
+    that were not marked as curated, which ``BEARD`` clusters with the
+    curated ones to find their author.
+
+    Args:
+        n_jobs(int): the number of processes building the signatures, see
+            :func:`_map_batches`.
+        batch_size(int): the number of records sent to a process at once.
+        serialize(bool): yield ``(signature, line)`` pairs instead, see
+            :func:`_serialize`.
+
+    Yields:
+        dict: an uncurated signature.
+
+    """
+    build = partial(_serialize, _build_uncurated_signatures) if serialize else _build_uncurated_signatures
+    for signatures in _map_batches(build, _get_literature_batches(batch_size), n_jobs):
+        for signature in signatures:
+            yield signature
 
 
 # def get_signatures_matching_a_phonetic_encoding(phonetic_encoding):
@@ -109,21 +148,157 @@ def get_all_curated_signatures():
 #                 yield _build_signature(author, publication_id)
 
 
-def get_all_publications():
+def get_all_publications(n_jobs=1, batch_size=1000, serialize=False):
     """Get all publications from the DB.
 
     Walks through all Literature records and collects all information
     that will be useful for ``BEARD`` during training and prediction.
 
+    Args:
+        n_jobs(int): the number of processes building the publications, see
+            :func:`_map_batches`.
+        batch_size(int): the number of records sent to a process at once.
+        serialize(bool): yield ``(publication, line)`` pairs instead, see
+            :func:`_serialize`.
+
     Yields:
         dict: a publication.
 
     """
-    query = RecordMetadata.query.with_entities(RecordMetadata.json).filter(
+    build = partial(_serialize, _build_publications) if serialize else _build_publications
+    for publications in _map_batches(build, _get_literature_batches(batch_size), n_jobs):
+        for publication in publications:
+            yield publication
+
+
+def _get_literature_batches(batch_size):
+    """Stream the JSON of all Literature records, undecoded, in batches.
+
+    Records are fetched as text so that decoding them is left to whoever
+    builds the publications or signatures, possibly in another process.
+    """
+    query = RecordMetadata.query.with_entities(cast(RecordMetadata.json, Text)).filter(
         type_coerce(RecordMetadata.json, JSONB)['_collections'].contains(['Literature']))
 
-    for record in query.yield_per(1000):
-        yield _build_publication(record.json)
+    batch = []
+    for record, in query.yield_per(batch_size):
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _map_batches(build, batches, n_jobs):
+    """Apply ``build`` to every batch of records, yielding results in order.
+
+    With more than one job, a thread streams the batches from the DB into a
+    bounded queue while a pool of ``n_jobs`` processes builds them, and the
+    caller consumes the results in the original order. At most ``2 * n_jobs``
+    batches wait in the queue and as many are being built, so a slow
+    consumer makes the DB reads wait instead of filling the memory.
+    """
+    if n_jobs == 1:
+        for batch in batches:
+            yield build(batch)
+        return
+
+    max_pending = 2 * n_jobs
+    batch_queue = queue.Queue(maxsize=max_pending)
+    done = object()
+    stop = threading.Event()
+    app = current_app._get_current_object()
+
+    def produce():
+        # The DB session is bound to the application context of the thread.
+        with app.app_context():
+            try:
+                for batch in batches:
+                    while not stop.is_set():
+                        try:
+                            batch_queue.put(batch, timeout=1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                batch_queue.put(done)
+            except Exception as e:
+                batch_queue.put(e)
+
+    # Fork the workers before starting the thread, which could hold locks
+    # that the children would inherit.
+    pool = multiprocessing.Pool(n_jobs)
+    producer = threading.Thread(target=produce, name='disambiguation-db-reader')
+    producer.daemon = True
+    producer.start()
+
+    pending = deque()
+    try:
+        while True:
+            batch = batch_queue.get()
+            if batch is done:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            pending.append(pool.apply_async(build, (batch,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        stop.set()
+        pool.terminate()
+
+
+def _serialize(build, records):
+    """Build a batch of records and serialize the results to JSON lines.
+
+    Run by the workers of :func:`_map_batches`, so that the export only has
+    to write the lines, in order, instead of serializing them serially.
+
+    Returns:
+        list: the ``(item, line)`` pairs of the built items.
+
+    """
+    return [(item, json.dumps(item) + '\n') for item in build(records)]
+
+
+def _build_publications(records):
+    return [_build_publication(json.loads(record)) for record in records]
+
+
+def _build_signatures(records):
+    signatures = []
+    for record in records:
+        record = json.loads(record)
+        publication_id = record['control_number']
+        for author in record.get('authors', []):
+            signatures.append(_build_signature(author, publication_id))
+    return signatures
+
+
+def _build_curated_signatures(records):
+    signatures = []
+    for record in records:
+        record = json.loads(record)
+        publication_id = record['control_number']
+        for author in record.get('authors', []):
+            if author.get('curated_relation'):
+                signatures.append(_build_signature(author, publication_id))
+    return signatures
+
+
+def _build_uncurated_signatures(records):
+    signatures = []
+    for record in records:
+        record = json.loads(record)
+        publication_id = record['control_number']
+        for author in record.get('authors', []):
+            if not author.get('curated_relation'):
+                signatures.append(_build_signature(author, publication_id))
+    return signatures
 
 
 def _build_publication(record):
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Disambiguation core DB writers."""
+
+from __future__ import absolute_import, division, print_function
+
+import csv
+import json
+import logging
+import time
+
+import six
+from invenio_db import db
+
+from inspire_dojson.utils import get_record_ref
+
+
+LOGGER = logging.getLogger(__name__)
+
+_CREATE_STAGING_TABLE = '''
+CREATE TEMPORARY TABLE IF NOT EXISTS disambiguation_author_assignments (
+    publication_id integer NOT NULL,
+    signature_uuid text NOT NULL,
+    record jsonb NOT NULL
+) ON COMMIT DELETE ROWS
+'''
+
+_COPY_STAGING_TABLE = '''
+COPY disambiguation_author_assignments (publication_id, signature_uuid, record)
+FROM STDIN WITH (FORMAT csv)
+'''
+
+# Rebuilds the authors of every staged record in a single statement, setting
+# the reference of the staged signatures unless they were curated meanwhile.
+_UPDATE_AUTHORS = '''
+UPDATE records_metadata AS r
+SET json = jsonb_set(r.json, '{authors}', updated.authors),
+    version_id = r.version_id + 1,
+    updated = timezone('utc', now())
+FROM (
+    SELECT m.id, jsonb_agg(
+        CASE
+            WHEN s.record IS NULL OR coalesce((a.author->>'curated_relation')::boolean, false)
+            THEN a.author
+            ELSE a.author || jsonb_build_object('record', s.record)
+        END
+        ORDER BY a.position
+    ) AS authors
+    FROM (SELECT DISTINCT publication_id FROM disambiguation_author_assignments) AS p
+    JOIN pidstore_pid AS pid
+        ON pid.pid_type = 'lit' AND pid.pid_value = p.publication_id::text AND pid.status = 'R'
+    JOIN records_metadata AS m ON m.id = pid.object_uuid
+    CROSS JOIN LATERAL jsonb_array_elements(m.json->'authors') WITH ORDINALITY AS a(author, position)
+    LEFT JOIN disambiguation_author_assignments AS s
+        ON s.publication_id = p.publication_id AND s.signature_uuid = a.author->>'uuid'
+    GROUP BY m.id
+) AS updated
+WHERE r.id = updated.id
+RETURNING r.id, r.created, r.updated, r.json, r.version_id
+'''
+
+_UPDATE_RECORDS = '''
+WITH updated_records AS ({update_records})
+SELECT id FROM updated_records
+'''.format(update_records=_UPDATE_AUTHORS)
+
+# Same, also storing the new revision of every record as SQLAlchemy-Continuum
+# would, with the ``validity`` strategy of invenio-db: the current revision
+# ends with the given transaction, which starts the new one.
+_UPDATE_VERSIONED_RECORDS = '''
+WITH updated_records AS ({update_records}),
+ended_versions AS (
+    UPDATE records_metadata_version AS v
+    SET end_transaction_id = %(transaction_id)s
+    FROM updated_records AS u
+    WHERE v.id = u.id AND v.end_transaction_id IS NULL
+)
+INSERT INTO records_metadata_version
+    (id, created, updated, json, version_id, transaction_id, end_transaction_id, operation_type)
+SELECT id, created, updated, json, version_id, %(transaction_id)s, NULL, 1
+FROM updated_records
+RETURNING id
+'''.format(update_records=_UPDATE_AUTHORS)
+
+_INSERT_TRANSACTION = '''
+INSERT INTO transaction (issued_at) VALUES (timezone('utc', now())) RETURNING id
+'''
+
+
+def write_author_assignments(assignments, batch_size=1000, versioning=True, reindex=None):
+    """Set the author of signatures in the Literature records, in bulk.
+
+    Every batch is copied with ``COPY`` into a temporary staging table, then
+    applied to all its records by a single ``UPDATE`` and committed. Only
+    the ``record`` of the given signatures changes, and signatures curated
+    since the assignments were computed are left alone. As this bypasses
+    invenio-records, the new revision of the records is stored by the same
+    transaction, and the updated records are handed to ``reindex`` once
+    committed.
+
+    Args:
+        assignments(iterable): ``(publication_id, signature_uuid, author_id)``
+            tuples, grouped by publication.
+        batch_size(int): the number of records updated by a statement.
+        versioning(bool): whether to store the revisions of the records in
+            ``records_metadata_version``, as with ``DB_VERSIONING``.
+        reindex(callable): if given, called with the ids of the records
+            updated by every committed batch, for example
+            :meth:`invenio_indexer.api.RecordIndexer.bulk_index`.
+
+    Returns:
+        dict: the number of updated ``records``, of staged ``signatures``
+        and the total ``seconds``.
+
+    """
+    start = time.time()
+    counts = {'records': 0, 'signatures': 0}
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(_CREATE_STAGING_TABLE)
+        connection.commit()
+
+        for batch in _batches_by_publication(assignments, batch_size):
+            buffer = six.StringIO()
+            writer = csv.writer(buffer)
+            for publication_id, signature_uuid, author_id in batch:
+                writer.writerow([publication_id, signature_uuid, json.dumps(get_record_ref(author_id, 'authors'))])
+            buffer.seek(0)
+
+            cursor.copy_expert(_COPY_STAGING_TABLE, buffer)
+            if versioning:
+                cursor.execute(_INSERT_TRANSACTION)
+                transaction_id, = cursor.fetchone()
+                cursor.execute(_UPDATE_VERSIONED_RECORDS, {'transaction_id': transaction_id})
+            else:
+                cursor.execute(_UPDATE_RECORDS)
+            record_ids = [record_id for record_id, in cursor.fetchall()]
+            counts['records'] += len(record_ids)
+            counts['signatures'] += len(batch)
+            connection.commit()
+
+            if reindex is not None and record_ids:
+                reindex(record_ids)
+
+            elapsed = time.time() - start
+            LOGGER.info('Updated %d records with %d signatures (%.0f records/s)',
+                        counts['records'], counts['signatures'], counts['records'] / max(elapsed, 1e-9))
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    counts['seconds'] = time.time() - start
+    return counts
+
+
+def _batches_by_publication(assignments, batch_size):
+    """Split assignments grouped by publication into batches of whole publications."""
+    batch = []
+    n_publications = 0
+    for assignment in assignments:
+        if not batch or assignment[0] != batch[-1][0]:
+            if n_publications == batch_size:
+                yield batch
+                batch = []
+                n_publications = 0
+            n_publications += 1
+        batch.append(assignment)
+    if batch:
+        yield batch
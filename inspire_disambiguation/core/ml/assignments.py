@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation core ML assignments."""
+
+from __future__ import absolute_import, division, print_function
+
+import heapq
+import json
+import os
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+import six
+
+from ...utils import open_file_in_folder
+
+
+class AssignmentWriter(object):
+    """Write the cluster of every signature as soon as its block is fitted.
+
+    Every line of the output is a JSON object with the ``signature_uuid``,
+    the ``publication_id``, the ``block`` and the ``cluster_id`` of a
+    signature. Cluster ids are unique over the whole file and allocated in
+    the order blocks are written, so they do not match the labels of the
+    fitted ``BlockClustering``. The file is written next to its final name
+    and only renamed when closed, so it is either complete or missing.
+
+    Args:
+        output_filename(str): the ``.jsonl`` file to write.
+
+    """
+
+    def __init__(self, output_filename):
+        self.output_filename = output_filename
+        self.n_blocks = 0
+        self.n_clusters = 0
+        self.n_signatures = 0
+
+    def __enter__(self):
+        self._context = open_file_in_folder(self.output_filename + '.tmp', 'w')
+        self._fd = self._context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            os.rename(self.output_filename + '.tmp', self.output_filename)
+        else:
+            os.remove(self.output_filename + '.tmp')
+
+    def write_block(self, block, X, labels):
+        """Write the signatures of a fitted block.
+
+        Args:
+            block(str): the key of the block.
+            X(numpy.ndarray): the signatures of the block, shape ``(n, 1)``.
+            labels(numpy.ndarray): the cluster label of every signature
+                within the block.
+
+        """
+        _, labels = np.unique(labels, return_inverse=True)
+        for signature, label in zip(X[:, 0], labels):
+            self._fd.write(json.dumps({
+                'signature_uuid': signature.signature_uuid,
+                'publication_id': signature.publication.publication_id,
+                'block': block,
+                'cluster_id': self.n_clusters + int(label),
+            }) + '\n')
+
+        self.n_blocks += 1
+        self.n_clusters += int(labels.max()) + 1 if len(labels) else 0
+        self.n_signatures += len(labels)
+
+
+def iter_assignments(input_filename):
+    """Iterate over the lines of a file written by :class:`AssignmentWriter`."""
+    with open(input_filename, 'r') as fd:
+        for line in fd:
+            yield json.loads(line)
+
+
+def iter_author_assignments(assignments_path, signatures_path, chunk_size=1000000):
+    """Get the author of the uncurated signatures, grouped by publication.
+
+    A cluster belongs to the author of most of its curated signatures, ties
+    going to the smallest author id. Uncurated signatures of a cluster with
+    no curated signature are not assigned to any author. Only the curated
+    signatures and the clusters of a single block are held in memory, while
+    the assignments are sorted by publication on disk.
+
+    Args:
+        assignments_path(str): a file written by :class:`AssignmentWriter`.
+        signatures_path(str): the ``curated_signatures.jsonl`` file.
+        chunk_size(int): the number of signatures sorted in memory at once.
+
+    Yields:
+        tuple: ``(publication_id, signature_uuid, author_id)``, sorted by
+        publication id.
+
+    """
+    author_ids = {}
+    with open(signatures_path, 'r') as fd:
+        for line in fd:
+            signature = json.loads(line)
+            if signature.get('author_id'):
+                author_ids[signature['signature_uuid']] = signature['author_id']
+
+    blocks = _groupby_first(
+        (assignment['block'], assignment) for assignment in iter_assignments(assignments_path))
+
+    with _ExternalSorter(chunk_size) as by_publication:
+        for block in blocks:
+            clusters = defaultdict(list)
+            for _, assignment in block:
+                clusters[assignment['cluster_id']].append(assignment)
+
+            for assignments in six.itervalues(clusters):
+                curated = sorted(
+                    author_ids[assignment['signature_uuid']] for assignment in assignments
+                    if assignment['signature_uuid'] in author_ids
+                )
+                if not curated:
+                    continue
+                author_id = _count_second([(None, author_id) for author_id in curated])[0][0]
+                for assignment in assignments:
+                    if assignment['signature_uuid'] not in author_ids:
+                        by_publication.add((assignment['publication_id'], assignment['signature_uuid'], author_id))
+
+        for row in by_publication:
+            yield row
+
+
+class _ExternalSorter(object):
+    """Sort more tuples than fit in memory.
+
+    Tuples are kept in memory ``chunk_size`` at a time, then sorted and
+    spilled to a temporary file. Iterating merges the spilled runs.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self._chunk = []
+        self._runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for run in self._runs:
+            run.close()
+
+    def add(self, item):
+        self._chunk.append(item)
+        if len(self._chunk) >= self.chunk_size:
+            self._spill()
+
+    def __iter__(self):
+        if not self._runs:
+            return iter(sorted(self._chunk))
+        if self._chunk:
+            self._spill()
+        return heapq.merge(*[self._read_run(run) for run in self._runs])
+
+    def _spill(self):
+        run = tempfile.TemporaryFile(mode='w+')
+        for item in sorted(self._chunk):
+            run.write(json.dumps(item) + '\n')
+        self._runs.append(run)
+        self._chunk = []
+
+    @staticmethod
+    def _read_run(run):
+        run.seek(0)
+        for line in run:
+            yield tuple(json.loads(line))
+
+
+def _groupby_first(items):
+    """Group consecutive tuples by their first element."""
+    group = []
+    for item in items:
+        if group and item[0] != group[0][0]:
+            yield group
+            group = []
+        group.append(item)
+    if group:
+        yield group
+
+
+def diff_assignments(input_clusters_path, assignments_path, output_filename, chunk_size=1000000):
+    """Compare the output of a clustering run with the input clusters.
+
+    Neither file is loaded in memory: both are sorted by signature on disk,
+    joined, then sorted again by input and by output cluster, holding at
+    most ``chunk_size`` signatures and a single cluster in memory at a time.
+
+    Every line of the output is a JSON object whose ``type`` is one of:
+
+    * ``split``: an input cluster whose signatures ended up in several
+      output clusters, listed with how many of its signatures each got;
+    * ``merge``: an output cluster holding signatures of several input
+      clusters, listed the same way;
+    * ``moved``: a signature not in the output cluster holding most of the
+      signatures of its input cluster;
+    * ``missing``: a signature of the input clusters that was not assigned;
+    * ``new``: an assigned signature absent from the input clusters.
+
+    Args:
+        input_clusters_path(str): the ``input_clusters.jsonl`` file.
+        assignments_path(str): a file written by :class:`AssignmentWriter`.
+        output_filename(str): the ``.jsonl`` file to write.
+        chunk_size(int): the number of signatures sorted in memory at once.
+
+    Returns:
+        dict: the number of ``signatures`` found in both files, and of
+        records of every type.
+
+    """
+    def rows():
+        with open(input_clusters_path, 'r') as fd:
+            for line in fd:
+                cluster = json.loads(line)
+                for signature_uuid in cluster['signature_uuids']:
+                    yield (signature_uuid, 0, cluster['cluster_id'])
+        for assignment in iter_assignments(assignments_path):
+            yield (assignment['signature_uuid'], 1, assignment['cluster_id'])
+
+    summary = dict.fromkeys(('signatures', 'split', 'merge', 'moved', 'missing', 'new'), 0)
+
+    with _ExternalSorter(chunk_size) as by_signature, \
+            _ExternalSorter(chunk_size) as by_input, \
+            _ExternalSorter(chunk_size) as by_output, \
+            open_file_in_folder(output_filename, 'w') as fd:
+
+        def write(record):
+            summary[record['type']] += 1
+            fd.write(json.dumps(record) + '\n')
+
+        for row in rows():
+            by_signature.add(row)
+
+        for group in _groupby_first(by_signature):
+            signature_uuid = group[0][0]
+            input_ids = [cluster_id for _, side, cluster_id in group if side == 0]
+            output_ids = [cluster_id for _, side, cluster_id in group if side == 1]
+            if not output_ids:
+                write({'type': 'missing', 'signature_uuid': signature_uuid, 'input_cluster_id': input_ids[0]})
+            elif not input_ids:
+                write({'type': 'new', 'signature_uuid': signature_uuid, 'output_cluster_id': output_ids[0]})
+            else:
+                summary['signatures'] += 1
+                by_input.add((input_ids[0], output_ids[0], signature_uuid))
+                by_output.add((output_ids[0], input_ids[0]))
+
+        for group in _groupby_first(by_input):
+            counts = _count_second(group)
+            if len(counts) == 1:
+                continue
+            write({'type': 'split', 'input_cluster_id': group[0][0], 'output_clusters': counts})
+            main_id = counts[0][0]
+            for input_id, output_id, signature_uuid in group:
+                if output_id != main_id:
+                    write({
+                        'type': 'moved',
+                        'signature_uuid': signature_uuid,
+                        'input_cluster_id': input_id,
+                        'output_cluster_id': output_id,
+                        'main_output_cluster_id': main_id,
+                    })
+
+        for group in _groupby_first(by_output):
+            counts = _count_second(group)
+            if len(counts) > 1:
+                write({'type': 'merge', 'output_cluster_id': group[0][0], 'input_clusters': counts})
+
+    return summary
+
+
+def _count_second(group):
+    """Count the second elements of sorted tuples, most frequent first.
+
+    Returns:
+        list: pairs of ``(value, count)``, ties broken by the smallest value.
+
+    """
+    counts = []
+    for item in group:
+        if counts and counts[-1][0] == item[1]:
+            counts[-1][1] += 1
+        else:
+            counts.append([item[1], 1])
+    counts.sort(key=lambda count: -count[1])
+    return counts
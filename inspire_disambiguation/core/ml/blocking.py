@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation core ML blocking.
+
+The blocks are kept in an index next to the signatures files rather than
+in the signatures themselves. Blocking depends on all the signatures at
+once, including the uncurated ones when they are clustered, so it cannot be
+done line by line while exporting, and the exported files stay the same, so
+that the stages depending on them are not run again when only the blocks
+change.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+
+from ...utils import hash_file, open_file_in_folder
+
+BLOCK_INDEX_VERSION = 2
+
+
+def get_block_function():
+    """Return the blocking function of :class:`~.models.Clusterer`.
+
+    Signatures are blocked by the NYSIIS encoding of their author name. The
+    function takes an array of shape ``(n, 1)`` of signatures, or of any
+    mapping with an ``author_name``, and returns the block of each of them.
+    """
+    from beard.clustering import block_phonetic
+
+    # threshold determines when to split blocks into smaller ones adding first initial
+    return partial(block_phonetic, threshold=0, phonetic_algorithm='nysiis')
+
+
+def group_blocks(blocks):
+    """Group the positions of the signatures by block.
+
+    Args:
+        blocks(numpy.ndarray): the block of each signature, as returned by
+            the blocking function.
+
+    Returns:
+        list: pairs of ``(block, indices)``, sorted by block.
+
+    """
+    if not len(blocks):
+        return []
+
+    order = np.argsort(blocks, kind='mergesort')
+    sorted_blocks = blocks[order]
+    boundaries = np.flatnonzero(sorted_blocks[1:] != sorted_blocks[:-1]) + 1
+    return [(blocks[indices[0]], indices) for indices in np.split(order, boundaries)]
+
+
+def compute_signature_blocks(signatures_path, uncurated_signatures_path=None):
+    """Block the signatures of a file as :class:`~.models.Clusterer` does.
+
+    Only the author names are read, no model nor publication is loaded. The
+    blocks depend on all the signatures, as names with several surnames go
+    to the block of the most common one, so they are computed at once.
+
+    Args:
+        signatures_path(str): the signatures file to block.
+        uncurated_signatures_path(str): if given, its signatures are
+            blocked together with, and after, the ones of
+            ``signatures_path``.
+
+    Returns:
+        numpy.ndarray: the block of every distinct signature, in order of
+        first appearance, which is the order of
+        :func:`~.models.load_signatures`.
+
+    """
+    names_by_uuid = OrderedDict()
+    for path in _signatures_paths(signatures_path, uncurated_signatures_path):
+        with open(path, 'r') as fd:
+            for line in fd:
+                signature = json.loads(line)
+                names_by_uuid[signature['signature_uuid']] = signature['author_name']
+
+    if not names_by_uuid:
+        return np.array([], dtype=np.unicode_)
+
+    X = np.empty((len(names_by_uuid), 1), dtype=np.object)
+    for i, author_name in enumerate(names_by_uuid.values()):
+        X[i, 0] = {'author_name': author_name}
+    return get_block_function()(X)
+
+
+def save_block_index(output_filename, signatures_path, blocks, uncurated_signatures_path=None):
+    """Save the block of every signature and the signatures of every block.
+
+    The ``.npz`` file holds the sorted distinct ``blocks``, the
+    ``block_ids`` of every signature, i.e. the position of its block in
+    ``blocks``, the ``rows`` of the signatures grouped by block, so that the
+    signatures of the ``k``-th block are ``rows[offsets[k]:offsets[k + 1]]``,
+    and a JSON ``manifest`` with the SHA-1 of ``signatures_path`` and of
+    ``uncurated_signatures_path``, so that the blocks are never applied to
+    other signatures files.
+
+    Args:
+        output_filename(str): the ``.npz`` file to write.
+        signatures_path(str): the signatures file that was blocked.
+        blocks(numpy.ndarray): the block of every signature, as returned by
+            :func:`compute_signature_blocks`.
+        uncurated_signatures_path(str): the uncurated signatures file that
+            was blocked with ``signatures_path``, if any.
+
+    Returns:
+        int: the number of blocks.
+
+    """
+    names, block_ids = np.unique(blocks, return_inverse=True)
+    rows = np.argsort(block_ids, kind='mergesort')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(block_ids, minlength=len(names)))))
+
+    manifest = {
+        'version': BLOCK_INDEX_VERSION,
+        'signatures_sha1': hash_file(signatures_path),
+        'uncurated_signatures_sha1': uncurated_signatures_path and hash_file(uncurated_signatures_path),
+        'signatures': len(blocks),
+        'blocks': len(names),
+    }
+    with open_file_in_folder(output_filename, 'wb') as fd:
+        np.savez(
+            fd,
+            blocks=names.astype(np.unicode_),
+            block_ids=block_ids.astype(np.int32),
+            rows=rows.astype(np.int32),
+            offsets=offsets.astype(np.int64),
+            manifest=np.array(json.dumps(manifest)),
+        )
+    return len(names)
+
+
+def build_block_index(output_filename, signatures_path, uncurated_signatures_path=None):
+    """Block the signatures of a file and save them, see :func:`save_block_index`.
+
+    Returns:
+        int: the number of blocks.
+
+    """
+    blocks = compute_signature_blocks(signatures_path, uncurated_signatures_path)
+    return save_block_index(output_filename, signatures_path, blocks, uncurated_signatures_path)
+
+
+def load_block_index(input_filename, signatures_path, uncurated_signatures_path=None):
+    """Load the index saved by :func:`save_block_index`.
+
+    Raises:
+        ValueError: if the index was not built for ``signatures_path`` and
+            ``uncurated_signatures_path`` as they are now.
+
+    Returns:
+        tuple: the ``blocks``, ``block_ids``, ``rows`` and ``offsets``
+        arrays.
+
+    """
+    with np.load(input_filename) as data:
+        manifest = json.loads(str(data['manifest']))
+        if manifest['version'] != BLOCK_INDEX_VERSION:
+            raise ValueError('Unsupported block index version {} in {}'.format(
+                manifest['version'], input_filename))
+        expected = (hash_file(signatures_path), uncurated_signatures_path and hash_file(uncurated_signatures_path))
+        if (manifest['signatures_sha1'], manifest['uncurated_signatures_sha1']) != expected:
+            raise ValueError('{} does not block the current {}, index the blocks again'.format(
+                input_filename, ' and '.join(_signatures_paths(signatures_path, uncurated_signatures_path))))
+        return data['blocks'], data['block_ids'], data['rows'], data['offsets']
+
+
+def load_signature_blocks(input_filename, signatures_path, uncurated_signatures_path=None):
+    """Load the block of every signature from the index of :func:`save_block_index`.
+
+    Returns:
+        numpy.ndarray: the block of every distinct signature, in order of
+        first appearance, as :func:`compute_signature_blocks`.
+
+    """
+    blocks, block_ids, _, _ = load_block_index(input_filename, signatures_path, uncurated_signatures_path)
+    return blocks[block_ids]
+
+
+def _signatures_paths(signatures_path, uncurated_signatures_path):
+    if uncurated_signatures_path:
+        return [signatures_path, uncurated_signatures_path]
+    return [signatures_path]
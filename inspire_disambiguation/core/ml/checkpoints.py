@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation core ML checkpoints."""
+
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import json
+import os
+
+import attr
+
+from ...utils import open_file_in_folder
+
+
+def block_content_hash(X, y):
+    """Hash the contents of a block.
+
+    Cluster ids are numbered anew by every export, and signatures come in no
+    particular order, so the signatures are hashed sorted by UUID, and the
+    cluster ids are replaced by their order of first appearance among them.
+    :meth:`~.models.Clusterer.load_data` sorts the signatures the same way,
+    so that the stored results apply to the signatures in this order.
+
+    Args:
+        X(numpy.ndarray): the signatures of the block, shape ``(n, 1)``.
+        y(numpy.ndarray): the known cluster id of each signature, or ``-1``.
+
+    Returns:
+        str: a hex digest that changes whenever a signature, its publication
+        or the partition of the signatures into known clusters changes.
+
+    """
+    labels = {}
+    digest = hashlib.sha1()
+    for i in sorted(range(len(X)), key=lambda i: X[i, 0].signature_uuid):
+        signature, cluster_id = X[i, 0], int(y[i])
+        if cluster_id != -1:
+            cluster_id = labels.setdefault(cluster_id, len(labels))
+        # Publications may be lazy, so they are not converted by attrs.
+        signature_dict = attr.asdict(signature, recurse=False)
+        signature_dict['publication'] = signature.publication.to_dict()
+        digest.update(json.dumps([signature_dict, cluster_id], sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class BlockCheckpoints(object):
+    """Per-block clustering results stored on disk as they are computed.
+
+    Every result lives in its own file, named after the block key and a
+    fingerprint of the block contents, in a subfolder of ``path`` named after
+    ``version``. A restarted run only recomputes the blocks that were not
+    completed, and a later run with the same ``version`` only recomputes the
+    blocks whose contents changed.
+
+    Args:
+        path(str): the folder holding the results.
+        version(str): identifies everything besides the block contents that
+            the results depend on, like the distance model and the
+            clustering parameters.
+
+    """
+
+    def __init__(self, path, version=''):
+        self.path = os.path.join(path, hashlib.sha1(version.encode('utf-8')).hexdigest())
+        self.version = version
+        self.hits = 0
+        self._used = set()
+
+    def get(self, block, content_hash):
+        """Return the stored result for a block, or ``None``."""
+        filename = self._filename(block, content_hash)
+        try:
+            with open(filename, 'r') as fd:
+                result = json.load(fd)['result']
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        self.hits += 1
+        self._used.add(filename)
+        return result
+
+    def put(self, block, content_hash, result):
+        """Atomically store the result for a block."""
+        filename = self._filename(block, content_hash)
+        with open_file_in_folder(filename + '.tmp', 'w') as fd:
+            json.dump({
+                'block': block,
+                'content_hash': content_hash,
+                'version': self.version,
+                'result': result,
+            }, fd)
+        os.rename(filename + '.tmp', filename)
+        self._used.add(filename)
+
+    def prune(self):
+        """Delete the results that were neither read nor written by this run.
+
+        Only the results of the same ``version`` are deleted, those of other
+        versions are left for the runs that use them.
+
+        Returns:
+            int: the number of deleted results.
+
+        """
+        pruned = 0
+        if not os.path.exists(self.path):
+            return pruned
+        for name in os.listdir(self.path):
+            filename = os.path.join(self.path, name)
+            if filename not in self._used:
+                os.remove(filename)
+                pruned += 1
+        return pruned
+
+    def _filename(self, block, content_hash):
+        block_digest = hashlib.sha1(block.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, '{}-{}.json'.format(block_digest, content_hash))
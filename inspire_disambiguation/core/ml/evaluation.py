@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation core ML evaluation."""
+
+from __future__ import absolute_import, division, print_function
+
+import multiprocessing
+
+import numpy as np
+
+
+def _codes(labels):
+    _, codes = np.unique(labels, return_inverse=True)
+    return codes.astype(np.int64)
+
+
+def _b3_sums(true_codes, pred_codes, group_codes, n_groups):
+    """Sum the B3 precision and recall of the elements of each group.
+
+    All elements of a cell of the contingency table, i.e. sharing the same
+    group, true label and predicted label, contribute the same amounts:
+    ``n_cell / n_pred`` to precision and ``n_cell / n_true`` to recall, where
+    ``n_pred`` and ``n_true`` are the sizes of their predicted and true
+    clusters within the group. Summing ``n_cell ** 2 / n_pred`` over cells
+    thus gives the sum of the per-element precisions.
+    """
+    n_true, n_pred = true_codes.max() + 1, pred_codes.max() + 1
+    true_keys = group_codes * n_true + true_codes
+    pred_keys = group_codes * n_pred + pred_codes
+
+    true_clusters, true_cluster_codes, true_sizes = np.unique(true_keys, return_inverse=True, return_counts=True)
+    pred_clusters, pred_cluster_codes, pred_sizes = np.unique(pred_keys, return_inverse=True, return_counts=True)
+
+    cell_keys = true_cluster_codes.astype(np.int64) * len(pred_clusters) + pred_cluster_codes
+    cells, first, cell_sizes = np.unique(cell_keys, return_index=True, return_counts=True)
+    cell_sizes = cell_sizes.astype(np.float64)
+
+    cell_groups = group_codes[first]
+    precision = np.bincount(
+        cell_groups, weights=cell_sizes ** 2 / pred_sizes[pred_cluster_codes[first]], minlength=n_groups)
+    recall = np.bincount(
+        cell_groups, weights=cell_sizes ** 2 / true_sizes[true_cluster_codes[first]], minlength=n_groups)
+    return precision, recall
+
+
+def _f_score(precision, recall):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f_score = 2 * precision * recall / (precision + recall)
+    return np.nan_to_num(f_score)
+
+
+def b3_precision_recall_fscore(labels_true, labels_pred):
+    """Compute the B3 precision, recall and F-score of a clustering.
+
+    Gives the same results as :func:`beard.metrics.b3_precision_recall_fscore`,
+    but from the contingency table of the two labelings computed with NumPy,
+    without any loop over elements.
+
+    Args:
+        labels_true(numpy.ndarray): the ground truth cluster labels.
+        labels_pred(numpy.ndarray): the predicted cluster labels.
+
+    Returns:
+        tuple: the precision, recall and F-score.
+
+    """
+    labels_true = np.asarray(labels_true)
+    labels_pred = np.asarray(labels_pred)
+    if labels_true.shape != labels_pred.shape or labels_true.ndim != 1:
+        raise ValueError('labels_true and labels_pred must be 1d arrays of the same size.')
+    if not len(labels_true):
+        raise ValueError('input labels must not be empty.')
+
+    precision, recall = _b3_sums(
+        _codes(labels_true), _codes(labels_pred), np.zeros(len(labels_true), dtype=np.int64), 1)
+    precision, recall = float(precision[0] / len(labels_true)), float(recall[0] / len(labels_true))
+    return precision, recall, float(_f_score(precision, recall))
+
+
+def b3_f_score(labels_true, labels_pred):
+    """Compute the B3 F-score, see :func:`b3_precision_recall_fscore`."""
+    return b3_precision_recall_fscore(labels_true, labels_pred)[2]
+
+
+def _evaluate_chunk(args):
+    true_codes, pred_codes, group_codes, n_groups = args
+    return _b3_sums(true_codes, pred_codes, group_codes, n_groups)
+
+
+def evaluate_blocks(labels_true, labels_pred, blocks, n_jobs=1, worst=20):
+    """Evaluate a clustering globally and block by block with B3.
+
+    Args:
+        labels_true(numpy.ndarray): the ground truth cluster labels.
+        labels_pred(numpy.ndarray): the predicted cluster labels.
+        blocks(numpy.ndarray): the block of each element.
+        n_jobs(int): the number of processes among which blocks are split.
+        worst(int): how many blocks to report, ordered by the number of
+            wrongly clustered elements they account for.
+
+    Returns:
+        dict: the global B3 ``precision``, ``recall`` and ``f_score``, the
+        number of ``signatures`` and ``blocks``, and in ``worst_blocks`` the
+        B3 scores, size and lost F-score mass of the worst blocks.
+
+    """
+    labels_true = np.asarray(labels_true)
+    labels_pred = np.asarray(labels_pred)
+    block_names, block_codes = np.unique(blocks, return_inverse=True)
+    block_codes = block_codes.astype(np.int64)
+    true_codes, pred_codes = _codes(labels_true), _codes(labels_pred)
+    n_blocks = len(block_names)
+
+    if n_jobs == 1 or n_blocks < n_jobs:
+        precision, recall = _b3_sums(true_codes, pred_codes, block_codes, n_blocks)
+    else:
+        # Split the elements into chunks of whole blocks of similar sizes.
+        order = np.argsort(block_codes, kind='mergesort')
+        boundaries = np.searchsorted(
+            block_codes[order], np.arange(0, n_blocks, int(np.ceil(n_blocks / n_jobs)))[1:])
+        chunks = [
+            (true_codes[chunk], pred_codes[chunk], block_codes[chunk], n_blocks)
+            for chunk in np.split(order, boundaries)
+        ]
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            sums = pool.map(_evaluate_chunk, chunks)
+        finally:
+            pool.terminate()
+        precision = np.sum([chunk_precision for chunk_precision, _ in sums], axis=0)
+        recall = np.sum([chunk_recall for _, chunk_recall in sums], axis=0)
+
+    sizes = np.bincount(block_codes, minlength=n_blocks)
+    block_precision, block_recall = precision / sizes, recall / sizes
+    block_f_score = _f_score(block_precision, block_recall)
+
+    # Note that per-block scores only compare the elements of each block:
+    # true clusters spanning several blocks are not penalized here, but
+    # they are in the global scores below.
+    global_precision, global_recall = _b3_sums(true_codes, pred_codes, np.zeros_like(block_codes), 1)
+    global_precision = float(global_precision[0] / len(labels_true))
+    global_recall = float(global_recall[0] / len(labels_true))
+
+    lost = (1 - block_f_score) * sizes
+    worst_blocks = [{
+        'block': str(block_names[i]),
+        'signatures': int(sizes[i]),
+        'precision': float(block_precision[i]),
+        'recall': float(block_recall[i]),
+        'f_score': float(block_f_score[i]),
+        'lost': float(lost[i]),
+    } for i in np.argsort(-lost, kind='mergesort')[:worst]]
+
+    return {
+        'precision': global_precision,
+        'recall': global_recall,
+        'f_score': float(_f_score(global_precision, global_recall)),
+        'signatures': len(labels_true),
+        'blocks': n_blocks,
+        'worst_blocks': worst_blocks,
+    }
@@ -26,62 +26,94 @@ from __future__ import absolute_import, division, print_function
 
 import csv
 import json
+import logging
+import multiprocessing
 import pickle
+import threading
+import time
+import zlib
 
 import attr
 import numpy as np
 import six
 
+from collections import OrderedDict, defaultdict, deque
 from functools import partial
 
-from scipy.special import expit
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.pipeline import FeatureUnion, Pipeline
-from sklearn.svm import LinearSVC
-
-from beard.clustering import (
-    BlockClustering,
-    block_phonetic,
-    ScipyHierarchicalClustering
-)
-from beard.metrics import b3_f_score
-from beard.similarity import (
-    CosineSimilarity,
-    ElementMultiplication,
-    EstimatorTransformer,
-    PairTransformer,
-    StringDistance,
-)
-from beard.utils import (
-    FuncTransformer,
-    Shaper,
-    given_name,
-    given_name_initial,
-    normalize_name,
-)
 from inspire_utils.record import get_value
 from ...utils import open_file_in_folder
+from .blocking import get_block_function, group_blocks, load_signature_blocks
+from .checkpoints import block_content_hash
+from .publications import DEFAULT_CACHE_SIZE, LazyPublication, open_publication_store
+from .evaluation import b3_f_score, b3_precision_recall_fscore, evaluate_blocks
+from .sampling import load_sampled_pairs_index
+from .tuning import save_linkages
+
+
+LOGGER = logging.getLogger(__name__)
+
+# scipy, scikit-learn and beard take seconds to import, so they are only
+# imported by the functions needing them: importing this module stays cheap
+# for the stages that do not fit or apply a model.
+
+
+class IncompleteClusteringError(Exception):
+    pass
 
 
 class EthnicityEstimator(object):
     def __init__(self, C=4.0):
         self.C = C
 
-    def load_data(self, input_filename):
-        ethnicities, lasts, firsts = [], [], []
-        with open(input_filename, 'r') as fd:
-            reader = csv.DictReader(fd)
-            for row in reader:
-                ethnicities.append(int(row['RACE']))
-                lasts.append(row['NAMELAST'])
-                firsts.append(row['NAMEFRST'])
+    def load_data(self, input_filename, holdout_every=0):
+        """Load the names and ethnicities to train on.
 
-        names = ['%s, %s' % (last, first) for last, first in zip(lasts, firsts)]
-        normalized_names = [normalize_name(name) for name in names]
+        Args:
+            input_filename(str): the CSV file with the ``NAMELAST``,
+                ``NAMEFRST`` and ``RACE`` columns.
+            holdout_every(int): if set, skip one row out of this many, see
+                :meth:`iter_chunks`.
 
-        self.X = normalized_names
-        self.y = ethnicities
+        """
+        self.X, self.y = [], []
+        for names, ethnicities in self.iter_chunks(input_filename, holdout_every=holdout_every):
+            self.X.extend(names)
+            self.y.extend(ethnicities)
+
+    def iter_chunks(self, input_filename, chunk_size=100000, holdout_every=0, held_out=False):
+        """Read the names and ethnicities in chunks of bounded size.
+
+        Args:
+            input_filename(str): as in :meth:`load_data`.
+            chunk_size(int): the maximum number of rows in a chunk.
+            holdout_every(int): if set, every row whose position is a
+                multiple of it is held out, so that the same rows can be used
+                to compare models trained on the others.
+            held_out(bool): read the held out rows instead of the others.
+
+        Yields:
+            tuple: the list of normalized names and the list of ethnicities
+            of a chunk.
+
+        """
+        from beard.utils import normalize_name
+
+        # beard memoizes the normalized names forever, which would make the
+        # memory grow with the data again.
+        normalize_name = getattr(normalize_name, '__wrapped__', normalize_name)
+
+        names, ethnicities = [], []
+        with open(input_filename, 'r') as fd:
+            for i, row in enumerate(csv.DictReader(fd)):
+                if holdout_every and (i % holdout_every == 0) != held_out:
+                    continue
+                names.append(normalize_name('%s, %s' % (row['NAMELAST'], row['NAMEFRST'])))
+                ethnicities.append(int(row['RACE']))
+                if len(names) == chunk_size:
+                    yield names, ethnicities
+                    names, ethnicities = [], []
+        if names:
+            yield names, ethnicities
 
     def load_model(self, input_filename):
         with open(input_filename, 'rb') as fd:
@@ -92,6 +124,10 @@ class EthnicityEstimator(object):
             pickle.dump(self.estimator, fd, protocol=pickle.HIGHEST_PROTOCOL)
 
     def fit(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.pipeline import Pipeline
+        from sklearn.svm import LinearSVC
+
         self.estimator = Pipeline([
             ('transformer', TfidfVectorizer(
                 analyzer='char_wb',
@@ -104,17 +140,105 @@ class EthnicityEstimator(object):
         ])
         self.estimator.fit(self.X, self.y)
 
+    def fit_streaming(self, input_filename, chunk_size=100000, n_epochs=5, holdout_every=0, seed=0):
+        """Train on the CSV file chunk by chunk, with bounded memory.
+
+        Unlike :meth:`fit`, names are turned into character n-grams by a
+        stateless hashing transform instead of a vocabulary built over all
+        of them, and the linear SVM is trained by stochastic gradient descent
+        one chunk at a time, ``n_epochs`` times over the file. Memory thus
+        only depends on ``chunk_size``. Rows are shuffled within each chunk,
+        so the file should not be sorted by ethnicity.
+
+        Args:
+            input_filename(str): as in :meth:`load_data`.
+            chunk_size(int): the number of rows in memory at once.
+            n_epochs(int): the number of passes over the file.
+            holdout_every(int): as in :meth:`iter_chunks`, the held out rows
+                are not trained on.
+            seed(int): the seed of the shuffling and of the classifier.
+
+        """
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.pipeline import Pipeline
+
+        transformer = HashingVectorizer(
+            analyzer='char_wb',
+            ngram_range=(1, 5),
+            n_features=2 ** 20,
+            dtype=np.float32,
+            decode_error='replace',
+        )
+
+        # A first pass finds the classes, which partial_fit needs upfront,
+        # and the number of rows, to get the same regularization as C.
+        classes, n_samples = set(), 0
+        for _, ethnicities in self.iter_chunks(input_filename, chunk_size, holdout_every):
+            classes.update(ethnicities)
+            n_samples += len(ethnicities)
+
+        classifier = SGDClassifier(loss='hinge', alpha=1.0 / (self.C * n_samples), random_state=seed)
+        rng = np.random.RandomState(seed)
+        for _ in range(n_epochs):
+            for names, ethnicities in self.iter_chunks(input_filename, chunk_size, holdout_every):
+                order = rng.permutation(len(names))
+                X = transformer.transform([names[i] for i in order])
+                classifier.partial_fit(X, np.asarray(ethnicities)[order], classes=sorted(classes))
+
+        self.estimator = Pipeline([('transformer', transformer), ('classifier', classifier)])
+
+    def score_streaming(self, input_filename, chunk_size=100000, holdout_every=0):
+        """Compute the accuracy of the model chunk by chunk.
+
+        Args:
+            input_filename(str): as in :meth:`load_data`.
+            chunk_size(int): the number of rows in memory at once.
+            holdout_every(int): if set, only score on the held out rows, see
+                :meth:`iter_chunks`.
+
+        Returns:
+            float: the fraction of rows whose ethnicity is predicted right.
+
+        """
+        right, total = 0, 0
+        for names, ethnicities in self.iter_chunks(input_filename, chunk_size, holdout_every, held_out=True):
+            right += int(np.sum(self.predict(names) == np.asarray(ethnicities)))
+            total += len(names)
+        return right / total if total else 0.0
+
     def predict(self, X):
         return self.estimator.predict(X)
 
 
 class DistanceEstimator(object):
-    def __init__(self, ethnicity_estimator):
+    def __init__(self, ethnicity_estimator, features=None):
         self.ethnicity_estimator = ethnicity_estimator
+        # names of the branches of the feature union to use, all if None
+        self.features = features
 
     def load_data(self, signatures_path, pairs_path, pairs_size, publications_path):
+        """Load the sampled pairs of signatures to train on.
+
+        Args:
+            pairs_path(str): either the JSON lines of
+                :func:`~.sampling.sample_signature_pairs`, or an ``.npz`` file
+                of :func:`~.sampling.save_sampled_pairs_index`, which is
+                loaded at once.
+            pairs_size(int): the number of pairs to load.
+
+        """
         signatures_by_uuid = load_signatures(signatures_path, publications_path)
 
+        if pairs_path.endswith('.npz'):
+            rows, same_cluster = load_sampled_pairs_index(pairs_path, signatures_path)
+            signatures = np.empty(len(signatures_by_uuid), dtype=np.object)
+            for i, signature in enumerate(six.itervalues(signatures_by_uuid)):
+                signatures[i] = signature
+            self.X = signatures[rows[:pairs_size]]
+            self.y = np.where(same_cluster[:pairs_size], 0, 1)
+            return
+
         self.X = np.empty((pairs_size, 2), dtype=np.object)
         self.y = np.empty(pairs_size, dtype=np.int)
 
@@ -133,8 +257,167 @@ class DistanceEstimator(object):
         with open_file_in_folder(output_filename, 'wb') as fd:
             pickle.dump(self.distance_estimator, fd, protocol=pickle.HIGHEST_PROTOCOL)
 
-    def fit(self):
-        transformer = FeatureUnion([
+    def fit(self, n_jobs=1, forest_n_jobs=8, chunk_size=50000, n_estimators=500):
+        """Fit the features and the random forest on the loaded pairs.
+
+        The branches of the feature union are fitted in parallel, then each
+        of them transforms the pairs chunk by chunk, on a pool of ``n_jobs``
+        processes. Workers find the signatures in a store shared when
+        forking them, and only receive the branch and the range of pairs to
+        work on. The resulting model is the same as fitting the feature union
+        in a single process.
+
+        Args:
+            n_jobs(int): the number of processes computing the features.
+            forest_n_jobs(int): the number of threads fitting the forest.
+            chunk_size(int): the number of pairs transformed by a task.
+            n_estimators(int): the number of trees of the forest.
+
+        """
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.pipeline import FeatureUnion, Pipeline
+
+        global _shared_signatures, _shared_pairs, _shared_y, _shared_branches
+        _shared_signatures, _shared_pairs = _share_pairs(self.X)
+        _shared_y = self.y
+        features = self._build_features()
+        try:
+            _shared_branches = [branch for _, branch in features]
+            _shared_branches = _pool_map(_fit_branch, range(len(features)), n_jobs)
+            Xt = _transform_shared_pairs(len(self.X), n_jobs, chunk_size)
+            branches = _shared_branches
+        finally:
+            _shared_signatures = _shared_pairs = _shared_y = _shared_branches = None
+
+        classifier = RandomForestClassifier(n_estimators=n_estimators, n_jobs=forest_n_jobs)
+        classifier.fit(Xt, self.y)
+
+        transformer = FeatureUnion([(name, branch) for (name, _), branch in zip(features, branches)])
+        self.distance_estimator = Pipeline([('transformer', transformer), ('classifier', classifier)])
+
+    def fit_warm_start(self, n_trees=100, max_trees=500, n_jobs=1, forest_n_jobs=8, chunk_size=50000):
+        """Grow the forest of the loaded model on the loaded pairs.
+
+        The features of the model are not fitted again, they only transform
+        the pairs, in parallel as in :meth:`fit`. ``n_trees`` trees fitted on
+        the pairs are then added to the forest, and the oldest trees are
+        dropped to keep at most ``max_trees``, so that a model refreshed
+        regularly forgets the pairs sampled long ago.
+
+        Args:
+            n_trees(int): the number of trees to add.
+            max_trees(int): the number of trees to keep, all if ``None``.
+            n_jobs(int): the number of processes computing the features.
+            forest_n_jobs(int): the number of threads fitting the trees.
+            chunk_size(int): the number of pairs transformed by a task.
+
+        """
+        global _shared_signatures, _shared_pairs, _shared_branches
+        transformer = self.distance_estimator.named_steps['transformer']
+        classifier = self.distance_estimator.named_steps['classifier']
+
+        _shared_signatures, _shared_pairs = _share_pairs(self.X)
+        try:
+            _shared_branches = [branch for _, branch in transformer.transformer_list]
+            Xt = _transform_shared_pairs(len(self.X), n_jobs, chunk_size)
+        finally:
+            _shared_signatures = _shared_pairs = _shared_branches = None
+
+        classifier.set_params(
+            warm_start=True, n_estimators=len(classifier.estimators_) + n_trees, n_jobs=forest_n_jobs)
+        classifier.fit(Xt, self.y)
+        if max_trees is not None and len(classifier.estimators_) > max_trees:
+            classifier.estimators_ = classifier.estimators_[-max_trees:]
+        classifier.set_params(warm_start=False, n_estimators=len(classifier.estimators_))
+
+    def held_out(self, holdout_every):
+        """Find the loaded pairs to keep out of training.
+
+        One author out of ``holdout_every`` is held out, chosen by a hash of
+        its id, so that the same authors are held out whatever the sampled
+        pairs. Models never trained on their pairs can then be compared on
+        them.
+
+        Returns:
+            numpy.ndarray: whether each loaded pair has a signature of a held
+            out author, all ``False`` if ``holdout_every`` is not set.
+
+        """
+        held_out = np.zeros(len(self.X), dtype=np.bool)
+        if not holdout_every:
+            return held_out
+        for i, (s1, s2) in enumerate(self.X):
+            held_out[i] = _is_held_out(s1.author_id, holdout_every) or _is_held_out(s2.author_id, holdout_every)
+        return held_out
+
+    def score(self, X, y):
+        """Compare the distances predicted for signature pairs with the truth.
+
+        Returns:
+            dict: the ``accuracy`` of the predictions and the ``roc_auc`` of
+            the predicted distances.
+
+        """
+        from sklearn.metrics import accuracy_score, roc_auc_score
+
+        distances = self.distance_estimator.predict_proba(X)[:, 1]
+        return {
+            'accuracy': float(accuracy_score(y, distances > 0.5)),
+            'roc_auc': float(roc_auc_score(y, distances)),
+        }
+
+    def profile(self, X=None):
+        """Measure the cost and the usefulness of each feature of the model.
+
+        Args:
+            X(numpy.ndarray): the signature pairs on which to time the
+                features, by default the loaded pairs.
+
+        Returns:
+            list: one dict per feature of the fitted model, in order, with
+            the time taken to transform ``X`` in ``seconds`` and per pair in
+            ``seconds_per_pair``, the number of ``columns`` it produces and
+            the sum of their ``importance`` in the random forest.
+
+        """
+        if X is None:
+            X = self.X
+        transformer = self.distance_estimator.named_steps['transformer']
+        importances = self.distance_estimator.named_steps['classifier'].feature_importances_
+
+        profile = []
+        column = 0
+        for name, branch in transformer.transformer_list:
+            start = time.time()
+            Xt = branch.transform(X)
+            seconds = time.time() - start
+            n_columns = Xt.shape[1]
+            profile.append({
+                'feature': name,
+                'seconds': seconds,
+                'seconds_per_pair': seconds / len(X),
+                'columns': n_columns,
+                'importance': float(np.sum(importances[column:column + n_columns])),
+            })
+            column += n_columns
+
+        return profile
+
+    def _build_features(self):
+        from scipy.special import expit
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.pipeline import Pipeline
+
+        from beard.similarity import (
+            CosineSimilarity,
+            ElementMultiplication,
+            EstimatorTransformer,
+            PairTransformer,
+            StringDistance,
+        )
+        from beard.utils import FuncTransformer, Shaper
+
+        features = [
             ('author_full_name_similarity', Pipeline([
                 ('pairs', PairTransformer(
                     element_transformer=Pipeline([
@@ -295,42 +578,103 @@ class DistanceEstimator(object):
                     element_transformer=Pipeline([
                         ('name', FuncTransformer(func=get_author_full_name)),
                         ('shaper', Shaper(newshape=(-1,))),
-                        ('classifier', EstimatorTransformer(self.ethnicity_estimator.estimator)),
+                        ('classifier', EstimatorTransformer(getattr(self.ethnicity_estimator, 'estimator', None))),
                     ]),
                     groupby=group_by_signature,
                 )),
                 ('sigmoid', FuncTransformer(func=expit)),
                 ('combiner', ElementMultiplication()),
             ])),
-        ])
-        classifier = RandomForestClassifier(n_estimators=500, n_jobs=8)
+        ]
 
-        self.distance_estimator = Pipeline([('transformer', transformer), ('classifier', classifier)])
-        self.distance_estimator.fit(self.X, self.y)
+        if self.features is None:
+            return features
+
+        unknown = set(self.features) - set(name for name, _ in features)
+        if unknown:
+            raise ValueError('Unknown features: {}. Available features are: {}.'.format(
+                ', '.join(sorted(unknown)), ', '.join(name for name, _ in features)))
+        return [(name, feature) for name, feature in features if name in self.features]
 
 
 class Clusterer(object):
-    def __init__(self, estimator):
+    def __init__(self, estimator, prefilter_rules=(), sparse_min_size=None, lsh_bands=32, lsh_rows=2,
+                 lsh_max_bucket_size=100, cascade=None, cascade_band=(0.1, 0.9), scoring_threads=1,
+                 threaded_min_size=None):
         # TODO get rid of this global
         global distance_estimator
         distance_estimator = estimator.distance_estimator
-        try:
-            distance_estimator.steps[-1][1].set_params(n_jobs=1)
-        except Exception:
-            pass
-
-        # threshold determines when to split blocks into smaller ones adding first initial
-        self.block_function = partial(block_phonetic, threshold=0, phonetic_algorithm='nysiis')
+        for pipeline in (estimator, cascade):
+            if pipeline is None:
+                continue
+            # blocks are fitted in parallel already
+            try:
+                pipeline.distance_estimator.steps[-1][1].set_params(n_jobs=1)
+            except ValueError:
+                pass  # the classifier has no n_jobs
+
+        self.block_function = get_block_function()
+        # the block of every signature, if loaded instead of computed, see
+        # :meth:`load_data`
+        self.blocks = None
 
         self.clustering_threshold = 0.709  # magic value taken from BEARD example
         self.clustering_method = 'average'
 
-    def load_data(self, signatures_path, publications_path, input_clusters_path):
-        signatures_by_uuid = load_signatures(signatures_path, publications_path)
+        # pairs ruled out by these rules get the maximum distance without
+        # calling the distance estimator, see ``PREFILTER_RULES``
+        self.prefilter_rules = list(prefilter_rules)
+        self.pruned_pairs = {}
+
+        # blocks with at least this many signatures only score the candidate
+        # pairs found by LSH, see ``SparseAverageLinkage``
+        self.sparse_min_size = sparse_min_size
+        self.lsh_bands = lsh_bands
+        self.lsh_rows = lsh_rows
+        self.lsh_max_bucket_size = lsh_max_bucket_size
+
+        # if given, a cheaper distance estimator, see ``CASCADE_FEATURES``,
+        # scores the pairs first, and only the ones it puts within this band
+        # are scored again by ``estimator``
+        self.cascade = cascade
+        self.cascade_band = tuple(cascade_band)
+
+        # blocks with at least this many signatures score their pairs on
+        # this many threads, see ``_map_chunks``
+        self.scoring_threads = scoring_threads
+        self.threaded_min_size = threaded_min_size
+
+    def load_data(self, signatures_path, publications_path, input_clusters_path, publications_index_path=None,
+                  block_index_path=None, uncurated_signatures_path=None, publications_cache_size=DEFAULT_CACHE_SIZE):
+        """Load the signatures to cluster and their known clusters.
+
+        Args:
+            publications_index_path(str): if given, publications are read
+                when used, see :func:`load_signatures`.
+            publications_cache_size(int): as in :func:`load_signatures`.
+            block_index_path(str): if given, the blocks of the signatures
+                are read from this index instead of being computed when
+                fitting, see :func:`~.blocking.save_block_index`.
+            uncurated_signatures_path(str): if given, these signatures are
+                clustered too, with no known cluster, so that they can be
+                assigned to the author of their cluster, see
+                :func:`~.assignments.iter_author_assignments`.
+
+        """
+        signatures_by_uuid = load_signatures(
+            signatures_path, publications_path, publications_index_path, uncurated_signatures_path,
+            publications_cache_size=publications_cache_size)
 
         self.X = np.empty((len(signatures_by_uuid), 1), dtype=np.object)
         self.y = -np.ones(len(self.X), dtype=np.int)
 
+        # positions of the signatures in the signatures file, to look up
+        # their blocks in the block index
+        rows_by_uuid = None
+        if block_index_path:
+            rows_by_uuid = {signature_uuid: row for row, signature_uuid in enumerate(signatures_by_uuid)}
+            rows = np.zeros(len(self.X), dtype=np.int64)
+
         i = 0
         with open(input_clusters_path, 'r') as fd:
             for line in fd:
@@ -340,8 +684,33 @@ class Clusterer(object):
                         continue  # TODO figure out how this can happen
                     self.X[i, 0] = signatures_by_uuid[signature_uuid]
                     self.y[i] = cluster['cluster_id']
+                    if rows_by_uuid is not None:
+                        rows[i] = rows_by_uuid[signature_uuid]
                     i += 1
 
+        if uncurated_signatures_path:
+            # only the curated signatures have an author
+            for row, signature in enumerate(six.itervalues(signatures_by_uuid)):
+                if signature.author_id is not None:
+                    continue
+                self.X[i, 0] = signature
+                if rows_by_uuid is not None:
+                    rows[i] = row
+                i += 1
+
+        self.blocks = None
+        if rows_by_uuid is not None:
+            self.blocks = load_signature_blocks(block_index_path, signatures_path, uncurated_signatures_path)[rows]
+
+        # Sorted by UUID, so that the signatures of a block are fitted in the
+        # same order whatever the order of the export, as the checkpoints of
+        # the blocks expect, see ``block_content_hash``.
+        order = np.argsort(np.array([signature.signature_uuid for signature in self.X[:i, 0]]), kind='mergesort')
+        order = np.concatenate((order, np.arange(i, len(self.X)))).astype(np.int64)
+        self.X, self.y = self.X[order], self.y[order]
+        if self.blocks is not None:
+            self.blocks = self.blocks[order]
+
     def load_model(self, input_filename):
         with open(input_filename, 'rb') as fd:
             self.clusterer = pickle.load(fd)
@@ -350,17 +719,269 @@ class Clusterer(object):
         with open_file_in_folder(output_filename, 'wb') as fd:
             pickle.dump(self.clusterer, fd, protocol=pickle.HIGHEST_PROTOCOL)
 
-    def fit(self, n_jobs=8):
+    def save_linkages(self, output_filename):
+        """Save the linkage matrix of every block of the fitted model.
+
+        See :func:`~inspire_disambiguation.core.ml.tuning.save_linkages`.
+        """
+        blocks, signature_uuids, linkages, thresholds = [], [], [], []
+        for block, indices in group_blocks(self.clusterer.blocks_):
+            clusterer = self.clusterer.clusterers_[block]
+            blocks.append(block)
+            signature_uuids.append([signature.signature_uuid for signature in self.X[indices, 0]])
+            linkages.append(getattr(clusterer, 'linkage_', None))
+            thresholds.append(getattr(clusterer, 'best_threshold_', None))
+        save_linkages(output_filename, blocks, signature_uuids, linkages, thresholds=thresholds)
+
+    def fit(self, n_jobs=8, checkpoints=None, assignments=None):
+        """Fit the clustering model, one block at a time.
+
+        Blocks are fitted on a pool of ``n_jobs`` processes, largest first.
+        The number of pairs ruled out by the pre-filter in each block is
+        stored in :attr:`pruned_pairs`.
+
+        Args:
+            n_jobs(int): the number of processes to use.
+            checkpoints(BlockCheckpoints): if given, every block is saved
+                there as soon as it is fitted, and blocks already found there
+                with the same contents are not fitted again.
+            assignments(AssignmentWriter): if given, the clusters of the
+                signatures of every block are written there as soon as it is
+                fitted or loaded from ``checkpoints``.
+
+        """
+        _set_prefilter_rules(self.prefilter_rules)
+        _set_cascade(self.cascade, self.cascade_band)
+        _set_scoring_threads(self.scoring_threads, self.threaded_min_size, n_jobs)
+        blocks = self._get_blocks()
+        clusterers, todo = self._load_checkpointed_blocks(blocks, checkpoints, assignments)
+        todo.sort(key=lambda item: len(item[1]), reverse=True)
+
+        # the sparse estimator imports the LSH modules, only build it if a
+        # block needs it
+        base_estimator = self._base_estimator()
+        sparse_estimator = None
+        if any(self._is_sparse(len(indices)) for _, indices, _ in todo):
+            sparse_estimator = self._sparse_estimator()
+        arguments = (
+            (block, self.X[indices], self.y[indices],
+             sparse_estimator if self._is_sparse(len(indices)) else base_estimator)
+            for block, indices, _ in todo
+        )
+        content_hashes = {block: content_hash for block, _, content_hash in todo}
+        indices_by_block = {block: indices for block, indices, _ in todo}
+
+        if n_jobs == 1:
+            results = six.moves.map(_fit_block, arguments)
+        else:
+            pool = multiprocessing.Pool(n_jobs)
+            results = pool.imap_unordered(_fit_block, arguments)
+
+        try:
+            for done, (block, clusterer, pruned) in enumerate(results, 1):
+                LOGGER.info('Fitted block %s (%d/%d), pre-filter pruned %d pairs', block, done, len(todo), pruned)
+                clusterers[block] = clusterer
+                self.pruned_pairs[block] = pruned
+                if checkpoints is not None:
+                    data = dump_block_clusterer(clusterer)
+                    data['pruned_pairs'] = pruned
+                    checkpoints.put(block, content_hashes[block], data)
+                if assignments is not None:
+                    assignments.write_block(block, self.X[indices_by_block[block]], clusterer.labels_)
+        finally:
+            if n_jobs != 1:
+                pool.terminate()
+
+        self._set_clusterer(blocks, clusterers, n_jobs)
+
+    def fit_distributed(self, task, max_retries=3, poll_interval=1, checkpoints=None, assignments=None):
+        """Fit the clustering model by fanning out blocks as Celery tasks.
+
+        Each block is sent to ``task`` as the UUIDs of its signatures and
+        their known cluster ids, so that only identifiers travel through the
+        broker. Results are collected as soon as they are ready and assembled
+        in a ``BlockClustering`` equivalent to the one built by :meth:`fit`.
+
+        Args:
+            task: the Celery task clustering a single block, called as
+                ``task.delay(block, signature_uuids, cluster_ids)`` and
+                returning the output of :func:`dump_block_clusterer`.
+            max_retries(int): how many times a failed block is resubmitted
+                before giving up.
+            poll_interval(float): seconds to wait between two polls of the
+                pending results.
+            checkpoints(BlockCheckpoints): as in :meth:`fit`.
+            assignments(AssignmentWriter): as in :meth:`fit`.
+
+        Raises:
+            IncompleteClusteringError: if a block still fails after
+                ``max_retries`` resubmissions.
+
+        """
+        blocks = self._get_blocks()
+        clusterers, todo = self._load_checkpointed_blocks(blocks, checkpoints, assignments)
+        indices_by_block = {block: indices for block, indices, _ in todo}
+        content_hashes = {block: content_hash for block, _, content_hash in todo}
+
+        def submit(block):
+            indices = indices_by_block[block]
+            return task.delay(
+                block,
+                [signature.signature_uuid for signature in self.X[indices, 0]],
+                self.y[indices].tolist(),
+            )
+
+        pending = {block: submit(block) for block in indices_by_block}
+        retries = defaultdict(int)
+
+        while pending:
+            for block, result in list(six.iteritems(pending)):
+                if not result.ready():
+                    continue
+                del pending[block]
+                if result.successful():
+                    data = result.get()
+                    clusterers[block] = load_block_clusterer(
+                        data, self.clustering_threshold, self.clustering_method)
+                    self.pruned_pairs[block] = data.get('pruned_pairs', 0)
+                    if checkpoints is not None:
+                        checkpoints.put(block, content_hashes[block], data)
+                    if assignments is not None:
+                        assignments.write_block(block, self.X[indices_by_block[block]], clusterers[block].labels_)
+                elif retries[block] < max_retries:
+                    retries[block] += 1
+                    pending[block] = submit(block)
+                else:
+                    raise IncompleteClusteringError(
+                        'Block {} failed {} times, last error: {!r}'.format(
+                            block, retries[block] + 1, result.result)
+                    )
+            if pending:
+                time.sleep(poll_interval)
+
+        self._set_clusterer(blocks, clusterers, n_jobs=1)
+
+    def fit_block(self, X, y):
+        """Fit the base estimator on the signatures of a single block.
+
+        Returns:
+            tuple: the fitted clusterer, and the number of pairs ruled out by
+            the pre-filter.
+
+        """
+        _set_prefilter_rules(self.prefilter_rules)
+        _set_cascade(self.cascade, self.cascade_band)
+        _set_scoring_threads(self.scoring_threads, self.threaded_min_size)
+        estimator = self._sparse_estimator() if self._is_sparse(len(X)) else self._base_estimator()
+        _, clusterer, pruned = _fit_block((None, X, y, estimator))
+        return clusterer, pruned
+
+    def score(self):
+        """Compare the fitted model with the known clusters.
+
+        Returns:
+            tuple: the B3 precision, recall and F-score over all signatures
+            with a known cluster.
+
+        """
+        known = self.y != -1
+        return b3_precision_recall_fscore(self.y[known], self.clusterer.labels_[known])
+
+    def evaluate(self, n_jobs=1, worst=20):
+        """Compare the fitted model with the known clusters block by block.
+
+        Args:
+            n_jobs(int): the number of processes among which blocks are split.
+            worst(int): how many of the worst blocks to report.
+
+        Returns:
+            dict: the report of :func:`~.evaluation.evaluate_blocks` over all
+            signatures with a known cluster.
+
+        """
+        known = self.y != -1
+        return evaluate_blocks(
+            self.y[known],
+            self.clusterer.labels_[known],
+            self.clusterer.blocks_[known],
+            n_jobs=n_jobs,
+            worst=worst,
+        )
+
+    def _get_blocks(self):
+        if self.blocks is not None:
+            return self.blocks
+        return self.block_function(self.X)
+
+    def _load_checkpointed_blocks(self, blocks, checkpoints, assignments=None):
+        """Split the blocks into already checkpointed ones and the rest.
+
+        The clusters of the checkpointed blocks are written to ``assignments``
+        if given.
+
+        Returns:
+            tuple: a dict of the fitted clusterers loaded from ``checkpoints``
+            by block, and a list of ``(block, indices, content_hash)`` for
+            the blocks that still have to be fitted.
+
+        """
+        clusterers = {}
+        todo = []
+        for block, indices in group_blocks(blocks):
+            content_hash = None
+            if checkpoints is not None:
+                content_hash = block_content_hash(self.X[indices], self.y[indices])
+                data = checkpoints.get(block, content_hash)
+                if data is not None:
+                    clusterers[block] = load_block_clusterer(
+                        data, self.clustering_threshold, self.clustering_method)
+                    self.pruned_pairs[block] = data.get('pruned_pairs', 0)
+                    if assignments is not None:
+                        assignments.write_block(block, self.X[indices], clusterers[block].labels_)
+                    continue
+            todo.append((block, indices, content_hash))
+
+        if checkpoints is not None:
+            LOGGER.info('Reusing %d checkpointed blocks, fitting %d blocks', len(clusterers), len(todo))
+
+        return clusterers, todo
+
+    def _base_estimator(self):
+        from beard.clustering import ScipyHierarchicalClustering
+
+        return ScipyHierarchicalClustering(
+            affinity=_affinity,
+            threshold=self.clustering_threshold,
+            method=self.clustering_method,
+            supervised_scoring=b3_f_score)
+
+    def _is_sparse(self, n_signatures):
+        return self.sparse_min_size is not None and n_signatures >= self.sparse_min_size
+
+    def _sparse_estimator(self):
+        from .sparse import SparseAverageLinkage
+
+        return SparseAverageLinkage(
+            affinity=partial(
+                _sparse_affinity,
+                n_bands=self.lsh_bands,
+                n_rows=self.lsh_rows,
+                max_bucket_size=self.lsh_max_bucket_size,
+            ),
+            threshold=self.clustering_threshold,
+        )
+
+    def _set_clusterer(self, blocks, clusterers, n_jobs):
+        from beard.clustering import BlockClustering
+
         self.clusterer = BlockClustering(
             blocking=self.block_function,
-            base_estimator=ScipyHierarchicalClustering(
-                affinity=_affinity,
-                threshold=self.clustering_threshold,
-                method=self.clustering_method,
-                supervised_scoring=b3_f_score),
+            base_estimator=self._base_estimator(),
             n_jobs=n_jobs,
             verbose=True)
-        self.clusterer.fit(self.X, self.y)
+        self.clusterer.blocks_ = blocks
+        self.clusterer.clusterers_ = clusterers
+        self.clusterer.fit_, self.clusterer.partial_fit_ = True, False
 
 
 @attr.s(slots=True)
@@ -395,83 +1016,467 @@ class Publication(object):
     def get(self, value, default):
         return getattr(self, value, default)
 
+    def to_dict(self):
+        return attr.asdict(self)
+
 
 def _affinity(X, step=10000):
     """Custom affinity function, using a pre-learned distance estimator."""
     # TODO find a way to avoid a global here, needed to avoid pickling/copying
     # the distance_estimator when passing the clusterers for each block around
-    global distance_estimator
+    global pruned_pairs
     all_i, all_j = np.triu_indices(len(X), k=1)
-    n_pairs = len(all_i)
-    distances = np.zeros(n_pairs, dtype=np.float64)
+    distances = np.ones(len(all_i), dtype=np.float64)
+
+    # Pairs ruled out by the pre-filter keep the maximum distance.
+    positions = np.flatnonzero(_prefilter(X, all_i, all_j))
+    pruned_pairs += len(all_i) - len(positions)
+    n_pairs = len(positions)
 
-    for start in range(0, n_pairs, step):
+    def score(start):
         end = min(n_pairs, start + step)
         Xt = np.empty((end - start, 2), dtype=np.object)
+        Xt[:, 0] = X[all_i[positions[start:end]], 0]
+        Xt[:, 1] = X[all_j[positions[start:end]], 0]
+        return start, end, _predict_distances(Xt)
+
+    for start, end, chunk in _map_chunks(score, range(0, n_pairs, step), len(X)):
+        distances[positions[start:end]] = chunk
+
+    return distances
+
+
+def _sparse_affinity(X, n_bands=32, n_rows=2, max_bucket_size=100, step=10000):
+    """Score only the candidate pairs of a block, found by MinHash LSH.
+
+    See :func:`~.sparse.lsh_candidate_pairs` and :func:`get_candidate_tokens`.
+    Like in :func:`_affinity`, pairs ruled out by the pre-filter are not
+    scored.
+
+    Returns:
+        tuple: the positions ``i`` and ``j`` and the distances of the scored
+        pairs.
+
+    """
+    from .sparse import lsh_candidate_pairs
+
+    global pruned_pairs
+    all_i, all_j = lsh_candidate_pairs(
+        [get_candidate_tokens(signature) for signature in X[:, 0]],
+        n_bands=n_bands,
+        n_rows=n_rows,
+        max_bucket_size=max_bucket_size,
+    )
+
+    kept = _prefilter(X, all_i, all_j)
+    pruned_pairs += len(all_i) - int(np.sum(kept))
+    all_i, all_j = all_i[kept], all_j[kept]
+
+    def score(start):
+        end = min(len(all_i), start + step)
+        Xt = np.empty((end - start, 2), dtype=np.object)
+        Xt[:, 0] = X[all_i[start:end], 0]
+        Xt[:, 1] = X[all_j[start:end], 0]
+        return start, end, _predict_distances(Xt)
+
+    distances = np.empty(len(all_i), dtype=np.float64)
+    for start, end, chunk in _map_chunks(score, range(0, len(all_i), step), len(X)):
+        distances[start:end] = chunk
+
+    return all_i, all_j, distances
+
+
+def _map_chunks(score, starts, n_signatures):
+    """Score the chunks of pairs of a block starting at ``starts``.
 
-        for k, (i, j) in enumerate(zip(all_i[start:end],
-                                       all_j[start:end])):
-            Xt[k, 0], Xt[k, 1] = X[i, 0], X[j, 0]
+    Blocks of at least ``threaded_min_size`` signatures are scored on a pool
+    of ``scoring_threads`` threads, which run at the same time while the
+    forest and the sparse matrix products of the features release the GIL,
+    so that the few largest blocks, fitted last, do not leave the other
+    cores idle. At most ``_allowed_threads()`` chunks are scored at once, so
+    that the blocks fitted at the same time do not run more threads than
+    there are cores. Chunks are only built by the threads.
 
-        Xt = distance_estimator.predict_proba(Xt)[:, 1]
-        distances[start:end] = Xt[:]
+    Yields:
+        tuple: the ``start`` and ``end`` of every chunk and its distances.
 
+    """
+    if threaded_min_size is None or n_signatures < threaded_min_size or scoring_threads <= 1:
+        for start in starts:
+            yield score(start)
+        return
+
+    from multiprocessing.pool import ThreadPool
+
+    pool = ThreadPool(scoring_threads)
+    pending = deque()
+    starts = iter(starts)
+    try:
+        while True:
+            # The number of threads is checked again after every chunk, so
+            # that a block gets more threads as the other blocks finish.
+            allowed = _allowed_threads()
+            while len(pending) < allowed:
+                start = next(starts, None)
+                if start is None:
+                    break
+                pending.append(pool.apply_async(score, (start,)))
+            if not pending:
+                return
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def _allowed_threads():
+    """Share the cores between the blocks being fitted.
+
+    When blocks are fitted on a pool of processes, the threads of every
+    block are ``max(scoring_threads, fitting_processes)`` divided by the
+    number of blocks being fitted, so that threads only use the cores left
+    idle by the processes that have no block left.
+    """
+    if running_blocks is None:
+        return scoring_threads
+    return min(scoring_threads, max(1, max(scoring_threads, fitting_processes) // max(1, running_blocks.value)))
+
+
+def _predict_distances(Xt):
+    """Predict the distances of signature pairs, through the cascade if set.
+
+    The pairs to which the cascade estimator gives a distance within the
+    cascade band are scored again by the distance estimator, the others keep
+    the distance of the cascade.
+    """
+    global scored_pairs, escalated_pairs
+    if cascade_estimator is None:
+        return distance_estimator.predict_proba(Xt)[:, 1]
+
+    distances = cascade_estimator.predict_proba(Xt)[:, 1]
+    low, high = cascade_band
+    uncertain = np.flatnonzero((distances >= low) & (distances <= high))
+    if len(uncertain):
+        distances[uncertain] = distance_estimator.predict_proba(Xt[uncertain])[:, 1]
+    with _counters_lock:
+        scored_pairs += len(Xt)
+        escalated_pairs += len(uncertain)
     return distances
 
 
-def load_signatures(signatures_path, publications_path):
-    publications_by_id = {}
-    with open(publications_path, 'r') as fd:
-        for line in fd:
-            publication = Publication(**json.loads(line))
-            publications_by_id[publication.publication_id] = publication
+def _prefilter(X, all_i, all_j):
+    """Return which pairs are not ruled out by the pre-filter rules.
+
+    A rule maps each signature to a key, or to an empty string when it does
+    not apply. A pair is ruled out when both keys are known and differ.
+    """
+    kept = np.ones(len(all_i), dtype=np.bool)
+    for rule in prefilter_rules:
+        keys = np.array([PREFILTER_RULES[rule](signature) for signature in X[:, 0]], dtype=np.unicode_)
+        _, codes = np.unique(keys, return_inverse=True)
+        codes[keys == ''] = -1
+        codes_i, codes_j = codes[all_i], codes[all_j]
+        kept &= (codes_i == -1) | (codes_j == -1) | (codes_i == codes_j)
+    return kept
+
+
+def _share_pairs(X):
+    """Split signature pairs into the distinct signatures and their indices.
+
+    Returns:
+        tuple: an object array of the distinct signatures, and an integer
+        array of the same shape as ``X`` with their positions in it.
+
+    """
+    positions = {}
+    pairs = np.empty(X.shape, dtype=np.int64)
+    for (i, j), signature in np.ndenumerate(X):
+        pairs[i, j] = positions.setdefault(signature.signature_uuid, len(positions))
+
+    signatures = np.empty(len(positions), dtype=np.object)
+    for (i, j), position in np.ndenumerate(pairs):
+        signatures[position] = X[i, j]
+    return signatures, pairs
+
+
+def _pool_map(func, iterable, n_jobs):
+    """Map ``func`` on a pool of forked processes, in order."""
+    if n_jobs == 1:
+        return list(six.moves.map(func, iterable))
+
+    pool = multiprocessing.Pool(n_jobs)
+    try:
+        return pool.map(func, iterable, chunksize=1)
+    finally:
+        pool.terminate()
+
+
+def _transform_shared_pairs(n_pairs, n_jobs, chunk_size):
+    """Transform the shared pairs with every shared branch, chunk by chunk.
+
+    Returns:
+        the features of the pairs, laid out as by ``FeatureUnion.transform``.
+
+    """
+    from scipy import sparse
+
+    chunks = [(start, min(start + chunk_size, n_pairs)) for start in range(0, n_pairs, chunk_size)]
+    n_branches = len(_shared_branches)
+    tasks = [(i, start, end) for i in range(n_branches) for start, end in chunks]
+    Xt = _pool_map(_transform_branch_chunk, tasks, n_jobs)
+
+    # Same layout as FeatureUnion.transform: branches side by side, each
+    # of them being its chunks one on top of the other.
+    Xt = [Xt[i * len(chunks):(i + 1) * len(chunks)] for i in range(n_branches)]
+    if any(sparse.issparse(block) for blocks in Xt for block in blocks):
+        return sparse.hstack([sparse.vstack(blocks) for blocks in Xt]).tocsr()
+    return np.hstack([np.vstack(blocks) for blocks in Xt])
+
 
-    signatures_by_uuid = {}
-    with open(signatures_path, 'r') as fd:
-        for line in fd:
-            signature = json.loads(line)
-            signature['publication'] = publications_by_id[signature['publication_id']]
-            del signature['publication_id']
-            signatures_by_uuid[signature['signature_uuid']] = Signature(**signature)
+def _fit_branch(i):
+    branch = _shared_branches[i]
+    branch.fit(_shared_signatures[_shared_pairs], _shared_y)
+    return branch
+
+
+def _transform_branch_chunk(args):
+    i, start, end = args
+    return _shared_branches[i].transform(_shared_signatures[_shared_pairs[start:end]])
+
+
+def _fit_block(args):
+    from sklearn.base import clone
+
+    from beard.clustering.blocking import _SingleClustering
+
+    global pruned_pairs, scored_pairs, escalated_pairs
+    block, X, y, estimator = args
+    pruned_pairs = scored_pairs = escalated_pairs = 0
+    X = _decode_publications(X)
+    if len(X) == 1:
+        clusterer = _SingleClustering()
+    else:
+        clusterer = clone(estimator)
+    if running_blocks is not None:
+        with running_blocks.get_lock():
+            running_blocks.value += 1
+    try:
+        clusterer.fit(X, y=y)
+    finally:
+        if running_blocks is not None:
+            with running_blocks.get_lock():
+                running_blocks.value -= 1
+    if cascade_estimator is not None:
+        clusterer.n_scored_pairs_ = scored_pairs
+        clusterer.n_escalated_pairs_ = escalated_pairs
+    return block, clusterer, pruned_pairs
+
+
+def _decode_publications(X):
+    """Copy the signatures of a block with their lazy publications decoded.
+
+    The features read the publications of a block once per pair, which
+    would go through the cache of the :class:`~.publications.PublicationStore`
+    every time, and evict each other from it in blocks with more publications
+    than it holds. The copies are dropped with the block.
+    """
+    if not any(isinstance(signature.publication, LazyPublication) for signature in X[:, 0]):
+        return X
+
+    publications = {}
+    decoded = np.empty(X.shape, dtype=np.object)
+    for i, signature in enumerate(X[:, 0]):
+        publication = signature.publication
+        if isinstance(publication, LazyPublication):
+            if publication.publication_id not in publications:
+                publications[publication.publication_id] = Publication(**publication.to_dict())
+            publication = publications[publication.publication_id]
+        decoded[i, 0] = attr.evolve(signature, publication=publication)
+    return decoded
+
+
+def _set_prefilter_rules(rules):
+    global prefilter_rules
+    unknown = set(rules) - set(PREFILTER_RULES)
+    if unknown:
+        raise ValueError('Unknown pre-filter rules: {}'.format(', '.join(sorted(unknown))))
+    prefilter_rules = list(rules)
+
+
+def _set_cascade(estimator, band):
+    global cascade_estimator, cascade_band
+    low, high = band
+    if not 0 <= low <= high <= 1:
+        raise ValueError('Invalid cascade band: {}'.format(band))
+    cascade_estimator = getattr(estimator, 'distance_estimator', None)
+    cascade_band = (low, high)
+
+
+def _set_scoring_threads(n_threads, min_size, n_processes=None):
+    global scoring_threads, threaded_min_size, fitting_processes, running_blocks
+    scoring_threads = n_threads
+    threaded_min_size = min_size
+    fitting_processes = n_processes or 1
+    running_blocks = multiprocessing.Value('i', 0) if n_processes else None
+
+
+def dump_block_clusterer(clusterer):
+    """Serialize a fitted block clusterer to plain, JSON-compatible types."""
+    from beard.clustering.blocking import _SingleClustering
+
+    if isinstance(clusterer, _SingleClustering):
+        return {'linkage': None, 'best_threshold': None, 'n_samples': len(clusterer.labels_)}
+    return {
+        'linkage': clusterer.linkage_.tolist(),
+        'best_threshold': float(clusterer.best_threshold_),
+        'n_samples': int(clusterer.n_samples_),
+    }
+
+
+def load_block_clusterer(data, threshold, method):
+    """Rebuild a fitted block clusterer from :func:`dump_block_clusterer`."""
+    from beard.clustering import ScipyHierarchicalClustering
+    from beard.clustering.blocking import _SingleClustering
+
+    if data['linkage'] is None:
+        clusterer = _SingleClustering()
+        clusterer.labels_ = np.zeros(data['n_samples'], dtype=np.int)
+        return clusterer
+
+    clusterer = ScipyHierarchicalClustering(
+        affinity=_affinity,
+        threshold=threshold,
+        method=method,
+        supervised_scoring=b3_f_score)
+    clusterer.linkage_ = np.asarray(data['linkage'], dtype=np.float64)
+    clusterer.best_threshold_ = data['best_threshold']
+    clusterer.n_samples_ = data['n_samples']
+    return clusterer
+
+
+def _is_held_out(author_id, holdout_every):
+    return (zlib.crc32(six.text_type(author_id).encode('utf-8')) & 0xffffffff) % holdout_every == 0
+
+
+def load_signatures(signatures_path, publications_path, publications_index_path=None,
+                    uncurated_signatures_path=None, publications_cache_size=DEFAULT_CACHE_SIZE):
+    """Load the signatures with their publications.
+
+    Args:
+        publications_index_path(str): if given, publications are not loaded
+            but read when used through this index, see
+            :class:`~.publications.LazyPublication`.
+        publications_cache_size(int): the number of publications read
+            through ``publications_index_path`` kept decoded.
+        uncurated_signatures_path(str): if given, its signatures are loaded
+            too, after the ones of ``signatures_path``.
+
+    Returns:
+        dict: the signatures by UUID, in order of first appearance.
+
+    """
+    if publications_index_path:
+        store = open_publication_store(publications_path, publications_index_path, publications_cache_size)
+        publications_by_id = _LazyPublications(store)
+    else:
+        publications_by_id = {}
+        with open(publications_path, 'r') as fd:
+            for line in fd:
+                publication = Publication(**json.loads(line))
+                publications_by_id[publication.publication_id] = publication
+
+    signatures_by_uuid = OrderedDict()
+    for path in (signatures_path, uncurated_signatures_path):
+        if not path:
+            continue
+        with open(path, 'r') as fd:
+            for line in fd:
+                signature = json.loads(line)
+                signature['publication'] = publications_by_id[signature['publication_id']]
+                del signature['publication_id']
+                signatures_by_uuid[signature['signature_uuid']] = Signature(**signature)
 
     return signatures_by_uuid
 
 
+class _LazyPublications(object):
+    """One :class:`~.publications.LazyPublication` per publication id."""
+
+    def __init__(self, store):
+        self.store = store
+        self.publications = {}
+
+    def __getitem__(self, publication_id):
+        if publication_id not in self.publications:
+            if publication_id not in self.store:
+                raise KeyError(publication_id)
+            self.publications[publication_id] = LazyPublication(publication_id, self.store)
+        return self.publications[publication_id]
+
+
+_beard_utils_module = None
+
+
+def _beard_utils():
+    """Return :mod:`beard.utils`, imported on first use.
+
+    The extractors below run once per signature, an import statement there
+    would be paid millions of times per block.
+    """
+    global _beard_utils_module
+    if _beard_utils_module is None:
+        import beard.utils
+        _beard_utils_module = beard.utils
+    return _beard_utils_module
+
+
 def get_author_full_name(signature):
-    return normalize_name(signature.author_name)
+    return _beard_utils().normalize_name(signature.author_name)
 
 
 def get_first_initial(signature):
     try:
-        return given_name_initial(signature.author_name, 0)
+        return _beard_utils().given_name_initial(signature.author_name, 0)
     except IndexError:
         return ''
 
 
 def get_second_initial(signature):
     try:
-        return given_name_initial(signature.author_name, 1)
+        return _beard_utils().given_name_initial(signature.author_name, 1)
     except IndexError:
         return ''
 
 
+def get_first_full_given_name(signature):
+    """Return the first given name when it is spelled out, not an initial.
+
+    Only the part before a hyphen is kept, so that ``Jean-Pierre`` and
+    ``Jean`` are not seen as conflicting.
+    """
+    name = _beard_utils().given_name(signature.author_name, 0)
+    if '.' in name:
+        return ''
+    name = _beard_utils().asciify(name.split('-')[0]).lower()
+    return name if len(name) > 1 and name.isalpha() else ''
+
+
 def get_first_given_name(signature):
-    return given_name(signature.author_name, 0)
+    return _beard_utils().given_name(signature.author_name, 0)
 
 
 def get_second_given_name(signature):
-    return given_name(signature.author_name, 1)
+    return _beard_utils().given_name(signature.author_name, 1)
 
 
 def get_author_other_names(signature):
     author_name = signature.author_name
     other_names = author_name.split(',', 1)
-    return normalize_name(other_names[1]) if len(other_names) == 2 else ''
+    return _beard_utils().normalize_name(other_names[1]) if len(other_names) == 2 else ''
 
 
 def get_author_affiliation(signature):
     author_affiliation = signature.author_affiliation
-    return normalize_name(author_affiliation) if author_affiliation else ''
+    return _beard_utils().normalize_name(author_affiliation) if author_affiliation else ''
 
 
 def get_coauthors_neighborhood(signature, radius=10):
@@ -503,5 +1508,70 @@ def get_title(signature):
     return signature.publication.title
 
 
+def get_candidate_tokens(signature):
+    """Get the tokens compared by MinHash to find candidate pairs in a block.
+
+    These are the name components, the words of the coauthor names, of the
+    title and of the affiliation, and the collaborations. Tokens are
+    prefixed by their field, so that the same word in two fields does not
+    match.
+    """
+    tokens = ['initial:' + get_first_initial(signature)]
+    given_name = get_first_full_given_name(signature)
+    if given_name:
+        tokens.append('given_name:' + given_name)
+    tokens.extend('coauthor:' + word.strip('.,').lower()
+                  for word in get_coauthors_neighborhood(signature).split())
+    tokens.extend('title:' + word for word in (get_title(signature) or '').lower().split() if len(word) > 3)
+    tokens.extend('affiliation:' + word for word in (signature.author_affiliation or '').lower().split())
+    tokens.extend('collaboration:' + collaboration for collaboration in signature.publication.collaborations)
+    return tokens
+
+
 def group_by_signature(signatures):
     return signatures[0].signature_uuid
+
+
+PREFILTER_RULES = {
+    'first_initial': get_first_initial,
+    'first_full_given_name': get_first_full_given_name,
+}
+"""Rules available to the pair pre-filter of :class:`Clusterer`, by name."""
+
+prefilter_rules = []
+pruned_pairs = 0
+
+CASCADE_FEATURES = [
+    'author_full_name_similarity',
+    'author_second_initial_similarity',
+    'author_first_given_name_similarity',
+    'author_second_given_name_similarity',
+    'author_other_names_similarity',
+    'coauthors_similarity',
+]
+"""Features of the cheap first tier of the distance model cascade.
+
+They only read the names of the signatures and their coauthors, leaving out
+the text of the publications and the ethnicity model.
+"""
+
+cascade_estimator = None
+cascade_band = (0.0, 1.0)
+scored_pairs = 0
+escalated_pairs = 0
+_counters_lock = threading.Lock()
+
+scoring_threads = 1
+threaded_min_size = None
+# Set by Clusterer.fit before forking its workers: how many processes fit
+# blocks and how many of them are fitting one right now, see
+# ``_allowed_threads``.
+fitting_processes = 1
+running_blocks = None
+
+# Set by DistanceEstimator.fit before forking its workers, which read the
+# signatures from here instead of receiving pickled copies.
+_shared_signatures = None
+_shared_pairs = None
+_shared_y = None
+_shared_branches = None
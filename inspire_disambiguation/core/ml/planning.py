@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation core ML planning."""
+
+from __future__ import absolute_import, division, print_function
+
+import heapq
+
+import numpy as np
+
+from .blocking import compute_signature_blocks, load_block_index
+
+
+DEFAULT_SECONDS_PER_PAIR = 2e-4
+"""Time to score a pair of signatures when no benchmark results are given.
+
+A rough figure for the full distance model on a single core, use
+:func:`calibrate` on the results of the ``benchmark`` command of the machine
+running the clustering instead.
+"""
+
+BYTES_PER_PAIR = 40
+"""Memory needed per pair of signatures while clustering a block.
+
+``_affinity`` holds the two ``int64`` indices of every pair, the positions
+of the pairs kept by the pre-filter and their ``float64`` distances, and
+the linkage copies the distances once more.
+"""
+
+
+def calibrate(results):
+    """Get the time to score a pair from benchmark results.
+
+    Args:
+        results(list): as returned by
+            :func:`~inspire_disambiguation.benchmarks.suite.run_benchmarks`.
+
+    Returns:
+        float: the seconds per pair of the ``_affinity`` stage on the
+        largest block that was timed, or :data:`DEFAULT_SECONDS_PER_PAIR` if
+        there is none.
+
+    """
+    timings = [result for result in results if result['stage'] == '_affinity' and result['items']]
+    if not timings:
+        return DEFAULT_SECONDS_PER_PAIR
+    largest = max(timings, key=lambda result: result['items'])
+    return largest['seconds'] / largest['items']
+
+
+def load_block_sizes(signatures_path, block_index_path=None, uncurated_signatures_path=None):
+    """Block the signatures as :class:`~.models.Clusterer` does.
+
+    Only the author names are read, no model nor publication is loaded.
+
+    Args:
+        block_index_path(str): if given, the sizes of the blocks are read
+            from this index instead, see :func:`~.blocking.save_block_index`.
+        uncurated_signatures_path(str): if given, its signatures are
+            clustered too, see :func:`~.blocking.compute_signature_blocks`.
+
+    Returns:
+        list: pairs of ``(block, size)``, sorted by block.
+
+    """
+    if block_index_path:
+        blocks, _, _, offsets = load_block_index(block_index_path, signatures_path, uncurated_signatures_path)
+        return list(zip(blocks, np.diff(offsets).tolist()))
+
+    blocks, sizes = np.unique(
+        compute_signature_blocks(signatures_path, uncurated_signatures_path), return_counts=True)
+    return list(zip(blocks, sizes.tolist()))
+
+
+def _size_histogram(sizes):
+    """Count the blocks, signatures and pairs by powers of two of block size."""
+    bins = np.floor(np.log2(sizes)).astype(np.int64)
+    histogram = []
+    for b in range(bins.max() + 1 if len(bins) else 0):
+        in_bin = sizes[bins == b]
+        if not len(in_bin):
+            continue
+        histogram.append({
+            'min_size': 2 ** b,
+            'max_size': 2 ** (b + 1) - 1,
+            'blocks': len(in_bin),
+            'signatures': int(np.sum(in_bin)),
+            'pairs': int(np.sum(in_bin * (in_bin - 1) // 2)),
+        })
+    return histogram
+
+
+def _schedule(seconds, memory, n_jobs):
+    """Simulate fitting blocks on ``n_jobs`` processes, largest first.
+
+    Every block goes to the first process to become free, as with the
+    ``imap_unordered`` of :meth:`~.models.Clusterer.fit`.
+
+    Returns:
+        tuple: the time when the last block ends, and the largest memory
+        needed by the blocks being fitted at the same time.
+
+    """
+    running = [(0.0, 0)] * min(n_jobs, len(seconds))
+    peak_memory = 0
+    for block_seconds, block_memory in zip(seconds, memory):
+        start, _ = heapq.heappop(running)
+        heapq.heappush(running, (start + block_seconds, block_memory))
+        peak_memory = max(peak_memory, sum(m for end, m in running if end > start))
+    return max(end for end, _ in running) if running else 0.0, peak_memory
+
+
+def plan_clustering(block_sizes, n_jobs, seconds_per_pair=DEFAULT_SECONDS_PER_PAIR, top=20):
+    """Predict the cost of clustering blocks of the given sizes.
+
+    The time and memory of a block are taken proportional to its number of
+    pairs, which dominates the cost of computing its distances and its
+    linkage. Pairs ruled out by the pre-filter are counted as well.
+
+    Args:
+        block_sizes(list): pairs of ``(block, size)``, see
+            :func:`load_block_sizes`.
+        n_jobs(int): the number of processes fitting blocks.
+        seconds_per_pair(float): the time to score a pair, see :func:`calibrate`.
+        top(int): how many of the largest blocks to report.
+
+    Returns:
+        dict: the number of ``signatures``, ``blocks`` and ``pairs``, the
+        block size ``histogram``, the total ``cpu_seconds``, the expected
+        ``makespan_seconds`` and ``peak_memory_bytes`` with ``n_jobs``
+        processes, and the size, pairs, ``seconds`` and ``memory_bytes`` of
+        the ``largest_blocks``.
+
+    """
+    blocks = [block for block, _ in block_sizes]
+    sizes = np.array([size for _, size in block_sizes], dtype=np.int64)
+    pairs = sizes * (sizes - 1) // 2
+    seconds = pairs * seconds_per_pair
+    memory = pairs * BYTES_PER_PAIR
+
+    order = np.argsort(-sizes, kind='mergesort')
+    makespan, peak_memory = _schedule(seconds[order], memory[order], n_jobs)
+
+    return {
+        'signatures': int(np.sum(sizes)),
+        'blocks': len(sizes),
+        'pairs': int(np.sum(pairs)),
+        'histogram': _size_histogram(sizes),
+        'n_jobs': n_jobs,
+        'seconds_per_pair': seconds_per_pair,
+        'cpu_seconds': float(np.sum(seconds)),
+        'makespan_seconds': float(makespan),
+        'peak_memory_bytes': int(peak_memory),
+        'largest_blocks': [{
+            'block': str(blocks[i]),
+            'signatures': int(sizes[i]),
+            'pairs': int(pairs[i]),
+            'seconds': float(seconds[i]),
+            'memory_bytes': int(memory[i]),
+        } for i in order[:top]],
+    }
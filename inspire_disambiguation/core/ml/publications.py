@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation core ML publications."""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ...utils import open_file_in_folder
+
+PUBLICATIONS_INDEX_VERSION = 1
+
+DEFAULT_CACHE_SIZE = 10000
+"""Number of decoded publications kept by a :class:`PublicationStore`.
+
+See ``DISAMBIGUATION_PUBLICATIONS_CACHE_SIZE``.
+"""
+
+
+def save_publications_index(output_filename, publications_path, publication_ids, lengths):
+    """Save the position of every line of ``publications.jsonl``.
+
+    The ``.npz`` file holds the ``publication_ids``, sorted, with the byte
+    ``offsets`` and ``lengths`` of their lines, and a JSON ``manifest`` with
+    the size of ``publications_path``, so that an index is never applied to
+    another file.
+
+    Args:
+        output_filename(str): the ``.npz`` file to write.
+        publications_path(str): the file that was indexed.
+        publication_ids(list): the id of the publication of every line, in
+            order.
+        lengths(list): the length in bytes of every line, in order.
+
+    """
+    publication_ids = np.array(publication_ids, dtype=np.int64)
+    lengths = np.array(lengths, dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+    order = np.argsort(publication_ids, kind='mergesort')
+
+    manifest = {
+        'version': PUBLICATIONS_INDEX_VERSION,
+        'publications_size': os.path.getsize(publications_path),
+        'publications': len(publication_ids),
+    }
+    with open_file_in_folder(output_filename, 'wb') as fd:
+        np.savez(
+            fd,
+            publication_ids=publication_ids[order],
+            offsets=offsets[order],
+            lengths=lengths[order],
+            manifest=np.array(json.dumps(manifest)),
+        )
+
+
+def build_publications_index(output_filename, publications_path):
+    """Index an existing ``publications.jsonl``, see :func:`save_publications_index`.
+
+    Returns:
+        int: the number of indexed publications.
+
+    """
+    publication_ids, lengths = [], []
+    with open(publications_path, 'rb') as fd:
+        for line in fd:
+            publication_ids.append(json.loads(line.decode('utf-8'))['publication_id'])
+            lengths.append(len(line))
+    save_publications_index(output_filename, publications_path, publication_ids, lengths)
+    return len(publication_ids)
+
+
+def load_publications_index(input_filename, publications_path):
+    """Load the index saved by :func:`save_publications_index`.
+
+    Raises:
+        ValueError: if the index was not built for ``publications_path`` as
+            it is now.
+
+    Returns:
+        tuple: the sorted ``publication_ids`` and their ``offsets`` and
+        ``lengths``.
+
+    """
+    with np.load(input_filename) as data:
+        manifest = json.loads(str(data['manifest']))
+        if manifest['version'] != PUBLICATIONS_INDEX_VERSION:
+            raise ValueError('Unsupported publications index version {} in {}'.format(
+                manifest['version'], input_filename))
+        if manifest['publications_size'] != os.path.getsize(publications_path):
+            raise ValueError('{} does not index the current {}, index the publications again'.format(
+                input_filename, publications_path))
+        return data['publication_ids'], data['offsets'], data['lengths']
+
+
+class PublicationStore(object):
+    """Random access to the publications of ``publications.jsonl``.
+
+    Lines are read through a memory map of the file, at the offsets of its
+    index, and the last ``cache_size`` decoded publications are kept. Memory
+    thus depends on the publications in use, not on the size of the file.
+
+    Stores are shared by all :class:`LazyPublication` of a process, and
+    pickled as their paths, so that sending publications to another process
+    does not copy them. A store refuses to read a file that changed since it
+    was opened, e.g. by a new export, as reading a memory map of a truncated
+    file would crash the process.
+
+    Args:
+        publications_path(str): the ``publications.jsonl`` file.
+        index_path(str): its index, see :func:`save_publications_index`.
+        cache_size(int): the number of decoded publications kept.
+
+    """
+
+    def __init__(self, publications_path, index_path, cache_size=DEFAULT_CACHE_SIZE):
+        self.publications_path = publications_path
+        self.index_path = index_path
+        self.cache_size = cache_size
+        self.publication_ids, self.offsets, self.lengths = load_publications_index(index_path, publications_path)
+
+        self._fd = open(publications_path, 'rb')
+        self.file_state = _file_state(os.fstat(self._fd.fileno()))
+        self._mmap = None
+        if os.path.getsize(publications_path):
+            self._mmap = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        return open_publication_store, (self.publications_path, self.index_path, self.cache_size)
+
+    def __contains__(self, publication_id):
+        return self._position(publication_id) is not None
+
+    def get(self, publication_id):
+        """Return the decoded record of a publication.
+
+        Raises:
+            KeyError: if the publication is not in the index.
+
+        """
+        with self._lock:
+            record = self._cache.pop(publication_id, None)
+            if record is not None:
+                self._cache[publication_id] = record
+                return record
+
+        i = self._position(publication_id)
+        if i is None:
+            raise KeyError(publication_id)
+        if _file_state(os.fstat(self._fd.fileno())) != self.file_state:
+            raise ValueError('{} changed since it was opened, load the signatures again'.format(
+                self.publications_path))
+        offset, length = self.offsets[i], self.lengths[i]
+        record = json.loads(self._mmap[offset:offset + length].decode('utf-8'))
+        if record['publication_id'] != publication_id:
+            raise ValueError('{} is out of date, index the publications again'.format(self.index_path))
+
+        with self._lock:
+            self._cache[publication_id] = record
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return record
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._fd.close()
+
+    def _position(self, publication_id):
+        i = np.searchsorted(self.publication_ids, publication_id)
+        if i < len(self.publication_ids) and self.publication_ids[i] == publication_id:
+            return i
+        return None
+
+
+_stores = {}
+
+
+def open_publication_store(publications_path, index_path, cache_size=DEFAULT_CACHE_SIZE):
+    """Get the :class:`PublicationStore` of these files, shared in the process.
+
+    A store whose file was replaced or modified since it was opened is
+    closed and opened again, so that long-lived processes, such as the
+    Celery workers, read the last export.
+    """
+    key = (publications_path, index_path, cache_size)
+    store = _stores.get(key)
+    if store is not None and store.file_state != _file_state(os.stat(publications_path)):
+        store.close()
+        store = None
+    if store is None:
+        store = _stores[key] = PublicationStore(publications_path, index_path, cache_size)
+    return store
+
+
+def _file_state(stat):
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+class LazyPublication(object):
+    """A publication whose fields are read from a :class:`PublicationStore`.
+
+    Only the ``publication_id`` is held in memory, the other fields of
+    :class:`~.models.Publication` are decoded when first accessed.
+    """
+
+    __slots__ = ('publication_id', '_store')
+
+    def __init__(self, publication_id, store):
+        self.publication_id = publication_id
+        self._store = store
+
+    def __reduce__(self):
+        return LazyPublication, (self.publication_id, self._store)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._store.get(self.publication_id)[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, value):
+        return getattr(self, value)
+
+    def get(self, value, default):
+        return getattr(self, value, default)
+
+    def to_dict(self):
+        return dict(self._store.get(self.publication_id))
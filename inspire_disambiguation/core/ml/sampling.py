@@ -24,18 +24,28 @@
 
 from __future__ import absolute_import, division, print_function
 
+import heapq
 import itertools
 import json
+import multiprocessing
 import random
 
 from collections import defaultdict
 
+import numpy as np
+
+from ...utils import hash_file, open_file_in_folder
+from .blocking import load_signature_blocks
+
+SAMPLED_PAIRS_INDEX_VERSION = 1
+
 
 class IncompleteSamplingError(Exception):
     pass
 
 
-def sample_signature_pairs(signatures_path, clusters_path, pairs_size):
+def sample_signature_pairs(signatures_path, clusters_path, pairs_size, signature_rows=False, block_index_path=None,
+                           uncurated_signatures_path=None):
     """Sample signature pairs to generate less training data.
 
     Since INSPIRE contains ~3M curated signatures it would take too much time
@@ -52,6 +62,8 @@ def sample_signature_pairs(signatures_path, clusters_path, pairs_size):
            At the same time we partition the signatures in blocks according
            to the phonetic encoding of the name. Note that two signatures
            pointing to two distinct authors might end up in the same block.
+           The blocks are the ``signature_block`` of the signatures, or the
+           ones of the clustering when read from ``block_index_path``.
 
         2. Then we classify signature pairs that belong to the same block
            according to whether they belong to same cluster and whether they
@@ -68,6 +80,18 @@ def sample_signature_pairs(signatures_path, clusters_path, pairs_size):
            number of non-empty categories, to make sure that we will sample
            the same number of pairs from each category.
 
+    Args:
+        signature_rows(bool): also give in ``signature_rows`` the positions
+            of the two signatures among the distinct signatures of
+            ``signatures_path``, in order of first appearance, which is the
+            order of :func:`~inspire_disambiguation.core.ml.models.load_signatures`.
+        block_index_path(str): if given, the index of the blocks of
+            ``signatures_path`` saved by
+            :func:`~inspire_disambiguation.core.ml.blocking.save_block_index`.
+        uncurated_signatures_path(str): the uncurated signatures blocked
+            with ``signatures_path`` in ``block_index_path``, if any. They
+            are never sampled.
+
     Yields:
         dict: a signature pair.
 
@@ -77,22 +101,9 @@ def sample_signature_pairs(signatures_path, clusters_path, pairs_size):
     # 1. Read & Build
     #
 
-    blocks_and_uuids = []
-    blocks = defaultdict(list)
-    author_names_by_signature_uuid = {}
-    with open(signatures_path, 'r') as fd:
-        for line in fd:
-            signature = json.loads(line)
-            blocks[signature['signature_block']].append(signature['signature_uuid'])
-            blocks_and_uuids.append((signature['signature_block'], signature['signature_uuid']))
-            author_names_by_signature_uuid[signature['signature_uuid']] = signature['author_name']
-
-    cluster_ids_by_signature_uuid = {}
-    with open(clusters_path, 'r') as fd:
-        for line in fd:
-            cluster = json.loads(line)
-            for signature_uuid in cluster['signature_uuids']:
-                cluster_ids_by_signature_uuid[signature_uuid] = cluster['cluster_id']
+    (blocks_and_uuids, blocks, author_names_by_signature_uuid, rows_by_signature_uuid,
+     cluster_ids_by_signature_uuid) = _read_signatures_and_clusters(
+        signatures_path, clusters_path, block_index_path, uncurated_signatures_path)
 
     #
     # 2. Monte Carlo sampling for efficiency
@@ -122,10 +133,274 @@ def sample_signature_pairs(signatures_path, clusters_path, pairs_size):
         kind = (same_cluster(s1, s2), same_name(s1, s2))
         if counts[kind] < pairs_size // 4:
             counts[kind] += 1
-            yield {'same_cluster': kind[0], 'signature_uuids': [s1, s2]}
+            pair = {'same_cluster': kind[0], 'signature_uuids': [s1, s2]}
+            if signature_rows:
+                pair['signature_rows'] = [rows_by_signature_uuid[s1], rows_by_signature_uuid[s2]]
+            yield pair
 
     if iterations == max_iterations:
         raise IncompleteSamplingError(
             'Could not generate {} samples, only managed to generate {} in reasonable time.'
             ' Generated samples are probably unbalanced.'.format(pairs_size, sum(counts.values()))
         )
+
+
+def _read_signatures_and_clusters(signatures_path, clusters_path, block_index_path=None,
+                                  uncurated_signatures_path=None):
+    signature_blocks = None
+    if block_index_path:
+        # the uncurated signatures are blocked after the curated ones, so
+        # the rows of the latter are the same
+        signature_blocks = load_signature_blocks(block_index_path, signatures_path, uncurated_signatures_path)
+
+    blocks_and_uuids = []
+    blocks = defaultdict(list)
+    author_names_by_signature_uuid = {}
+    rows_by_signature_uuid = {}
+    with open(signatures_path, 'r') as fd:
+        for line in fd:
+            signature = json.loads(line)
+            row = rows_by_signature_uuid.setdefault(signature['signature_uuid'], len(rows_by_signature_uuid))
+            block = signature['signature_block'] if signature_blocks is None else signature_blocks[row]
+            blocks[block].append(signature['signature_uuid'])
+            blocks_and_uuids.append((block, signature['signature_uuid']))
+            author_names_by_signature_uuid[signature['signature_uuid']] = signature['author_name']
+
+    cluster_ids_by_signature_uuid = {}
+    with open(clusters_path, 'r') as fd:
+        for line in fd:
+            cluster = json.loads(line)
+            for signature_uuid in cluster['signature_uuids']:
+                cluster_ids_by_signature_uuid[signature_uuid] = cluster['cluster_id']
+
+    return (blocks_and_uuids, blocks, author_names_by_signature_uuid, rows_by_signature_uuid,
+            cluster_ids_by_signature_uuid)
+
+
+def sample_signature_pairs_parallel(signatures_path, clusters_path, pairs_size, seed=0, n_jobs=1,
+                                    signature_rows=False, max_iterations_per_pair=1000, max_rounds=3,
+                                    block_index_path=None, uncurated_signatures_path=None):
+    """Sample signature pairs reproducibly, on several processes.
+
+    Same sampling as :func:`sample_signature_pairs`, except that blocks are
+    split into ``n_jobs`` partitions of similar numbers of signatures, each
+    of them sampled by its own process with a random generator seeded from
+    ``seed``, the partition and the round.
+
+    Every partition gets a share of the quota of every category of pairs
+    proportional to its number of signatures. The part of a quota that a
+    partition could not fill, e.g. because it has no signatures of the same
+    cluster with different names, is given in another round to the
+    partitions that filled theirs. Pairs are then yielded partition by
+    partition and round by round. The output thus only depends on the input
+    files, ``seed`` and ``n_jobs``.
+
+    Args:
+        seed(int): the master seed.
+        n_jobs(int): the number of partitions, and of processes.
+        signature_rows(bool): as in :func:`sample_signature_pairs`.
+        block_index_path(str): as in :func:`sample_signature_pairs`.
+        uncurated_signatures_path(str): as in :func:`sample_signature_pairs`.
+        max_iterations_per_pair(int): how many draws a partition may make
+            per pair of its quotas, before giving up on them.
+        max_rounds(int): how many times missing pairs are redistributed.
+
+    Raises:
+        IncompleteSamplingError: if some quotas are still not filled after
+            ``max_rounds`` rounds.
+
+    Yields:
+        dict: a signature pair.
+
+    """
+    global _sampling_data, _sampling_partitions
+
+    (blocks_and_uuids, blocks, author_names_by_signature_uuid, rows_by_signature_uuid,
+     cluster_ids_by_signature_uuid) = _read_signatures_and_clusters(
+        signatures_path, clusters_path, block_index_path, uncurated_signatures_path)
+    partitions = _partition_blocks(blocks, n_jobs)
+    sizes = [sum(len(blocks[block]) for block in partition) for partition in partitions]
+
+    kinds = [(True, True), (True, False), (False, True), (False, False)]
+    quotas = [dict() for _ in partitions]
+    for kind in kinds:
+        for quota, share in zip(quotas, _apportion(pairs_size // 4, sizes)):
+            quota[kind] = share
+
+    # Set as globals so that the forked workers share them instead of
+    # receiving a pickled copy with each task.
+    _sampling_data = (blocks, author_names_by_signature_uuid, rows_by_signature_uuid,
+                      cluster_ids_by_signature_uuid, signature_rows, max_iterations_per_pair)
+    _sampling_partitions = partitions
+
+    pairs = [[] for _ in partitions]
+    try:
+        for sampling_round in range(max_rounds):
+            tasks = [(i, seed, sampling_round, quota) for i, quota in enumerate(quotas) if any(quota.values())]
+            filled = set()
+            missing = dict.fromkeys(kinds, 0)
+            for (i, _, _, quota), (partition_pairs, counts) in zip(tasks, _map_partitions(tasks, n_jobs)):
+                pairs[i].extend(partition_pairs)
+                for kind in kinds:
+                    missing[kind] += quota[kind] - counts[kind]
+                    if quota[kind] and counts[kind] == quota[kind]:
+                        filled.add((i, kind))
+
+            quotas = [dict.fromkeys(kinds, 0) for _ in partitions]
+            for kind in kinds:
+                donees = [i for i in range(len(partitions)) if (i, kind) in filled]
+                if not missing[kind] or not donees:
+                    continue
+                for i, share in zip(donees, _apportion(missing[kind], [sizes[i] for i in donees])):
+                    quotas[i][kind] = share
+            if not any(any(quota.values()) for quota in quotas):
+                break
+    finally:
+        _sampling_data = _sampling_partitions = None
+
+    n_pairs = sum(len(partition_pairs) for partition_pairs in pairs)
+    if n_pairs < 4 * (pairs_size // 4):
+        raise IncompleteSamplingError(
+            'Could not generate {} samples, only managed to generate {} in reasonable time.'
+            ' Generated samples are probably unbalanced.'.format(pairs_size, n_pairs)
+        )
+
+    for partition_pairs in pairs:
+        for pair in partition_pairs:
+            yield pair
+
+
+def _partition_blocks(blocks, n_partitions):
+    """Split blocks into partitions of similar numbers of signatures.
+
+    Blocks go, largest first, to the partition with the fewest signatures,
+    so that the partitions only depend on the blocks.
+    """
+    partitions = [[] for _ in range(n_partitions)]
+    loads = [(0, i) for i in range(n_partitions)]
+    for block in sorted(blocks, key=lambda block: (-len(blocks[block]), str(block))):
+        load, i = heapq.heappop(loads)
+        partitions[i].append(block)
+        heapq.heappush(loads, (load + len(blocks[block]), i))
+    return partitions
+
+
+def _apportion(total, weights):
+    """Split ``total`` into integers proportional to ``weights``.
+
+    Rounding is done by largest remainder, first partitions first on ties.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    if not weights.sum():
+        return [0] * len(weights)
+    shares = total * weights / weights.sum()
+    counts = np.floor(shares).astype(np.int64)
+    order = np.argsort(counts - shares, kind='mergesort')
+    counts[order[:total - counts.sum()]] += 1
+    return counts.tolist()
+
+
+def _map_partitions(tasks, n_jobs):
+    if n_jobs == 1 or len(tasks) == 1:
+        return [_sample_partition(task) for task in tasks]
+
+    pool = multiprocessing.Pool(min(n_jobs, len(tasks)))
+    try:
+        return pool.map(_sample_partition, tasks, chunksize=1)
+    finally:
+        pool.terminate()
+
+
+def _sample_partition(args):
+    i, seed, sampling_round, quota = args
+    (blocks, author_names_by_signature_uuid, rows_by_signature_uuid,
+     cluster_ids_by_signature_uuid, signature_rows, max_iterations_per_pair) = _sampling_data
+
+    # String seeds are hashed the same way in every process and every run.
+    rng = random.Random('{}:{}:{}'.format(seed, i, sampling_round))
+    blocks_and_uuids = [(block, uuid) for block in _sampling_partitions[i] for uuid in blocks[block]]
+    max_iterations = min(len(blocks_and_uuids) ** 2, max_iterations_per_pair * sum(quota.values()))
+
+    pairs = []
+    counts = dict.fromkeys(quota, 0)
+    iterations = 0
+    while any(counts[kind] < quota[kind] for kind in quota) and iterations < max_iterations:
+        iterations += 1
+        block, s1 = rng.choice(blocks_and_uuids)
+        s2 = rng.choice(blocks[block])
+        if s1 == s2:
+            continue
+        kind = (cluster_ids_by_signature_uuid[s1] == cluster_ids_by_signature_uuid[s2],
+                author_names_by_signature_uuid[s1] == author_names_by_signature_uuid[s2])
+        if counts[kind] < quota[kind]:
+            counts[kind] += 1
+            pair = {'same_cluster': kind[0], 'signature_uuids': [s1, s2]}
+            if signature_rows:
+                pair['signature_rows'] = [rows_by_signature_uuid[s1], rows_by_signature_uuid[s2]]
+            pairs.append(pair)
+
+    return pairs, counts
+
+
+_sampling_data = None
+_sampling_partitions = None
+
+
+def save_sampled_pairs_index(output_filename, signatures_path, pairs):
+    """Save sampled pairs as positions of signatures in a NumPy file.
+
+    The ``.npz`` file holds the ``signature_rows`` of every pair as an
+    ``(n, 2)`` integer array, whether they are in the ``same_cluster``, and a
+    JSON ``manifest`` with the SHA-1 of ``signatures_path``, so that the
+    positions are never applied to another signatures file.
+
+    Args:
+        output_filename(str): the ``.npz`` file to write.
+        signatures_path(str): the signatures file the pairs were sampled from.
+        pairs(iterable): pairs from :func:`sample_signature_pairs` called
+            with ``signature_rows``.
+
+    Returns:
+        int: the number of pairs saved.
+
+    """
+    rows, same_cluster = [], []
+    for pair in pairs:
+        rows.append(pair['signature_rows'])
+        same_cluster.append(pair['same_cluster'])
+
+    manifest = {
+        'version': SAMPLED_PAIRS_INDEX_VERSION,
+        'signatures_sha1': hash_file(signatures_path),
+        'pairs': len(rows),
+    }
+    with open_file_in_folder(output_filename, 'wb') as fd:
+        np.savez(
+            fd,
+            signature_rows=np.array(rows, dtype=np.int32).reshape(-1, 2),
+            same_cluster=np.array(same_cluster, dtype=np.bool_),
+            manifest=np.array(json.dumps(manifest)),
+        )
+    return len(rows)
+
+
+def load_sampled_pairs_index(input_filename, signatures_path):
+    """Load the pairs saved by :func:`save_sampled_pairs_index`.
+
+    Raises:
+        ValueError: if the pairs were not sampled from ``signatures_path``
+            as it is now.
+
+    Returns:
+        tuple: the ``signature_rows`` and ``same_cluster`` arrays.
+
+    """
+    with np.load(input_filename) as data:
+        manifest = json.loads(str(data['manifest']))
+        if manifest['version'] != SAMPLED_PAIRS_INDEX_VERSION:
+            raise ValueError('Unsupported sampled pairs version {} in {}'.format(
+                manifest['version'], input_filename))
+        if manifest['signatures_sha1'] != hash_file(signatures_path):
+            raise ValueError('{} was not sampled from the current {}, sample the pairs again'.format(
+                input_filename, signatures_path))
+        return data['signature_rows'], data['same_cluster']
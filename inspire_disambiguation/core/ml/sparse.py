@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation core ML sparse clustering.
+
+Unlike :mod:`.models`, this module imports scikit-learn and SciPy at the top,
+so it must only be imported by the functions using it.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import heapq
+import zlib
+
+import numpy as np
+from scipy.cluster.hierarchy import fcluster
+from sklearn.base import BaseEstimator, ClusterMixin
+
+_PRIME = (1 << 31) - 1
+
+
+def _minhashes(token_sets, n_hashes, seed):
+    """Compute the MinHash signature of every token set.
+
+    Returns:
+        tuple: the positions of the non-empty token sets, and an array of
+        shape ``(len(positions), n_hashes)`` with their MinHash values.
+
+    """
+    owners, hashes = [], []
+    for i, tokens in enumerate(token_sets):
+        for token in set(tokens):
+            owners.append(i)
+            hashes.append(zlib.crc32(token.encode('utf-8')) & 0xffffffff)
+    if not owners:
+        return np.empty(0, dtype=np.int64), np.empty((0, n_hashes), dtype=np.uint64)
+
+    owners = np.array(owners, dtype=np.int64)
+    hashes = np.array(hashes, dtype=np.uint64)
+    starts = np.flatnonzero(np.concatenate(([True], owners[1:] != owners[:-1])))
+
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, _PRIME, size=n_hashes).astype(np.uint64)
+    b = rng.randint(0, _PRIME, size=n_hashes).astype(np.uint64)
+
+    # One hash function at a time, so that memory stays linear in the tokens.
+    signatures = np.empty((len(starts), n_hashes), dtype=np.uint64)
+    for k in range(n_hashes):
+        signatures[:, k] = np.minimum.reduceat((a[k] * hashes + b[k]) % _PRIME, starts)
+    return owners[starts], signatures
+
+
+def lsh_candidate_pairs(token_sets, n_bands=32, n_rows=2, max_bucket_size=100, seed=0):
+    """Find the pairs of token sets likely to be similar with MinHash LSH.
+
+    The MinHash signature of every set is cut into ``n_bands`` bands of
+    ``n_rows`` values, and two sets are candidates when they agree on all
+    values of a band. Two sets with a Jaccard similarity ``s`` are thus
+    candidates with probability ``1 - (1 - s ** n_rows) ** n_bands``.
+
+    Buckets larger than ``max_bucket_size`` would give a quadratic number of
+    pairs, so their members are only paired with the next
+    ``max_bucket_size - 1`` members in a random order.
+
+    Args:
+        token_sets(list): the tokens of every element.
+        n_bands(int): the number of bands.
+        n_rows(int): the number of MinHash values per band.
+        max_bucket_size(int): the largest bucket whose pairs are all taken.
+        seed(int): the seed of the hash functions and of the bucket orders.
+
+    Returns:
+        tuple: two integer arrays ``i`` and ``j``, with ``i < j``, of the
+        positions of the candidate pairs, without duplicates.
+
+    """
+    positions, signatures = _minhashes(token_sets, n_bands * n_rows, seed)
+    if len(positions) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    rng = np.random.RandomState(seed)
+    pairs = [np.empty(0, dtype=np.int64)]
+    n = len(token_sets)
+
+    for band in range(n_bands):
+        _, codes, counts = np.unique(
+            signatures[:, band * n_rows:(band + 1) * n_rows], axis=0, return_inverse=True, return_counts=True)
+        codes = codes.reshape(-1)
+        order = np.argsort(codes, kind='mergesort')
+        boundaries = np.concatenate(([0], np.cumsum(counts)))
+        for bucket in np.flatnonzero(counts > 1):
+            members = positions[order[boundaries[bucket]:boundaries[bucket + 1]]]
+            if len(members) <= max_bucket_size:
+                i, j = np.triu_indices(len(members), k=1)
+                i, j = members[i], members[j]
+            else:
+                members = rng.permutation(members)
+                i = np.concatenate([members[:-offset] for offset in range(1, max_bucket_size)])
+                j = np.concatenate([members[offset:] for offset in range(1, max_bucket_size)])
+            pairs.append(np.minimum(i, j) * n + np.maximum(i, j))
+
+    pairs = np.unique(np.concatenate(pairs))
+    return pairs // max(n, 1), pairs % max(n, 1)
+
+
+def sparse_average_linkage(n_samples, i, j, distances, max_distance=1.0):
+    """Compute the average linkage of a sparse distance graph.
+
+    Pairs that are not given are taken to be at ``max_distance``, so this is
+    exactly the average linkage of the full distance matrix with these
+    values. Only the pairs given and the pairs of clusters they connect are
+    held in memory, and the closest clusters are merged first. Clusters that
+    are not connected in the end are merged at ``max_distance``, so that the
+    result is a complete linkage matrix.
+
+    Args:
+        n_samples(int): the number of elements.
+        i(numpy.ndarray): the first element of every pair.
+        j(numpy.ndarray): the second element of every pair.
+        distances(numpy.ndarray): the distance of every pair, at most
+            ``max_distance``.
+        max_distance(float): the distance of the pairs not given.
+
+    Returns:
+        numpy.ndarray: the linkage matrix, in the format of
+        :func:`scipy.cluster.hierarchy.linkage`.
+
+    """
+    # For every cluster, the sum and the number of the given distances to
+    # each of the clusters it is connected to.
+    neighbors = [dict() for _ in range(n_samples)]
+    for a, b, distance in zip(i.tolist(), j.tolist(), distances.tolist()):
+        neighbors[a][b] = neighbors[b][a] = (distance, 1)
+    sizes = [1] * n_samples
+
+    def average(a, b, total, count):
+        n_pairs = sizes[a] * sizes[b]
+        return (total + (n_pairs - count) * max_distance) / n_pairs
+
+    heap = [(average(a, b, total, count), a, b)
+            for a in range(n_samples) for b, (total, count) in neighbors[a].items() if a < b]
+    heap = [item for item in heap if item[0] < max_distance]
+    heapq.heapify(heap)
+
+    alive = set(range(n_samples))
+    linkage = []
+    while heap:
+        distance, a, b = heapq.heappop(heap)
+        if a not in alive or b not in alive:
+            continue
+        c = n_samples + len(linkage)
+        linkage.append((a, b, distance, sizes[a] + sizes[b]))
+        alive -= {a, b}
+        alive.add(c)
+        sizes.append(sizes[a] + sizes[b])
+
+        # Merge the smaller neighborhood into the larger one.
+        merged, other = (neighbors[a], neighbors[b]) if len(neighbors[a]) >= len(neighbors[b]) else \
+            (neighbors[b], neighbors[a])
+        neighbors[a] = neighbors[b] = None
+        merged.pop(a, None)
+        merged.pop(b, None)
+        for d, (total, count) in other.items():
+            if d in (a, b):
+                continue
+            merged_total, merged_count = merged.get(d, (0.0, 0))
+            merged[d] = (merged_total + total, merged_count + count)
+        neighbors.append(merged)
+
+        for d, (total, count) in merged.items():
+            neighbors[d].pop(a, None)
+            neighbors[d].pop(b, None)
+            neighbors[d][c] = (total, count)
+            distance = average(c, d, total, count)
+            if distance < max_distance:
+                heapq.heappush(heap, (distance, d, c))
+
+    remaining = sorted(alive)
+    for other in remaining[1:]:
+        c = n_samples + len(linkage)
+        linkage.append((remaining[0], other, max_distance, sizes[remaining[0]] + sizes[other]))
+        sizes.append(sizes[remaining[0]] + sizes[other])
+        remaining[0] = c
+
+    return np.array(linkage, dtype=np.float64).reshape(-1, 4)
+
+
+def _b3_f_scores(linkage, y):
+    """Compute the B3 F-score of the known elements after every merge.
+
+    The precision and recall sums are updated merge by merge from the number
+    of known elements of each label in the two merged clusters, instead of
+    being computed again for every cut of the linkage.
+
+    Returns:
+        numpy.ndarray: the F-score with no merge, then after each merge.
+
+    """
+    known = y != -1
+    n_known = np.sum(known)
+    true_sizes = dict(zip(*np.unique(y[known], return_counts=True)))
+
+    counts = [{label: 1} if label != -1 else {} for label in y.tolist()]
+    n_known_in = [int(label != -1) for label in y.tolist()]
+    precision = float(n_known)
+    recall = float(sum(1 / true_sizes[label] for label in y[known].tolist()))
+    # squares[c] is the sum of the squared label counts of cluster c.
+    squares = list(n_known_in)
+
+    def f_score(p, r):
+        p, r = p / n_known, r / n_known
+        return 2 * p * r / (p + r) if p + r else 0.0
+
+    scores = [f_score(precision, recall)]
+    for a, b, _, _ in linkage.astype(np.int64).tolist():
+        small, large = (counts[a], counts[b]) if len(counts[a]) <= len(counts[b]) else (counts[b], counts[a])
+        cross = cross_recall = 0.0
+        for label, count in small.items():
+            if label in large:
+                cross += count * large[label]
+                cross_recall += count * large[label] / true_sizes[label]
+            large[label] = large.get(label, 0) + count
+        counts.append(large)
+        counts[a] = counts[b] = None
+
+        n = n_known_in[a] + n_known_in[b]
+        n_known_in.append(n)
+        squares.append(squares[a] + squares[b] + 2 * cross)
+        for cluster in (a, b):
+            if n_known_in[cluster]:
+                precision -= squares[cluster] / n_known_in[cluster]
+        if n:
+            precision += squares[-1] / n
+        recall += 2 * cross_recall
+        scores.append(f_score(precision, recall))
+
+    return np.array(scores)
+
+
+class SparseAverageLinkage(BaseEstimator, ClusterMixin):
+    """Average linkage clustering of the pairs given by a sparse affinity.
+
+    A drop-in replacement of ``beard``'s ``ScipyHierarchicalClustering`` with
+    the average method and B3 supervised scoring, for large blocks. The
+    affinity only scores some pairs, the others being taken at the maximum
+    distance, and the linkage is computed by :func:`sparse_average_linkage`,
+    so that time and memory depend on the number of scored pairs instead of
+    the square of the number of elements.
+
+    The fitted linkage is complete, so the result can be saved and cut again
+    like the one of ``ScipyHierarchicalClustering``.
+
+    Args:
+        affinity(callable): takes the elements and returns the positions
+            ``i`` and ``j`` and the distances of the scored pairs.
+        threshold(float): the distance at which to cut the linkage when no
+            element has a known label.
+        max_distance(float): the distance of the pairs not scored.
+
+    """
+
+    def __init__(self, affinity=None, threshold=None, max_distance=1.0):
+        self.affinity = affinity
+        self.threshold = threshold
+        self.max_distance = max_distance
+
+    def fit(self, X, y=None):
+        """Compute the linkage and choose the threshold.
+
+        When some elements have a known label in ``y``, the threshold is the
+        one maximizing their B3 F-score, chosen among the same thresholds as
+        ``ScipyHierarchicalClustering`` does, the highest one winning ties.
+        """
+        i, j, distances = self.affinity(X)
+        self.n_candidate_pairs_ = len(i)
+        self.n_samples_ = len(X)
+        self.linkage_ = sparse_average_linkage(self.n_samples_, i, j, distances, self.max_distance)
+
+        self.best_threshold_ = self.threshold
+        if y is None or not np.any(np.asarray(y) != -1) or not len(self.linkage_):
+            return self
+
+        heights = self.linkage_[:, 2]
+        bounds = np.concatenate(([0], heights, heights[-1:]))
+        thresholds = (bounds[:-1] + bounds[1:]) / 2
+        scores = _b3_f_scores(self.linkage_, np.asarray(y))
+        scores = scores[np.searchsorted(heights, thresholds, side='right')]
+        best = len(scores) - 1 - np.argmax(scores[::-1])
+        self.best_threshold_ = float(thresholds[best])
+        return self
+
+    @property
+    def labels_(self):
+        if not len(self.linkage_):
+            return np.zeros(self.n_samples_, dtype=np.int)
+        return fcluster(self.linkage_, self.best_threshold_, criterion='distance') - 1
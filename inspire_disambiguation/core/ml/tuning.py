@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation core ML tuning."""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import multiprocessing
+
+import numpy as np
+
+from ...utils import open_file_in_folder
+from .evaluation import evaluate_blocks
+
+
+def save_linkages(output_filename, blocks, signature_uuids, linkages, thresholds=None):
+    """Save the linkage matrices of all blocks in a single compressed file.
+
+    Args:
+        output_filename(str): the ``.npz`` file to write.
+        blocks(list): the key of every block.
+        signature_uuids(list): for every block, the UUIDs of its signatures
+            in the order used to compute its linkage matrix.
+        linkages(list): for every block, its linkage matrix, which has one
+            row less than the block has signatures, or ``None`` for blocks
+            with a single signature.
+        thresholds(list): for every block, the threshold it was cut at when
+            clustering, or ``None`` for blocks with a single signature.
+
+    """
+    sizes = np.array([len(uuids) for uuids in signature_uuids], dtype=np.int64)
+    signature_offsets = np.concatenate(([0], np.cumsum(sizes)))
+    linkage = [np.asarray(block_linkage, dtype=np.float64)
+               for block_linkage in linkages if block_linkage is not None and len(block_linkage)]
+    arrays = {}
+    if thresholds is not None:
+        arrays['thresholds'] = np.array(
+            [np.nan if threshold is None else threshold for threshold in thresholds], dtype=np.float64)
+
+    with open_file_in_folder(output_filename, 'wb') as fd:
+        np.savez_compressed(
+            fd,
+            blocks=np.array(blocks, dtype=np.unicode_),
+            signature_uuids=np.array([uuid for uuids in signature_uuids for uuid in uuids], dtype=np.unicode_),
+            signature_offsets=signature_offsets,
+            linkage=np.concatenate(linkage) if linkage else np.empty((0, 4), dtype=np.float64),
+            **arrays
+        )
+
+
+class Linkages(object):
+    """Read-only view over a file written by :func:`save_linkages`."""
+
+    def __init__(self, input_filename):
+        with np.load(input_filename) as data:
+            self.blocks = data['blocks']
+            self.signature_uuids = data['signature_uuids']
+            self.signature_offsets = data['signature_offsets']
+            self.linkage = data['linkage']
+            # Files saved before the thresholds were kept have none.
+            self.thresholds = data['thresholds'] if 'thresholds' in data else None
+        # Every block has one linkage row less than it has signatures.
+        self.linkage_offsets = self.signature_offsets - np.arange(len(self.signature_offsets))
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def block_linkage(self, i):
+        """Return the linkage matrix of the ``i``-th block."""
+        return self.linkage[self.linkage_offsets[i]:self.linkage_offsets[i + 1]]
+
+    def block_signature_uuids(self, i):
+        """Return the signature UUIDs of the ``i``-th block."""
+        return self.signature_uuids[self.signature_offsets[i]:self.signature_offsets[i + 1]]
+
+    def signature_blocks(self):
+        """Get the block of every signature.
+
+        Returns:
+            numpy.ndarray: the block keys, in the order of
+            :attr:`signature_uuids`.
+
+        """
+        return np.repeat(self.blocks, np.diff(self.signature_offsets))
+
+    def cut(self, threshold=None):
+        """Cut every block at a distance threshold.
+
+        Blocks with known clusters are not cut at the threshold of the
+        clusterer, but at the one that best fits their known clusters, see
+        ``best_threshold_`` in :class:`beard.clustering.ScipyHierarchicalClustering`.
+        Without ``threshold``, every block is cut at the threshold it was cut
+        at when clustering, which gives the clusters of that run.
+
+        Args:
+            threshold(float): the threshold to cut all blocks at.
+
+        Returns:
+            numpy.ndarray: the global cluster label of every signature, in
+            the order of :attr:`signature_uuids`.
+
+        """
+        import scipy.cluster.hierarchy as hac
+
+        if threshold is None and self.thresholds is None:
+            raise ValueError('The linkages were saved without the thresholds of the blocks')
+
+        labels = np.empty(len(self.signature_uuids), dtype=np.int64)
+        offset = 0
+        for i in range(len(self)):
+            start, end = self.signature_offsets[i], self.signature_offsets[i + 1]
+            if end - start == 1:
+                labels[start] = offset
+                offset += 1
+                continue
+            block_threshold = self.thresholds[i] if threshold is None else threshold
+            block_labels = hac.fcluster(self.block_linkage(i), block_threshold, criterion='distance')
+            _, block_labels = np.unique(block_labels, return_inverse=True)
+            labels[start:end] = block_labels + offset
+            offset += block_labels.max() + 1
+        return labels
+
+
+def load_true_labels(input_clusters_path, signature_uuids):
+    """Look up the input cluster id of every signature.
+
+    Returns:
+        numpy.ndarray: the cluster id of the signatures, in the order of
+        ``signature_uuids``, or ``-1`` for signatures without one.
+
+    """
+    positions = {uuid: i for i, uuid in enumerate(signature_uuids)}
+    labels = -np.ones(len(signature_uuids), dtype=np.int64)
+    with open(input_clusters_path, 'r') as fd:
+        for line in fd:
+            cluster = json.loads(line)
+            for signature_uuid in cluster['signature_uuids']:
+                if signature_uuid in positions:
+                    labels[positions[signature_uuid]] = cluster['cluster_id']
+    return labels
+
+
+_linkages = None
+_true_labels = None
+_worst = 0
+
+
+def _score_threshold(threshold):
+    known = _true_labels != -1
+    report = evaluate_blocks(
+        _true_labels[known],
+        _linkages.cut(threshold)[known],
+        _linkages.signature_blocks()[known],
+        worst=_worst,
+    )
+    score = {'threshold': threshold, 'precision': report['precision'], 'recall': report['recall'],
+             'f_score': report['f_score']}
+    if _worst:
+        score['worst_blocks'] = report['worst_blocks']
+    return score
+
+
+def sweep_thresholds(linkages_path, input_clusters_path, thresholds, n_jobs=8, worst=0):
+    """Score the clustering obtained at several thresholds.
+
+    All blocks are cut again from the linkage matrices saved at the end of
+    clustering, without computing any distance, and the result is compared
+    with the input clusters using B3. A threshold of ``None`` cuts every
+    block at the threshold it was cut at when clustering, as in
+    :meth:`Linkages.cut`, which scores the clusters actually produced, to
+    compare the other thresholds with.
+
+    Args:
+        linkages_path(str): a file written by :func:`save_linkages`.
+        input_clusters_path(str): the input clusters to score against.
+        thresholds(list): the distance thresholds to try, or ``None``.
+        n_jobs(int): the number of thresholds scored in parallel.
+        worst(int): how many of the worst blocks to report per threshold.
+
+    Returns:
+        list: one dict per threshold, with its B3 ``precision``, ``recall``
+        and ``f_score``, and its ``worst_blocks`` if ``worst`` is set.
+
+    """
+    # Set as globals so that the forked workers share them instead of
+    # receiving a pickled copy with each threshold.
+    global _linkages, _true_labels, _worst
+    _linkages = Linkages(linkages_path)
+    _true_labels = load_true_labels(input_clusters_path, _linkages.signature_uuids)
+    _worst = worst
+
+    if n_jobs == 1:
+        return [_score_threshold(threshold) for threshold in thresholds]
+
+    pool = multiprocessing.Pool(min(n_jobs, len(thresholds)))
+    try:
+        return pool.map(_score_threshold, thresholds)
+    finally:
+        pool.terminate()
@@ -27,6 +27,7 @@ from __future__ import absolute_import, division, print_function
 import os
 
 from . import config
+from .cli import commands
 
 
 class InspireDisambiguation(object):
@@ -36,6 +37,8 @@ class InspireDisambiguation(object):
 
     def init_app(self, app):
         self.init_config(app)
+        for command in commands:
+            app.cli.add_command(command)
         app.extensions['inspire-disambiguation'] = self
 
     def init_config(self, app):
@@ -44,21 +47,45 @@ class InspireDisambiguation(object):
         app.config['DISAMBIGUATION_BASE_PATH'] = disambiguation_base_path
         app.config['DISAMBIGUATION_CURATED_SIGNATURES_PATH'] = os.path.join(
             disambiguation_base_path, 'curated_signatures.jsonl')
+        app.config['DISAMBIGUATION_UNCURATED_SIGNATURES_PATH'] = os.path.join(
+            disambiguation_base_path, 'uncurated_signatures.jsonl')
+        app.config['DISAMBIGUATION_SIGNATURE_BLOCKS_PATH'] = os.path.join(
+            disambiguation_base_path, 'signature_blocks.npz')
         app.config['DISAMBIGUATION_INPUT_CLUSTERS_PATH'] = os.path.join(
             disambiguation_base_path, 'input_clusters.jsonl')
         app.config['DISAMBIGUATION_SAMPLED_PAIRS_PATH'] = os.path.join(
             disambiguation_base_path, 'sampled_pairs.jsonl')
+        app.config['DISAMBIGUATION_SAMPLED_PAIRS_INDEX_PATH'] = os.path.join(
+            disambiguation_base_path, 'sampled_pairs.npz')
         app.config['DISAMBIGUATION_PUBLICATIONS_PATH'] = os.path.join(
             disambiguation_base_path, 'publications.jsonl')
+        app.config['DISAMBIGUATION_PUBLICATIONS_INDEX_PATH'] = os.path.join(
+            disambiguation_base_path, 'publications_index.npz')
         app.config['DISAMBIGUATION_ETHNICITY_DATA_PATH'] = os.path.join(
             disambiguation_base_path, 'ethnicity.csv')
         app.config['DISAMBIGUATION_ETHNICITY_MODEL_PATH'] = os.path.join(
             disambiguation_base_path, 'ethnicity.pkl')
         app.config['DISAMBIGUATION_DISTANCE_MODEL_PATH'] = os.path.join(
             disambiguation_base_path, 'distance.pkl')
+        app.config['DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH'] = os.path.join(
+            disambiguation_base_path, 'distance_cascade.pkl')
         app.config['DISAMBIGUATION_CLUSTERING_MODEL_PATH'] = os.path.join(
             disambiguation_base_path, 'clustering.pkl')
+        app.config['DISAMBIGUATION_CLUSTERING_CHECKPOINTS_PATH'] = os.path.join(
+            disambiguation_base_path, 'clustering_checkpoints')
+        app.config['DISAMBIGUATION_CLUSTERING_LINKAGES_PATH'] = os.path.join(
+            disambiguation_base_path, 'clustering_linkages.npz')
+        app.config['DISAMBIGUATION_CLUSTERING_EVALUATION_PATH'] = os.path.join(
+            disambiguation_base_path, 'clustering_evaluation.json')
+        app.config['DISAMBIGUATION_CLUSTERING_ASSIGNMENTS_PATH'] = os.path.join(
+            disambiguation_base_path, 'clustering_assignments.jsonl')
+        app.config['DISAMBIGUATION_CLUSTERING_DIFF_PATH'] = os.path.join(
+            disambiguation_base_path, 'clustering_diff.jsonl')
         app.config['DISAMBIGUATION_CLUSTERING_N_JOBS'] = 8
+        app.config['DISAMBIGUATION_RUN_REPORTS_PATH'] = os.path.join(
+            disambiguation_base_path, 'reports')
+        app.config['DISAMBIGUATION_PIPELINE_STATE_PATH'] = os.path.join(
+            disambiguation_base_path, 'pipeline_state.json')
 
         for k in dir(config):
             if k.startswith('DISAMBIGUATION_'):
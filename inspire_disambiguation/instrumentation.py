@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation instrumentation."""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import platform
+import resource
+import socket
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .utils import open_file_in_folder
+
+
+def peak_rss():
+    """Return the peak resident set size of this process and of its children.
+
+    Returns:
+        tuple: the peak RSS in bytes of this process, and the largest peak
+        RSS among its terminated children (e.g. clustering workers).
+
+    """
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+    unit = 1 if platform.system() == 'Darwin' else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    )
+
+
+class Stage(object):
+    """Timing, counters and memory of one step of a run."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = OrderedDict()
+        self.start = time.time()
+        self.seconds = None
+        self.peak_rss = None
+        self.peak_rss_children = None
+
+    def count(self, n=1, what='items'):
+        """Record that ``n`` more ``what`` were processed."""
+        self.counts[what] = self.counts.get(what, 0) + n
+
+    def finish(self):
+        self.seconds = time.time() - self.start
+        self.peak_rss, self.peak_rss_children = peak_rss()
+
+    def to_dict(self):
+        return OrderedDict([
+            ('name', self.name),
+            ('seconds', self.seconds),
+            ('counts', self.counts),
+            ('per_second', OrderedDict(
+                (what, n / self.seconds if self.seconds else None) for what, n in self.counts.items())),
+            ('peak_rss_bytes', self.peak_rss),
+            ('peak_rss_children_bytes', self.peak_rss_children),
+        ])
+
+
+class RunReport(object):
+    """Machine-readable report of a run, made of consecutive stages."""
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.start = time.time()
+        self.seconds = None
+        self.status = 'running'
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as a stage, yielding its :class:`Stage`."""
+        stage = Stage(name)
+        self.stages.append(stage)
+        try:
+            yield stage
+        finally:
+            stage.finish()
+
+    def finish(self, status):
+        self.seconds = time.time() - self.start
+        self.status = status
+
+    def to_dict(self):
+        peak, peak_children = peak_rss()
+        return OrderedDict([
+            ('run', self.name),
+            ('status', self.status),
+            ('host', socket.gethostname()),
+            ('started', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.start))),
+            ('seconds', self.seconds),
+            ('peak_rss_bytes', peak),
+            ('peak_rss_children_bytes', peak_children),
+            ('stages', [stage.to_dict() for stage in self.stages]),
+        ])
+
+    def save(self, output_filename):
+        """Save the report as JSON."""
+        with open_file_in_folder(output_filename, 'w') as fd:
+            json.dump(self.to_dict(), fd, indent=2)
+
+    def save_prometheus(self, output_filename):
+        """Save the report in the Prometheus text format.
+
+        The file is replaced atomically, as expected by the textfile
+        collector of the node exporter.
+        """
+        report = self.to_dict()
+        metrics = OrderedDict([
+            ('run_seconds', ('Elapsed time of the run.', [({}, report['seconds'])])),
+            ('run_success', ('Whether the run succeeded.', [({}, int(report['status'] == 'success'))])),
+            ('run_peak_rss_bytes', ('Peak resident memory of the run.', [({}, report['peak_rss_bytes'])])),
+            ('stage_seconds', ('Elapsed time per stage.', [])),
+            ('stage_items_total', ('Items processed per stage.', [])),
+            ('stage_items_per_second', ('Items processed per second per stage.', [])),
+            ('stage_peak_rss_bytes', ('Peak resident memory at the end of each stage.', [])),
+        ])
+        for stage in report['stages']:
+            labels = {'stage': stage['name']}
+            metrics['stage_seconds'][1].append((labels, stage['seconds']))
+            metrics['stage_peak_rss_bytes'][1].append((labels, stage['peak_rss_bytes']))
+            for what, n in stage['counts'].items():
+                metrics['stage_items_total'][1].append((dict(labels, what=what), n))
+                metrics['stage_items_per_second'][1].append((dict(labels, what=what), stage['per_second'][what]))
+
+        lines = []
+        for name, (description, samples) in metrics.items():
+            name = 'inspire_disambiguation_' + name
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} gauge'.format(name))
+            for labels, value in samples:
+                if value is None:
+                    continue
+                labels = dict(labels, run=self.name)
+                lines.append('{}{{{}}} {}'.format(name, ','.join(
+                    '{}="{}"'.format(key, labels[key]) for key in sorted(labels)), value))
+
+        with open_file_in_folder(output_filename + '.tmp', 'w') as fd:
+            fd.write('\n'.join(lines) + '\n')
+        os.rename(output_filename + '.tmp', output_filename)
+
+
+@contextmanager
+def run_report(name, report_dir, prometheus_dir=None):
+    """Instrument a run and save its report when it ends.
+
+    The report is written to ``<report_dir>/<name>.json`` and, if
+    ``prometheus_dir`` is given, to ``<prometheus_dir>/inspire_disambiguation_<name>.prom``,
+    whether the run succeeds or fails.
+
+    Yields:
+        RunReport: the report, to add stages to.
+
+    """
+    report = RunReport(name)
+    try:
+        yield report
+    except BaseException:
+        report.finish('failure')
+        raise
+    else:
+        report.finish('success')
+    finally:
+        report.save(os.path.join(report_dir, '{}.json'.format(name)))
+        if prometheus_dir:
+            report.save_prometheus(os.path.join(prometheus_dir, 'inspire_disambiguation_{}.prom'.format(name)))
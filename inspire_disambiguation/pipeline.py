@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation pipeline."""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+from .utils import hash_file, open_file_in_folder
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+Stage = namedtuple('Stage', ['name', 'function', 'inputs', 'outputs', 'params'])
+"""A step of the pipeline.
+
+``function`` is the name of the function of :mod:`inspire_disambiguation.api`
+running it, ``inputs`` and ``outputs`` are the config keys of the files it
+reads and writes, and ``params`` the config keys of the other settings its
+outputs depend on.
+"""
+
+STAGES = [
+    Stage(
+        name='export_curated_signatures',
+        function='save_curated_signatures_and_input_clusters',
+        inputs=[],
+        outputs=['DISAMBIGUATION_CURATED_SIGNATURES_PATH', 'DISAMBIGUATION_INPUT_CLUSTERS_PATH'],
+        params=[],
+    ),
+    Stage(
+        name='export_uncurated_signatures',
+        function='save_uncurated_signatures',
+        inputs=[],
+        outputs=['DISAMBIGUATION_UNCURATED_SIGNATURES_PATH'],
+        params=[],
+    ),
+    Stage(
+        name='index_signature_blocks',
+        function='index_signature_blocks',
+        inputs=['DISAMBIGUATION_CURATED_SIGNATURES_PATH', 'DISAMBIGUATION_UNCURATED_SIGNATURES_PATH'],
+        outputs=['DISAMBIGUATION_SIGNATURE_BLOCKS_PATH'],
+        params=['DISAMBIGUATION_CLUSTERING_UNCURATED'],
+    ),
+    Stage(
+        name='export_publications',
+        function='save_publications',
+        inputs=[],
+        outputs=['DISAMBIGUATION_PUBLICATIONS_PATH', 'DISAMBIGUATION_PUBLICATIONS_INDEX_PATH'],
+        params=[],
+    ),
+    Stage(
+        name='sample_pairs',
+        function='save_sampled_pairs',
+        inputs=[
+            'DISAMBIGUATION_CURATED_SIGNATURES_PATH',
+            'DISAMBIGUATION_INPUT_CLUSTERS_PATH',
+            'DISAMBIGUATION_UNCURATED_SIGNATURES_PATH',
+            'DISAMBIGUATION_SIGNATURE_BLOCKS_PATH',
+        ],
+        outputs=['DISAMBIGUATION_SAMPLED_PAIRS_PATH', 'DISAMBIGUATION_SAMPLED_PAIRS_INDEX_PATH'],
+        params=[
+            'DISAMBIGUATION_PRECOMPUTED_BLOCKS',
+            'DISAMBIGUATION_CLUSTERING_UNCURATED',
+            'DISAMBIGUATION_SAMPLED_PAIRS_SIZE',
+            'DISAMBIGUATION_SAMPLED_PAIRS_BINARY',
+            'DISAMBIGUATION_SAMPLED_PAIRS_SEED',
+            'DISAMBIGUATION_SAMPLED_PAIRS_N_JOBS',
+        ],
+    ),
+    Stage(
+        name='train_ethnicity_model',
+        function='train_and_save_ethnicity_model',
+        inputs=['DISAMBIGUATION_ETHNICITY_DATA_PATH'],
+        outputs=['DISAMBIGUATION_ETHNICITY_MODEL_PATH'],
+        params=[
+            'DISAMBIGUATION_ETHNICITY_STREAMING',
+            'DISAMBIGUATION_ETHNICITY_CHUNK_SIZE',
+            'DISAMBIGUATION_ETHNICITY_EPOCHS',
+        ],
+    ),
+    Stage(
+        name='train_distance_model',
+        function='train_and_save_distance_model',
+        inputs=[
+            'DISAMBIGUATION_ETHNICITY_MODEL_PATH',
+            'DISAMBIGUATION_CURATED_SIGNATURES_PATH',
+            'DISAMBIGUATION_SAMPLED_PAIRS_PATH',
+            'DISAMBIGUATION_SAMPLED_PAIRS_INDEX_PATH',
+            'DISAMBIGUATION_PUBLICATIONS_PATH',
+        ],
+        outputs=[
+            'DISAMBIGUATION_DISTANCE_MODEL_PATH',
+            'DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH',
+        ],
+        params=[
+            'DISAMBIGUATION_SAMPLED_PAIRS_SIZE',
+            'DISAMBIGUATION_SAMPLED_PAIRS_BINARY',
+            'DISAMBIGUATION_DISTANCE_FEATURES',
+            'DISAMBIGUATION_DISTANCE_HOLDOUT_EVERY',
+            'DISAMBIGUATION_DISTANCE_WARM_START',
+            'DISAMBIGUATION_DISTANCE_WARM_START_TREES',
+            'DISAMBIGUATION_DISTANCE_MAX_TREES',
+            'DISAMBIGUATION_DISTANCE_CASCADE',
+            'DISAMBIGUATION_DISTANCE_CASCADE_TREES',
+        ],
+    ),
+    Stage(
+        name='train_clustering_model',
+        function='train_and_save_clustering_model',
+        inputs=[
+            'DISAMBIGUATION_ETHNICITY_MODEL_PATH',
+            'DISAMBIGUATION_DISTANCE_MODEL_PATH',
+            'DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH',
+            'DISAMBIGUATION_CURATED_SIGNATURES_PATH',
+            'DISAMBIGUATION_UNCURATED_SIGNATURES_PATH',
+            'DISAMBIGUATION_PUBLICATIONS_PATH',
+            'DISAMBIGUATION_PUBLICATIONS_INDEX_PATH',
+            'DISAMBIGUATION_INPUT_CLUSTERS_PATH',
+            'DISAMBIGUATION_SIGNATURE_BLOCKS_PATH',
+        ],
+        outputs=[
+            'DISAMBIGUATION_CLUSTERING_MODEL_PATH',
+            'DISAMBIGUATION_CLUSTERING_LINKAGES_PATH',
+            'DISAMBIGUATION_CLUSTERING_EVALUATION_PATH',
+            'DISAMBIGUATION_CLUSTERING_ASSIGNMENTS_PATH',
+        ],
+        params=[
+            'DISAMBIGUATION_CLUSTERING_PREFILTER_RULES',
+            'DISAMBIGUATION_CLUSTERING_SPARSE_MIN_SIZE',
+            'DISAMBIGUATION_CLUSTERING_LSH_BANDS',
+            'DISAMBIGUATION_CLUSTERING_LSH_ROWS',
+            'DISAMBIGUATION_CLUSTERING_LSH_MAX_BUCKET_SIZE',
+            'DISAMBIGUATION_DISTANCE_CASCADE',
+            'DISAMBIGUATION_DISTANCE_CASCADE_BAND',
+            'DISAMBIGUATION_PRECOMPUTED_BLOCKS',
+            'DISAMBIGUATION_CLUSTERING_UNCURATED',
+        ],
+    ),
+]
+
+
+class PipelineError(Exception):
+    """A stage of the pipeline failed.
+
+    Args:
+        report(list): the ``(stage name, status)`` pairs decided so far, as
+            returned by :func:`run_pipeline`.
+
+    """
+
+    def __init__(self, message, report=()):
+        super(PipelineError, self).__init__(message)
+        self.report = list(report)
+
+
+class _FileHashes(object):
+    """Content hashes of files, cached by size and modification time."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __call__(self, filename):
+        if not os.path.exists(filename):
+            return None
+        stat = os.stat(filename)
+        cached = self.cache.get(filename)
+        if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime:
+            return cached['sha1']
+        sha1 = hash_file(filename)
+        self.cache[filename] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': sha1}
+        return sha1
+
+
+def _fingerprint(stage, config, file_hash):
+    return {
+        'inputs': {key: file_hash(config[key]) for key in stage.inputs},
+        'params': {key: config.get(key) for key in stage.params},
+    }
+
+
+def _is_up_to_date(stage, config, state, file_hash):
+    recorded = state['stages'].get(stage.name)
+    if recorded is None:
+        return False
+    if any(file_hash(config[key]) != recorded['outputs'].get(key) for key in stage.outputs):
+        return False
+    return json.loads(json.dumps(_fingerprint(stage, config, file_hash))) == recorded['fingerprint']
+
+
+def _run_stage(app, function):
+    # Runs in a forked process, so that stages run in parallel without
+    # sharing the GIL and that their memory is released when they end.
+    from . import api
+
+    with app.app_context():
+        getattr(api, function)()
+
+
+def _load_state(filename):
+    try:
+        with open(filename, 'r') as fd:
+            return json.load(fd)
+    except (IOError, OSError, ValueError):
+        return {'stages': {}, 'files': {}}
+
+
+def _save_state(filename, state):
+    with open_file_in_folder(filename + '.tmp', 'w') as fd:
+        json.dump(state, fd, indent=2, sort_keys=True)
+    os.rename(filename + '.tmp', filename)
+
+
+def run_pipeline(force=(), n_jobs=2, dry_run=False, poll_interval=1):
+    """Run the stages of the pipeline whose outputs are out of date.
+
+    A stage is run when one of its outputs is missing or was modified, or
+    when the content hashes of its inputs or its settings differ from the
+    ones recorded the last time it ran. Stages reading from the DB have no
+    inputs, so they only run when their outputs are missing or when forced.
+    Stages run as soon as the stages producing their inputs are done, up to
+    ``n_jobs`` at the same time, each in its own process.
+
+    Args:
+        force(list): names of stages to run even if they are up to date.
+        n_jobs(int): the maximum number of stages running at the same time.
+        dry_run(bool): only report which stages would run, assuming that
+            running a stage changes its outputs.
+        poll_interval(float): seconds between two checks of running stages.
+
+    Returns:
+        list: pairs of ``(stage name, status)`` in the order they were
+        decided, where status is one of ``up-to-date``, ``done``,
+        ``would run``, ``failed`` or ``skipped`` (when a stage it depends
+        on failed).
+
+    Raises:
+        PipelineError: if a stage failed, after the stages not depending on
+            it have completed, with the statuses of all the stages in its
+            ``report``.
+
+    """
+    config = current_app.config
+    app = current_app._get_current_object()
+    unknown = set(force) - set(stage.name for stage in STAGES)
+    if unknown:
+        raise PipelineError('Unknown stages: {}'.format(', '.join(sorted(unknown))))
+
+    state_path = config['DISAMBIGUATION_PIPELINE_STATE_PATH']
+    state = _load_state(state_path)
+    file_hash = _FileHashes(state['files'])
+
+    producers = {output: stage.name for stage in STAGES for output in stage.outputs}
+    upstream = {
+        stage.name: set(producers[key] for key in stage.inputs if key in producers)
+        for stage in STAGES
+    }
+
+    pending = list(STAGES)
+    finished = set()
+    would_run = set()
+    failed = set()
+    running = {}
+    report = []
+
+    while pending or running:
+        for stage in list(pending):
+            if upstream[stage.name] & failed:
+                pending.remove(stage)
+                failed.add(stage.name)
+                report.append((stage.name, 'skipped'))
+                continue
+            if not upstream[stage.name] <= finished or len(running) >= n_jobs:
+                continue
+            pending.remove(stage)
+
+            stale = (
+                stage.name in force or
+                upstream[stage.name] & would_run or
+                not _is_up_to_date(stage, config, state, file_hash)
+            )
+            if not stale:
+                finished.add(stage.name)
+                report.append((stage.name, 'up-to-date'))
+            elif dry_run:
+                finished.add(stage.name)
+                would_run.add(stage.name)
+                report.append((stage.name, 'would run'))
+            else:
+                LOGGER.info('Starting stage %s', stage.name)
+                process = multiprocessing.Process(target=_run_stage, args=(app, stage.function))
+                process.start()
+                running[stage.name] = (stage, process, time.time())
+
+        for name, (stage, process, start) in list(running.items()):
+            if process.is_alive():
+                continue
+            del running[name]
+            process.join()
+            if process.exitcode != 0:
+                LOGGER.error('Stage %s failed with exit code %s', name, process.exitcode)
+                failed.add(name)
+                report.append((name, 'failed'))
+                continue
+
+            LOGGER.info('Stage %s done in %.0fs', name, time.time() - start)
+            state['stages'][name] = {
+                'fingerprint': _fingerprint(stage, config, file_hash),
+                'outputs': {key: file_hash(config[key]) for key in stage.outputs},
+                'finished': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+            _save_state(state_path, state)
+            finished.add(name)
+            report.append((name, 'done'))
+
+        if running:
+            time.sleep(poll_interval)
+
+    if failed:
+        raise PipelineError('Failed stages: {}'.format(', '.join(sorted(failed))), report)
+
+    return report
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+"""Disambiguation tasks."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+from celery import shared_task
+from flask import current_app
+
+from .api import create_clusterer, load_clustering_signatures
+from .core.ml.models import dump_block_clusterer
+
+
+_clusterer = None
+_signatures_by_uuid = None
+_loaded_files = None
+
+
+def _get_clusterer_and_signatures():
+    """Load the models and the signatures once per worker process.
+
+    They are loaded again when one of the files they were read from was
+    replaced or modified since, e.g. by a new export.
+    """
+    global _clusterer, _signatures_by_uuid, _loaded_files
+
+    loaded_files = _get_file_states()
+    if _clusterer is None or loaded_files != _loaded_files:
+        _clusterer = create_clusterer()
+        _signatures_by_uuid = load_clustering_signatures()
+        _loaded_files = loaded_files
+
+    return _clusterer, _signatures_by_uuid
+
+
+def _get_file_states():
+    keys = [
+        'DISAMBIGUATION_ETHNICITY_MODEL_PATH',
+        'DISAMBIGUATION_DISTANCE_MODEL_PATH',
+        'DISAMBIGUATION_CURATED_SIGNATURES_PATH',
+        'DISAMBIGUATION_PUBLICATIONS_PATH',
+    ]
+    if current_app.config['DISAMBIGUATION_DISTANCE_CASCADE']:
+        keys.append('DISAMBIGUATION_DISTANCE_CASCADE_MODEL_PATH')
+    if current_app.config['DISAMBIGUATION_CLUSTERING_UNCURATED']:
+        keys.append('DISAMBIGUATION_UNCURATED_SIGNATURES_PATH')
+
+    states = []
+    for key in keys:
+        stat = os.stat(current_app.config[key])
+        states.append((stat.st_ino, stat.st_size, stat.st_mtime))
+    return states
+
+
+@shared_task(ignore_result=False, acks_late=True)
+def cluster_block(block, signature_uuids, cluster_ids):
+    """Cluster a single block of signatures.
+
+    Args:
+        block(str): the key of the block, only used for reporting.
+        signature_uuids(list): the UUIDs of the signatures in the block.
+        cluster_ids(list): the known cluster id of each signature, or ``-1``.
+
+    Returns:
+        dict: the fitted block clusterer, as returned by
+        :func:`~inspire_disambiguation.core.ml.models.dump_block_clusterer`,
+        with the number of pairs ruled out by the pre-filter in
+        ``pruned_pairs``.
+
+    """
+    clusterer, signatures_by_uuid = _get_clusterer_and_signatures()
+
+    X = np.empty((len(signature_uuids), 1), dtype=np.object)
+    for i, signature_uuid in enumerate(signature_uuids):
+        X[i, 0] = signatures_by_uuid[signature_uuid]
+    y = np.asarray(cluster_ids, dtype=np.int)
+
+    block_clusterer, pruned_pairs = clusterer.fit_block(X, y)
+    result = dump_block_clusterer(block_clusterer)
+    result['pruned_pairs'] = pruned_pairs
+    return result
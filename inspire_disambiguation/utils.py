@@ -24,6 +24,7 @@
 
 from __future__ import absolute_import, division, print_function
 
+import hashlib
 import os
 from contextlib import contextmanager
 
@@ -39,3 +40,12 @@ def open_file_in_folder(filename, mode='r', buffering=-1):
 
     with open(filename, mode, buffering) as fd:
         yield fd
+
+
+def hash_file(filename, chunk_size=1 << 20):
+    """Return the SHA-1 hex digest of the contents of a file."""
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
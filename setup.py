@@ -50,6 +50,7 @@ install_requires = [
     'invenio-base~=1.0,>=1.0.0',
     'invenio-config~=1.0,>=1.0.0',
     'invenio-db[postgresql,versioning]~=1.0,>=1.0.0',
+    'invenio-indexer~=1.0,>=1.0.0',
     'invenio-pidstore==1.0.0',
     'invenio-records~=1.0,>=1.0.0',
     'langdetect~=1.0,>=1.0.7',
@@ -103,6 +104,7 @@ setup(
         "console_scripts": ["inspire-disambiguation = inspire_disambiguation:cli"],
         "invenio_config.module": ["inspire_disambiguation = inspire_disambiguation.config"],
         "invenio_base.apps": ["inspire_disambiguation = inspire_disambiguation:InspireDisambiguation"],
+        "invenio_celery.tasks": ["inspire_disambiguation = inspire_disambiguation.tasks"],
 
     },
     classifiers=[
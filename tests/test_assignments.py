@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+from __future__ import absolute_import, division, print_function
+
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from inspire_disambiguation.core.ml.assignments import AssignmentWriter, iter_author_assignments
+
+
+Publication = namedtuple('Publication', ['publication_id'])
+Signature = namedtuple('Signature', ['signature_uuid', 'publication'])
+
+
+def _write_lines(path, items):
+    with open(str(path), 'w') as fd:
+        for item in items:
+            fd.write(json.dumps(item) + '\n')
+
+
+def _signature(signature_uuid, publication_id, author_id=None):
+    # as exported by ``get_all_curated_signatures`` and
+    # ``get_all_uncurated_signatures``
+    return {
+        'author_affiliation': '',
+        'author_id': author_id,
+        'author_name': 'Smith, J.',
+        'publication_id': publication_id,
+        'signature_block': 'SNATHj',
+        'signature_uuid': signature_uuid,
+    }
+
+
+def test_iter_author_assignments_assigns_uncurated_signatures(tmpdir):
+    curated = [
+        _signature('curated-1', 1, author_id=10),
+        _signature('curated-2', 2, author_id=10),
+        _signature('curated-3', 3, author_id=20),
+    ]
+    uncurated = [
+        _signature('uncurated-1', 5),
+        _signature('uncurated-2', 4),
+        _signature('uncurated-3', 6),
+    ]
+    curated_path = tmpdir.join('curated_signatures.jsonl')
+    _write_lines(curated_path, curated)
+
+    # the uncurated signatures are clustered with the curated ones, with no
+    # known cluster
+    signatures = curated + uncurated
+    X = np.empty((len(signatures), 1), dtype=object)
+    for i, signature in enumerate(signatures):
+        X[i, 0] = Signature(signature['signature_uuid'], Publication(signature['publication_id']))
+    labels = np.array([0, 0, 1, 0, 1, 2])
+
+    assignments_path = str(tmpdir.join('clustering_assignments.jsonl'))
+    with AssignmentWriter(assignments_path) as writer:
+        writer.write_block('SNATHj', X, labels)
+
+    result = list(iter_author_assignments(assignments_path, str(curated_path)))
+
+    assert result == [
+        (4, 'uncurated-2', 20),
+        (5, 'uncurated-1', 10),
+    ]
+
+
+def test_iter_author_assignments_splits_ties_by_smallest_author(tmpdir):
+    curated = [
+        _signature('curated-1', 1, author_id=20),
+        _signature('curated-2', 2, author_id=10),
+    ]
+    curated_path = tmpdir.join('curated_signatures.jsonl')
+    _write_lines(curated_path, curated)
+
+    signatures = curated + [_signature('uncurated-1', 3)]
+    X = np.empty((len(signatures), 1), dtype=object)
+    for i, signature in enumerate(signatures):
+        X[i, 0] = Signature(signature['signature_uuid'], Publication(signature['publication_id']))
+
+    assignments_path = str(tmpdir.join('clustering_assignments.jsonl'))
+    with AssignmentWriter(assignments_path) as writer:
+        writer.write_block('SNATHj', X, np.zeros(len(signatures), dtype=int))
+
+    result = list(iter_author_assignments(assignments_path, str(curated_path), chunk_size=1))
+
+    assert result == [(3, 'uncurated-1', 10)]
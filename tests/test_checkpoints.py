@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+from inspire_disambiguation.core.ml.checkpoints import BlockCheckpoints, block_content_hash
+from inspire_disambiguation.core.ml.models import Publication, Signature
+
+
+def _block(titles, labels):
+    X = np.empty((len(titles), 1), dtype=object)
+    for i, title in enumerate(titles):
+        publication = Publication(
+            abstract='', authors=['Smith, J.'], collaborations=[], keywords=[],
+            publication_id=i, title=title, topics=[])
+        X[i, 0] = Signature(
+            author_affiliation='', author_id=None, author_name='Smith, J.', publication=publication,
+            signature_block='SNATHj', signature_uuid='uuid-{}'.format(i))
+    return X, np.array(labels)
+
+
+def test_block_content_hash_ignores_cluster_numbering():
+    X, y = _block(['a', 'b', 'c'], [4, 4, 7])
+
+    assert block_content_hash(X, y) == block_content_hash(X, np.array([1, 1, 0]))
+    assert block_content_hash(X, y) != block_content_hash(X, np.array([1, 0, 0]))
+    assert block_content_hash(X, y) == block_content_hash(X[::-1], y[::-1])
+
+
+def test_block_content_hash_changes_with_publications():
+    X, y = _block(['a', 'b', 'c'], [0, 0, 1])
+    changed_X, _ = _block(['a', 'b', 'd'], [0, 0, 1])
+
+    assert block_content_hash(X, y) != block_content_hash(changed_X, y)
+
+
+def test_checkpoints_are_reused_by_a_later_run(tmpdir):
+    X, y = _block(['a', 'b'], [0, 0])
+    content_hash = block_content_hash(X, y)
+    BlockCheckpoints(str(tmpdir), 'v1').put('SNATHj', content_hash, {'labels': [0, 0]})
+
+    checkpoints = BlockCheckpoints(str(tmpdir), 'v1')
+
+    assert checkpoints.get('SNATHj', content_hash) == {'labels': [0, 0]}
+    assert checkpoints.hits == 1
+
+
+def test_checkpoints_are_invalidated_by_contents_and_version(tmpdir):
+    X, y = _block(['a', 'b'], [0, 0])
+    changed_X, _ = _block(['a', 'c'], [0, 0])
+    BlockCheckpoints(str(tmpdir), 'v1').put('SNATHj', block_content_hash(X, y), {'labels': [0, 0]})
+
+    checkpoints = BlockCheckpoints(str(tmpdir), 'v1')
+    assert checkpoints.get('SNATHj', block_content_hash(changed_X, y)) is None
+    assert checkpoints.get('SNATHK', block_content_hash(X, y)) is None
+
+    checkpoints = BlockCheckpoints(str(tmpdir), 'v2')
+    assert checkpoints.get('SNATHj', block_content_hash(X, y)) is None
+    assert checkpoints.hits == 0
+
+
+def test_prune_only_deletes_unused_checkpoints_of_the_same_version(tmpdir):
+    BlockCheckpoints(str(tmpdir), 'v1').put('SNATHj', 'old', {})
+    previous = BlockCheckpoints(str(tmpdir), 'v2')
+    previous.put('SNATHj', 'old', {})
+    previous.put('SNATHK', 'kept', {})
+
+    checkpoints = BlockCheckpoints(str(tmpdir), 'v2')
+    checkpoints.get('SNATHK', 'kept')
+    checkpoints.put('SNATHj', 'new', {})
+
+    assert checkpoints.prune() == 1
+    assert BlockCheckpoints(str(tmpdir), 'v1').get('SNATHj', 'old') == {}
+    assert checkpoints.get('SNATHj', 'old') is None
+    assert checkpoints.get('SNATHK', 'kept') == {}
+
+
+def test_prune_without_checkpoints(tmpdir):
+    assert BlockCheckpoints(str(tmpdir.join('missing'))).prune() == 0
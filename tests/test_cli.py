@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+from __future__ import absolute_import, division, print_function
+
+from click.testing import CliRunner
+from flask import Flask
+from invenio_base.app import create_cli
+
+from inspire_disambiguation import InspireDisambiguation
+from inspire_disambiguation.pipeline import STAGES
+
+
+def _create_cli(tmpdir):
+    app = Flask('inspire_disambiguation', instance_path=str(tmpdir))
+    InspireDisambiguation(app)
+    return create_cli(create_app=lambda **kwargs: app)
+
+
+def test_run_pipeline_is_not_shadowed_by_the_flask_run_command(tmpdir):
+    result = CliRunner().invoke(_create_cli(tmpdir), ['run-pipeline', '--dry-run'])
+
+    assert result.exit_code == 0, result.output
+    for stage in STAGES:
+        assert '{:<28} would run'.format(stage.name) in result.output
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from beard.metrics import b3_precision_recall_fscore as beard_b3_precision_recall_fscore
+
+from inspire_disambiguation.core.ml.evaluation import b3_precision_recall_fscore, evaluate_blocks
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_b3_precision_recall_fscore_matches_beard(seed):
+    rng = np.random.RandomState(seed)
+    labels_true = rng.randint(0, 20, size=200)
+    labels_pred = rng.randint(0, 30, size=200)
+
+    assert np.allclose(
+        b3_precision_recall_fscore(labels_true, labels_pred),
+        beard_b3_precision_recall_fscore(labels_true, labels_pred))
+
+
+def test_b3_precision_recall_fscore_of_a_perfect_clustering():
+    assert b3_precision_recall_fscore([3, 3, 1, 2], [0, 0, 5, 6]) == (1.0, 1.0, 1.0)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 3])
+def test_evaluate_blocks_matches_beard_per_block(n_jobs):
+    rng = np.random.RandomState(0)
+    blocks = rng.choice(['a', 'b', 'c', 'd', 'e'], size=300)
+    labels_true = rng.randint(0, 10, size=300)
+    labels_pred = rng.randint(0, 10, size=300)
+
+    report = evaluate_blocks(labels_true, labels_pred, blocks, n_jobs=n_jobs, worst=5)
+
+    assert np.allclose(
+        (report['precision'], report['recall'], report['f_score']),
+        beard_b3_precision_recall_fscore(labels_true, labels_pred))
+    assert report['blocks'] == 5
+    # the scores of a block only compare the elements of the block
+    for block in report['worst_blocks']:
+        in_block = blocks == block['block']
+        assert np.allclose(
+            (block['precision'], block['recall'], block['f_score']),
+            beard_b3_precision_recall_fscore(labels_true[in_block], labels_pred[in_block]))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+
+from __future__ import absolute_import, division, print_function
+
+import pytest
+from flask import Flask
+
+from inspire_disambiguation import api
+from inspire_disambiguation.pipeline import PipelineError, Stage, run_pipeline
+
+
+def _write_a():
+    from flask import current_app
+
+    with open(current_app.config['TEST_A_PATH'], 'w') as fd:
+        fd.write('a')
+
+
+def _fail_b():
+    raise RuntimeError('b failed')
+
+
+def _write_c():
+    from flask import current_app
+
+    with open(current_app.config['TEST_C_PATH'], 'w') as fd:
+        fd.write('c')
+
+
+@pytest.fixture
+def app(tmpdir, monkeypatch):
+    app = Flask('inspire_disambiguation', instance_path=str(tmpdir))
+    app.config.update(
+        DISAMBIGUATION_PIPELINE_STATE_PATH=str(tmpdir.join('pipeline_state.json')),
+        TEST_A_PATH=str(tmpdir.join('a')),
+        TEST_B_PATH=str(tmpdir.join('b')),
+        TEST_C_PATH=str(tmpdir.join('c')),
+    )
+    # the stages run in forked processes, which see these functions
+    monkeypatch.setattr(api, '_test_write_a', _write_a, raising=False)
+    monkeypatch.setattr(api, '_test_fail_b', _fail_b, raising=False)
+    monkeypatch.setattr(api, '_test_write_c', _write_c, raising=False)
+    monkeypatch.setattr('inspire_disambiguation.pipeline.STAGES', [
+        Stage('a', '_test_write_a', [], ['TEST_A_PATH'], []),
+        Stage('b', '_test_fail_b', ['TEST_A_PATH'], ['TEST_B_PATH'], []),
+        Stage('c', '_test_write_c', ['TEST_B_PATH'], ['TEST_C_PATH'], []),
+    ])
+    with app.app_context():
+        yield app
+
+
+def test_run_pipeline_reports_the_stages_when_one_fails(app):
+    with pytest.raises(PipelineError) as excinfo:
+        run_pipeline(poll_interval=0.01)
+
+    assert excinfo.value.report == [('a', 'done'), ('b', 'failed'), ('c', 'skipped')]
+
+
+def test_run_pipeline_skips_the_stages_that_are_up_to_date(app):
+    with pytest.raises(PipelineError):
+        run_pipeline(poll_interval=0.01)
+
+    assert run_pipeline(dry_run=True) == [('a', 'up-to-date'), ('b', 'would run'), ('c', 'would run')]
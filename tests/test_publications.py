@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+
+import pytest
+
+from inspire_disambiguation.core.ml.publications import build_publications_index, open_publication_store
+
+
+def _export(publications_path, index_path, titles):
+    # as a new export does, replacing the file
+    with open(publications_path + '.tmp', 'w') as fd:
+        for publication_id, title in titles:
+            fd.write(json.dumps({'publication_id': publication_id, 'title': title}) + '\n')
+    os.rename(publications_path + '.tmp', publications_path)
+    build_publications_index(index_path, publications_path)
+
+
+def test_open_publication_store_reopens_a_replaced_file(tmpdir):
+    publications_path, index_path = str(tmpdir.join('publications.jsonl')), str(tmpdir.join('publications.npz'))
+    _export(publications_path, index_path, [(1, 'First'), (2, 'Second')])
+    store = open_publication_store(publications_path, index_path)
+    assert store.get(2)['title'] == 'Second'
+    assert open_publication_store(publications_path, index_path) is store
+
+    _export(publications_path, index_path, [(2, 'Second, revised'), (3, 'Third')])
+    new_store = open_publication_store(publications_path, index_path)
+
+    assert new_store is not store
+    assert new_store.get(2)['title'] == 'Second, revised'
+    assert 1 not in new_store
+
+
+def test_publication_store_refuses_a_modified_file(tmpdir):
+    publications_path, index_path = str(tmpdir.join('publications.jsonl')), str(tmpdir.join('publications.npz'))
+    _export(publications_path, index_path, [(1, 'First'), (2, 'Second')])
+    store = open_publication_store(publications_path, index_path)
+
+    with open(publications_path, 'w') as fd:
+        fd.write(json.dumps({'publication_id': 1, 'title': 'Truncated'}) + '\n')
+
+    with pytest.raises(ValueError):
+        store.get(2)
+    with pytest.raises(ValueError):
+        # the index does not match the file anymore
+        open_publication_store(publications_path, index_path)
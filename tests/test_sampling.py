@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+
+from __future__ import absolute_import, division, print_function
+
+import json
+
+from inspire_disambiguation.core.ml.sampling import sample_signature_pairs_parallel
+
+
+def _write_lines(path, items):
+    with open(str(path), 'w') as fd:
+        for item in items:
+            fd.write(json.dumps(item) + '\n')
+
+
+def _write_signatures_and_clusters(tmpdir):
+    signatures, clusters = [], []
+    for block in ('SNATHj', 'DAj', 'MALARm'):
+        for cluster in range(3):
+            signature_uuids = ['{}-{}-{}'.format(block, cluster, i) for i in range(4)]
+            for i, signature_uuid in enumerate(signature_uuids):
+                signatures.append({
+                    'author_affiliation': '',
+                    'author_id': len(clusters),
+                    'author_name': '{}, {}.'.format(block, 'J' if i % 2 else 'John'),
+                    'publication_id': len(signatures),
+                    'signature_block': block,
+                    'signature_uuid': signature_uuid,
+                })
+            clusters.append({'author_id': len(clusters), 'cluster_id': len(clusters),
+                             'signature_uuids': signature_uuids})
+
+    signatures_path, clusters_path = tmpdir.join('curated_signatures.jsonl'), tmpdir.join('input_clusters.jsonl')
+    _write_lines(signatures_path, signatures)
+    _write_lines(clusters_path, clusters)
+    return str(signatures_path), str(clusters_path), signatures, clusters
+
+
+def test_sample_signature_pairs_parallel_is_reproducible(tmpdir):
+    signatures_path, clusters_path, _, _ = _write_signatures_and_clusters(tmpdir)
+
+    def sample(seed, n_jobs=2):
+        return list(sample_signature_pairs_parallel(
+            signatures_path, clusters_path, 120, seed=seed, n_jobs=n_jobs, signature_rows=True))
+
+    pairs = sample(seed=1)
+
+    assert len(pairs) == 120
+    assert sample(seed=1) == pairs
+    assert sample(seed=1, n_jobs=1) == sample(seed=1, n_jobs=1)
+    assert sample(seed=2) != pairs
+
+
+def test_sample_signature_pairs_parallel_balances_the_pairs(tmpdir):
+    signatures_path, clusters_path, signatures, clusters = _write_signatures_and_clusters(tmpdir)
+    blocks = {signature['signature_uuid']: signature['signature_block'] for signature in signatures}
+    names = {signature['signature_uuid']: signature['author_name'] for signature in signatures}
+    cluster_ids = {signature_uuid: cluster['cluster_id']
+                   for cluster in clusters for signature_uuid in cluster['signature_uuids']}
+
+    pairs = list(sample_signature_pairs_parallel(signatures_path, clusters_path, 120, seed=1, n_jobs=2))
+
+    kinds = {}
+    for pair in pairs:
+        s1, s2 = pair['signature_uuids']
+        assert blocks[s1] == blocks[s2]
+        assert pair['same_cluster'] == (cluster_ids[s1] == cluster_ids[s2])
+        kind = (pair['same_cluster'], names[s1] == names[s2])
+        kinds[kind] = kinds.get(kind, 0) + 1
+    assert kinds == {(True, True): 30, (True, False): 30, (False, True): 30, (False, False): 30}
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+
+from inspire_disambiguation.core.ml.sparse import sparse_average_linkage
+
+
+def _same_partition(labels, other_labels):
+    _, codes = np.unique(labels, return_inverse=True)
+    _, other_codes = np.unique(other_labels, return_inverse=True)
+    pairs = set(zip(codes.tolist(), other_codes.tolist()))
+    return len(pairs) == len(set(codes.tolist())) == len(set(other_codes.tolist()))
+
+
+@pytest.mark.parametrize('given', [1.0, 0.3])
+def test_sparse_average_linkage_matches_scipy(given):
+    rng = np.random.RandomState(0)
+    n_samples = 40
+    i, j = np.triu_indices(n_samples, k=1)
+    distances = rng.uniform(0, 0.99, size=len(i))
+    # the pairs that are not given are at the maximum distance
+    kept = rng.uniform(size=len(i)) < given
+    matrix = np.ones((n_samples, n_samples))
+    matrix[i[kept], j[kept]] = matrix[j[kept], i[kept]] = distances[kept]
+    np.fill_diagonal(matrix, 0)
+
+    sparse = sparse_average_linkage(n_samples, i[kept], j[kept], distances[kept])
+    dense = linkage(squareform(matrix), method='average')
+
+    assert sparse.shape == dense.shape
+    assert np.allclose(np.sort(sparse[:, 2]), np.sort(dense[:, 2]))
+    for threshold in (0.2, 0.5, 0.8, 0.99):
+        assert _same_partition(
+            fcluster(sparse, threshold, criterion='distance'),
+            fcluster(dense, threshold, criterion='distance'))
+
+
+def test_sparse_average_linkage_merges_disconnected_clusters_at_the_maximum_distance():
+    result = sparse_average_linkage(4, np.array([0, 2]), np.array([1, 3]), np.array([0.1, 0.2]))
+
+    assert result.tolist() == [[0, 1, 0.1, 2], [2, 3, 0.2, 2], [4, 5, 1.0, 4]]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+from inspire_disambiguation.core.ml.tuning import Linkages, save_linkages
+
+
+def _save(path, thresholds=None):
+    # two blocks of three signatures, merged at distances 0.2 and then 0.6,
+    # and a block of a single signature
+    linkage = [[0, 1, 0.2, 2], [2, 3, 0.6, 3]]
+    save_linkages(
+        path,
+        ['SNATHj', 'SNATHk', 'SNATHl'],
+        [['a1', 'a2', 'a3'], ['b1', 'b2', 'b3'], ['c1']],
+        [linkage, linkage, None],
+        thresholds=thresholds,
+    )
+
+
+def test_cut_at_a_single_threshold(tmpdir):
+    path = str(tmpdir.join('linkages.npz'))
+    _save(path, thresholds=[0.1, 0.7, None])
+
+    labels = Linkages(path).cut(0.5)
+
+    assert list(labels) == [0, 0, 1, 2, 2, 3, 4]
+
+
+def test_cut_at_the_threshold_of_every_block(tmpdir):
+    path = str(tmpdir.join('linkages.npz'))
+    _save(path, thresholds=[0.1, 0.7, None])
+
+    labels = Linkages(path).cut()
+
+    assert list(labels) == [0, 1, 2, 3, 3, 3, 4]
+
+
+def test_cut_at_the_threshold_of_every_block_needs_the_thresholds(tmpdir):
+    path = str(tmpdir.join('linkages.npz'))
+    _save(path)
+
+    with pytest.raises(ValueError):
+        Linkages(path).cut()
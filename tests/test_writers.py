@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction
+
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import uuid
+
+import pytest
+from flask import Flask
+from inspire_dojson.utils import get_record_ref
+from invenio_db import InvenioDB, db
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+from invenio_records import InvenioRecords
+from invenio_records.api import Record
+
+from inspire_disambiguation.core.db.writers import write_author_assignments
+
+DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI', '')
+
+pytestmark = pytest.mark.skipif(
+    not DATABASE_URI.startswith('postgresql'),
+    reason='needs SQLALCHEMY_DATABASE_URI pointing to a PostgreSQL test database')
+
+
+@pytest.fixture
+def app():
+    app = Flask('inspire_disambiguation')
+    app.config.update(
+        DB_VERSIONING=True,
+        SQLALCHEMY_DATABASE_URI=DATABASE_URI,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+    )
+    InvenioDB(app)
+    InvenioRecords(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def _create_literature(publication_id, authors):
+    record = Record.create({'control_number': publication_id, 'authors': authors}, id_=uuid.uuid4())
+    PersistentIdentifier.create(
+        'lit', str(publication_id), object_type='rec', object_uuid=record.id, status=PIDStatus.REGISTERED)
+    db.session.commit()
+    return record.id
+
+
+def test_write_author_assignments_stores_a_revision_and_reindexes(app):
+    curated_record = get_record_ref(20, 'authors')
+    record_id = _create_literature(1, [
+        {'full_name': 'Smith, J.', 'uuid': 'uncurated'},
+        {'full_name': 'Smith, J.', 'uuid': 'curated', 'curated_relation': True, 'record': curated_record},
+        {'full_name': 'Doe, J.', 'uuid': 'other'},
+    ])
+    reindexed = []
+
+    counts = write_author_assignments(
+        [(1, 'uncurated', 10), (1, 'curated', 10)], reindex=reindexed.extend)
+
+    assert counts['records'] == 1
+    assert counts['signatures'] == 2
+    assert [str(reindexed_id) for reindexed_id in reindexed] == [str(record_id)]
+
+    db.session.expire_all()
+    record = Record.get_record(record_id)
+    assert record.revision_id == 1
+    assert [author.get('record') for author in record['authors']] == [
+        get_record_ref(10, 'authors'), curated_record, None]
+
+    revisions = list(record.revisions)
+    assert len(revisions) == 2
+    assert 'record' not in revisions[0]['authors'][0]
+    assert revisions[1]['authors'] == record['authors']
+
+
+def test_write_author_assignments_skips_unknown_publications(app):
+    reindexed = []
+
+    counts = write_author_assignments([(2, 'missing', 10)], reindex=reindexed.extend)
+
+    assert counts['records'] == 0
+    assert reindexed == []